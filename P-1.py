@@ -1,11 +1,40 @@
 import re
 import os
 import sys
+import shutil
 import platform
 import subprocess # <<< NUEVO: Para un ping más controlado
-from time import sleep
+import socket
+import select
+import struct
+import itertools
+from time import sleep, perf_counter, monotonic, time
 from datetime import datetime
+from concurrent.futures import ThreadPoolExecutor, as_completed, wait as futures_wait, FIRST_COMPLETED
+from collections import deque, OrderedDict, namedtuple
+import threading
+import heapq
+import random
 import json # <<< NUEVO: Para persistencia de datos
+import atexit
+import sqlite3
+import argparse
+import getpass
+import csv
+import unicodedata
+import ipaddress
+import fnmatch
+import difflib
+import bisect
+import functools
+import gzip
+import io
+import mmap
+from array import array
+try:
+    import readline # Autocompletado con Tab en los prompts de nombre; no existe en todas las plataformas
+except ImportError:
+    readline = None
 
 # 🌈 Paleta de colores y estilos
 class Color:
@@ -22,15 +51,31 @@ class Color:
 
 # ---------------- GLOBAL VARIABLES ----------------
 current_user = None
-menu_history = []
+menu_history = [] # Pila de pantallas abiertas (funciones que reciben el repositorio); la recorre main()
+MODO_CLI = False # True cuando el programa se ejecuta con subcomandos (sin menús interactivos)
+# Modo rápido: sin animaciones ni pausas artificiales (variable de entorno P1_MODO_RAPIDO=1 o argumento --rapido)
+MODO_RAPIDO = os.environ.get("P1_MODO_RAPIDO", "").strip().lower() in ("1", "true", "si", "sí", "s")
 NOMBRE_ARCHIVO_DATOS = "dispositivos_red.json" # <<< NUEVO: Nombre del archivo para guardar datos
 # ---------------------------------------------------
 
 # 🎨 Diseño de la interfaz
+def pausa(segundos):
+    """Pausa de la interfaz (para que se alcance a leer un mensaje). En MODO_RAPIDO no espera."""
+    if not MODO_RAPIDO:
+        sleep(segundos)
+
 def limpiar_pantalla():
-    os.system('cls' if os.name == 'nt' else 'clear')
+    if MODO_RAPIDO: # Secuencias ANSI: sin lanzar un proceso 'clear'/'cls' en cada título
+        print("\033[H\033[2J\033[3J", end="", flush=True)
+    else:
+        os.system('cls' if os.name == 'nt' else 'clear')
 
 def mostrar_barra_progreso(duracion_segundos, mensaje="Cargando...", prefijo="", sufijo="Completado"):
+    if MODO_RAPIDO: # La barra se dibuja completa de inmediato
+        print(f"{Color.BLUE}{prefijo}{mensaje}{Color.END}")
+        print(f"{Color.GREEN}[{'█' * 20}] 100%{Color.END}")
+        print(f"{Color.GREEN}{sufijo}{Color.END}\n")
+        return
     total_pasos = 20
     tiempo_por_paso = duracion_segundos / total_pasos if total_pasos > 0 and duracion_segundos > 0 else 0
 
@@ -40,14 +85,14 @@ def mostrar_barra_progreso(duracion_segundos, mensaje="Cargando...", prefijo="",
         barra = '█' * i + ' ' * (total_pasos - i)
         print(f"\r{Color.GREEN}[{barra}] {porcentaje}%{Color.END}", end="", flush=True)
         if tiempo_por_paso > 0:
-            sleep(tiempo_por_paso)
+            pausa(tiempo_por_paso)
     print(f"\n{Color.GREEN}{sufijo}{Color.END}\n")
     if duracion_segundos == 0 and tiempo_por_paso == 0:
         porcentaje = 100
         barra = '█' * total_pasos
         print(f"\r{Color.GREEN}[{barra}] {porcentaje}%{Color.END}", end="", flush=True)
         print(f"\n{Color.GREEN}{sufijo}{Color.END}\n")
-    sleep(0.5)
+    pausa(0.5)
 
 
 def mostrar_titulo(titulo, con_usuario=True):
@@ -66,34 +111,804 @@ def mostrar_mensaje(mensaje, tipo="info", esperar_enter=False):
     elif tipo == "exito": icono = "✅ "; color = Color.GREEN
     elif tipo == "advertencia": icono = "⚠️ "; color = Color.YELLOW
     elif tipo == "info": icono = "ℹ️ "
+    if MODO_CLI: # En modo batch los mensajes van a stderr, sin colores ni pausas, para no ensuciar el JSON de stdout
+        print(f"{icono}{mensaje}", file=sys.stderr)
+        return
     print(f"{color}{Color.BOLD}{icono}{mensaje}{Color.END}\n")
     if esperar_enter:
         input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
 
 # ---------------- PERSISTENCIA DE DATOS (JSON) ----------------
-def cargar_dispositivos_desde_archivo():
-    """Carga la lista de dispositivos desde un archivo JSON."""
-    try:
-        if os.path.exists(NOMBRE_ARCHIVO_DATOS):
-            with open(NOMBRE_ARCHIVO_DATOS, 'r', encoding='utf-8') as f:
+# Modos de almacenamiento:
+#   'json'   -> cada guardado reescribe el archivo completo (comportamiento original).
+#   'diario' -> cada guardado solo agrega los cambios pendientes (alta/cambio/baja) al diario; el archivo
+#               completo (instantánea) se reescribe al compactar, cada COMPACTAR_CADA_N_REGISTROS o al salir.
+#   'sqlite' -> base de datos SQLite (NOMBRE_BASE_DATOS) con índices y tablas hijas para servicios y VLANs;
+#               la primera vez se migra automáticamente desde el archivo JSON.
+#   'ndjson' -> instantánea con un dispositivo por línea más un índice de desplazamientos, leída con mmap y
+#               decodificada a demanda (ver ALMACENAMIENTO NDJSON); los cambios van a su propio diario.
+MODO_ALMACENAMIENTO = os.environ.get("P1_ALMACENAMIENTO", "json")
+NOMBRE_BASE_DATOS = "dispositivos_red.db"
+NOMBRE_ARCHIVO_DIARIO = "dispositivos_red.diario.jsonl"
+NOMBRE_ARCHIVO_NDJSON = "dispositivos_red.ndjson"
+NOMBRE_INDICE_NDJSON = "dispositivos_red.ndjson.idx"
+NOMBRE_DIARIO_NDJSON = "dispositivos_red.ndjson.diario.jsonl"
+COMPACTAR_CADA_N_REGISTROS = 500
+COPIAS_SEGURIDAD = 3 # Versiones anteriores de la instantánea conservadas como .bak1 ... .bakN
+_registros_en_diario = 0 # Registros escritos en el diario desde la última compactación
+
+def _leer_diario(ruta):
+    """Registros (operación, clave, dispositivo) válidos del diario y cantidad de líneas dañadas descartadas."""
+    registros = []
+    descartados = 0
+    with open(ruta, 'r', encoding='utf-8') as f:
+        for linea in f:
+            if not linea.strip():
+                continue
+            try:
+                registro = json.loads(linea)
+                registros.append((registro["op"], registro["clave"], registro.get("dispositivo") or {}))
+            except (json.JSONDecodeError, KeyError, TypeError):
+                descartados += 1 # Línea incompleta (p. ej. el programa se cerró a mitad de una escritura)
+    return registros, descartados
+
+def _informar_diario(ruta, aplicados, descartados):
+    global _registros_en_diario
+    _registros_en_diario = aplicados
+    if descartados:
+        mostrar_mensaje(f"Se descartaron {descartados} registros dañados del diario '{ruta}'.", "advertencia")
+    if aplicados:
+        mostrar_mensaje(f"Se aplicaron {aplicados} cambios del diario '{ruta}'.", "info")
+
+def _reproducir_diario(dispositivos, ruta):
+    """Aplica sobre la instantánea los registros del diario (claves = nombre en minúsculas)."""
+    por_clave = {d.get("NOMBRE", "").lower(): d for d in dispositivos}
+    registros, descartados = _leer_diario(ruta)
+    aplicados = 0
+    for operacion, clave, dispositivo in registros:
+        if operacion == "delete":
+            por_clave.pop(clave, None)
+        elif operacion in ("add", "update"):
+            clave_nueva = dispositivo.get("NOMBRE", "").lower()
+            if clave_nueva != clave and clave in por_clave: # Renombrado: conservar la posición en la lista
+                por_clave = {(clave_nueva if k == clave else k): (dispositivo if k == clave else v) for k, v in por_clave.items()}
+            else:
+                por_clave[clave_nueva] = dispositivo
+        aplicados += 1
+    _informar_diario(ruta, aplicados, descartados)
+    return list(por_clave.values())
+
+def _ruta_diario():
+    """Diario del modo actual: el modo 'ndjson' usa uno propio para no mezclarse con la instantánea JSON."""
+    return NOMBRE_DIARIO_NDJSON if MODO_ALMACENAMIENTO == "ndjson" else NOMBRE_ARCHIVO_DIARIO
+
+def _rutas_copias_seguridad(ruta, copias=None):
+    """Rutas de las copias de seguridad de 'ruta', de la más reciente (.bak1) a la más antigua."""
+    copias = COPIAS_SEGURIDAD if copias is None else copias
+    return [f"{ruta}.bak{n}" for n in range(1, copias + 1)]
+
+def escribir_archivo_atomico(ruta, escribir, copias=0, binario=False):
+    """Escribe un archivo sin riesgo de dejarlo truncado si el programa muere a mitad de la escritura.
+
+    'escribir' recibe el archivo temporal abierto en texto (o en binario, con binario=True). El temporal se sincroniza a disco (fsync) y
+    luego reemplaza a 'ruta' con un rename atómico. Con copias > 0, la versión anterior se conserva como
+    ruta.bak1 y las copias previas rotan hasta ruta.bak<copias>.
+    """
+    ruta_temporal = f"{ruta}.tmp"
+    with (open(ruta_temporal, 'wb') if binario else open(ruta_temporal, 'w', encoding='utf-8')) as f:
+        escribir(f)
+        f.flush()
+        os.fsync(f.fileno())
+
+    if copias > 0 and os.path.exists(ruta):
+        rutas_copias = _rutas_copias_seguridad(ruta, copias)
+        for origen, destino in reversed(list(zip(rutas_copias, rutas_copias[1:]))):
+            if os.path.exists(origen):
+                os.replace(origen, destino)
+        try:
+            if os.path.exists(rutas_copias[0]):
+                os.remove(rutas_copias[0])
+            os.link(ruta, rutas_copias[0]) # Enlace duro: el archivo principal nunca deja de existir
+        except OSError:
+            shutil.copy2(ruta, rutas_copias[0])
+
+    os.replace(ruta_temporal, ruta)
+    if hasattr(os, "O_DIRECTORY"): # Sincronizar el directorio para que el rename sobreviva a un corte de luz
+        fd_directorio = os.open(os.path.dirname(os.path.abspath(ruta)), os.O_RDONLY | os.O_DIRECTORY)
+        try:
+            os.fsync(fd_directorio)
+        finally:
+            os.close(fd_directorio)
+
+def _leer_instantanea_json():
+    """Lee la instantánea JSON; si está dañada o falta, recurre a la copia de seguridad válida más reciente."""
+    candidatos = [NOMBRE_ARCHIVO_DATOS] + _rutas_copias_seguridad(NOMBRE_ARCHIVO_DATOS)
+    for ruta in candidatos:
+        if not os.path.exists(ruta):
+            continue
+        try:
+            with open(ruta, 'r', encoding='utf-8') as f:
                 dispositivos = json.load(f)
-                mostrar_mensaje(f"Datos cargados desde '{NOMBRE_ARCHIVO_DATOS}'.", "info")
-                return dispositivos
+            if not isinstance(dispositivos, list):
+                raise ValueError("el contenido no es una lista de dispositivos")
+        except (json.JSONDecodeError, ValueError, IOError) as e:
+            mostrar_mensaje(f"Error al cargar datos desde '{ruta}': {e}.", "error")
+            continue
+        if ruta == NOMBRE_ARCHIVO_DATOS:
+            mostrar_mensaje(f"Datos cargados desde '{NOMBRE_ARCHIVO_DATOS}'.", "info")
         else:
-            mostrar_mensaje(f"Archivo '{NOMBRE_ARCHIVO_DATOS}' no encontrado. Se iniciará con una lista vacía.", "advertencia")
-            return []
-    except (json.JSONDecodeError, IOError) as e:
-        mostrar_mensaje(f"Error al cargar datos desde '{NOMBRE_ARCHIVO_DATOS}': {e}. Se iniciará con una lista vacía.", "error")
-        return []
+            mostrar_mensaje(f"Se recuperaron los datos desde la copia de seguridad '{ruta}'.", "advertencia")
+        return dispositivos
+    if any(os.path.exists(ruta) for ruta in candidatos):
+        mostrar_mensaje("No se encontró ninguna copia válida de los datos. Se iniciará con una lista vacía.", "error")
+    else:
+        mostrar_mensaje(f"Archivo '{NOMBRE_ARCHIVO_DATOS}' no encontrado. Se iniciará con una lista vacía.", "advertencia")
+    return []
+
+def _cargar_dispositivos_json():
+    """Carga la lista de dispositivos desde un archivo JSON y le aplica el diario de cambios, si existe."""
+    dispositivos = _leer_instantanea_json()
+    try:
+        if os.path.exists(NOMBRE_ARCHIVO_DIARIO):
+            dispositivos = _reproducir_diario(dispositivos, NOMBRE_ARCHIVO_DIARIO)
+    except IOError as e:
+        mostrar_mensaje(f"Error al leer el diario '{NOMBRE_ARCHIVO_DIARIO}': {e}", "error")
+    return dispositivos
+
+def cargar_dispositivos_desde_archivo():
+    """Carga los dispositivos desde el almacenamiento configurado en MODO_ALMACENAMIENTO."""
+    if MODO_ALMACENAMIENTO == "sqlite":
+        return _cargar_dispositivos_sqlite()
+    return _cargar_dispositivos_json()
+
+def _escribir_instantanea(dispositivos_lista):
+    if MODO_ALMACENAMIENTO == "ndjson":
+        if isinstance(dispositivos_lista, RepositorioDiferido):
+            dispositivos_lista.soltar_archivo() # Se decodifica lo que falte y se cierra el mmap antes de reemplazar el archivo
+        escribir_inventario_ndjson(dispositivos_lista)
+        return
+    escribir_archivo_atomico(NOMBRE_ARCHIVO_DATOS,
+                             lambda f: escribir_json_dispositivos(f, dispositivos_lista),
+                             copias=COPIAS_SEGURIDAD)
+
+def compactar_almacenamiento(dispositivos_lista):
+    """Reescribe la instantánea completa y vacía el diario de cambios."""
+    global _registros_en_diario
+    try:
+        _escribir_instantanea(dispositivos_lista)
+        if os.path.exists(_ruta_diario()):
+            os.remove(_ruta_diario())
+        _registros_en_diario = 0
+        if hasattr(dispositivos_lista, "cambios_pendientes"):
+            dispositivos_lista.cambios_pendientes.clear()
+    except (IOError, OSError) as e:
+        if MODO_CLI: # En modo batch el error llega a main_cli, que responde "ok": false y termina con código 1
+            raise
+        mostrar_mensaje(f"Error al compactar datos en '{NOMBRE_ARCHIVO_DATOS}': {e}", "error", esperar_enter=True)
+
+def compactar_al_salir(dispositivos_lista):
+    """Compacta solo si el diario tiene cambios; pensado para registrarse con atexit."""
+    if _registros_en_diario or getattr(dispositivos_lista, "cambios_pendientes", None):
+        try:
+            compactar_almacenamiento(dispositivos_lista)
+        except OSError as e: # Solo en modo batch; los cambios siguen en el diario y se compactan la próxima vez
+            mostrar_mensaje(f"No se pudo compactar el diario '{_ruta_diario()}' al salir: {e}", "advertencia")
+
+def _agregar_cambios_al_diario(dispositivos_lista):
+    """Escribe al final del diario los cambios pendientes del repositorio (una línea JSON por cambio)."""
+    global _registros_en_diario
+    pendientes = dispositivos_lista.cambios_pendientes
+    if not pendientes:
+        return
+    lineas = []
+    for operacion, clave, disp in pendientes:
+        registro = {"op": operacion, "clave": clave}
+        if operacion != "delete":
+            registro["dispositivo"] = disp
+        lineas.append(json.dumps(registro, ensure_ascii=False, default=serializar_dispositivo) + "\n")
+    with open(_ruta_diario(), 'a', encoding='utf-8') as f:
+        f.writelines(lineas)
+        f.flush()
+        os.fsync(f.fileno())
+    _registros_en_diario += len(lineas)
+    pendientes.clear()
+    if _registros_en_diario >= COMPACTAR_CADA_N_REGISTROS:
+        try:
+            compactar_almacenamiento(dispositivos_lista)
+        except OSError as e: # Los cambios ya quedaron en el diario: guardarlos no falló
+            mostrar_mensaje(f"No se pudo compactar el diario '{_ruta_diario()}': {e}", "advertencia")
 
 def guardar_dispositivos_en_archivo(dispositivos_lista):
-    """Guarda la lista de dispositivos en un archivo JSON."""
+    """Guarda los dispositivos según MODO_ALMACENAMIENTO (archivo JSON completo o diario de cambios)."""
     try:
-        with open(NOMBRE_ARCHIVO_DATOS, 'w', encoding='utf-8') as f:
-            json.dump(dispositivos_lista, f, indent=4, ensure_ascii=False)
+        if MODO_ALMACENAMIENTO == "sqlite":
+            _guardar_dispositivos_sqlite(dispositivos_lista)
+        elif MODO_ALMACENAMIENTO in ("diario", "ndjson") and hasattr(dispositivos_lista, "cambios_pendientes"):
+            _agregar_cambios_al_diario(dispositivos_lista)
+        else:
+            compactar_almacenamiento(dispositivos_lista)
         # No mostrar mensaje de guardado exitoso aquí para no saturar, se maneja en cada función que guarda.
-    except IOError as e:
-        mostrar_mensaje(f"Error al guardar datos en '{NOMBRE_ARCHIVO_DATOS}': {e}", "error", esperar_enter=True)
+    except (IOError, sqlite3.Error) as e:
+        mensaje = f"Error al guardar datos en '{NOMBRE_BASE_DATOS if MODO_ALMACENAMIENTO == 'sqlite' else _ruta_diario() if MODO_ALMACENAMIENTO in ('diario', 'ndjson') else NOMBRE_ARCHIVO_DATOS}': {e}"
+        if MODO_CLI: # main_cli lo convierte en "ok": false y código de salida 1
+            raise OSError(mensaje) from e
+        mostrar_mensaje(mensaje, "error", esperar_enter=True)
+
+# ---------------- ALMACENAMIENTO SQLITE ----------------
+class AlmacenSQLite:
+    """Inventario en SQLite: una fila por dispositivo y tablas hijas para servicios y VLANs."""
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS dispositivos (
+            id INTEGER PRIMARY KEY AUTOINCREMENT,
+            nombre TEXT NOT NULL,
+            nombre_lower TEXT NOT NULL UNIQUE,
+            ip TEXT NOT NULL DEFAULT 'N/A',
+            tipo TEXT NOT NULL DEFAULT 'N/A',
+            ubicacion TEXT NOT NULL DEFAULT 'N/A'
+        );
+        CREATE INDEX IF NOT EXISTS idx_dispositivos_ip ON dispositivos(ip);
+        CREATE INDEX IF NOT EXISTS idx_dispositivos_tipo ON dispositivos(tipo);
+        CREATE INDEX IF NOT EXISTS idx_dispositivos_ubicacion ON dispositivos(ubicacion);
+        CREATE TABLE IF NOT EXISTS servicios (
+            dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+            orden INTEGER NOT NULL,
+            servicio TEXT NOT NULL,
+            PRIMARY KEY (dispositivo_id, orden)
+        );
+        CREATE INDEX IF NOT EXISTS idx_servicios_servicio ON servicios(servicio);
+        CREATE TABLE IF NOT EXISTS vlans (
+            dispositivo_id INTEGER NOT NULL REFERENCES dispositivos(id) ON DELETE CASCADE,
+            orden INTEGER NOT NULL,
+            vlan INTEGER NOT NULL,
+            PRIMARY KEY (dispositivo_id, orden)
+        );
+        CREATE INDEX IF NOT EXISTS idx_vlans_vlan ON vlans(vlan);
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or NOMBRE_BASE_DATOS
+        self.conexion = sqlite3.connect(self.ruta)
+        self.conexion.execute("PRAGMA foreign_keys = ON")
+        self.conexion.execute("PRAGMA journal_mode = WAL")
+        self.conexion.executescript(self.ESQUEMA)
+
+    def cerrar(self):
+        self.conexion.close()
+
+    def contar(self):
+        return self.conexion.execute("SELECT COUNT(*) FROM dispositivos").fetchone()[0]
+
+    # --- Lectura ---
+    def cargar_todos(self):
+        """Devuelve todos los dispositivos (en orden de alta) como diccionarios del formato JSON."""
+        por_id = {}
+        for id_disp, nombre, ip, tipo, ubicacion in self.conexion.execute(
+                "SELECT id, nombre, ip, tipo, ubicacion FROM dispositivos ORDER BY id"):
+            por_id[id_disp] = {"TIPO": tipo, "NOMBRE": nombre, "IP": ip, "UBICACION": ubicacion, "SERVICIOS": [], "VLANS": []}
+        for id_disp, servicio in self.conexion.execute("SELECT dispositivo_id, servicio FROM servicios ORDER BY dispositivo_id, orden"):
+            por_id[id_disp]["SERVICIOS"].append(servicio)
+        for id_disp, vlan in self.conexion.execute("SELECT dispositivo_id, vlan FROM vlans ORDER BY dispositivo_id, orden"):
+            por_id[id_disp]["VLANS"].append(vlan)
+        return list(por_id.values())
+
+    # --- Escritura ---
+    def _buscar_id(self, nombre_lower):
+        return self.conexion.execute("SELECT id FROM dispositivos WHERE nombre_lower = ?", (nombre_lower,)).fetchone()
+
+    def _insertar(self, disp):
+        cursor = self.conexion.execute(
+            "INSERT INTO dispositivos (nombre, nombre_lower, ip, tipo, ubicacion) VALUES (?, ?, ?, ?, ?)",
+            (disp.get("NOMBRE", ""), disp.get("NOMBRE", "").lower(), disp.get("IP", "N/A"), disp.get("TIPO", "N/A"), disp.get("UBICACION", "N/A")))
+        self._escribir_hijos(cursor.lastrowid, disp)
+
+    def _escribir_hijos(self, id_disp, disp):
+        self.conexion.executemany("INSERT INTO servicios (dispositivo_id, orden, servicio) VALUES (?, ?, ?)",
+                                  [(id_disp, i, s) for i, s in enumerate(disp.get("SERVICIOS", []))])
+        self.conexion.executemany("INSERT INTO vlans (dispositivo_id, orden, vlan) VALUES (?, ?, ?)",
+                                  [(id_disp, i, v) for i, v in enumerate(disp.get("VLANS", []))])
+
+    def aplicar_cambios(self, cambios):
+        """Aplica en una sola transacción una lista de (operación, nombre en minúsculas previo, dispositivo)."""
+        with self.conexion:
+            for operacion, clave, disp in cambios:
+                if operacion == "delete":
+                    self.conexion.execute("DELETE FROM dispositivos WHERE nombre_lower = ?", (clave,))
+                    continue
+                # Los datos se leen del dispositivo al guardar, así que una alta seguida de un renombrado
+                # en el mismo lote ya se insertó con el nombre nuevo: se busca también por ese nombre.
+                fila = (self._buscar_id(clave) if operacion == "update" else None) or self._buscar_id(disp.get("NOMBRE", "").lower())
+                if not fila:
+                    self._insertar(disp)
+                else:
+                    self.conexion.execute(
+                        "UPDATE dispositivos SET nombre = ?, nombre_lower = ?, ip = ?, tipo = ?, ubicacion = ? WHERE id = ?",
+                        (disp.get("NOMBRE", ""), disp.get("NOMBRE", "").lower(), disp.get("IP", "N/A"), disp.get("TIPO", "N/A"), disp.get("UBICACION", "N/A"), fila[0]))
+                    self.conexion.execute("DELETE FROM servicios WHERE dispositivo_id = ?", (fila[0],))
+                    self.conexion.execute("DELETE FROM vlans WHERE dispositivo_id = ?", (fila[0],))
+                    self._escribir_hijos(fila[0], disp)
+
+    def reemplazar_todo(self, dispositivos):
+        """Sustituye el contenido de la base por la lista dada. Devuelve los nombres omitidos por estar repetidos."""
+        omitidos = []
+        vistos = set()
+        with self.conexion:
+            self.conexion.execute("DELETE FROM dispositivos")
+            for disp in dispositivos:
+                clave = disp.get("NOMBRE", "").lower()
+                if clave in vistos:
+                    omitidos.append(disp.get("NOMBRE", ""))
+                    continue
+                vistos.add(clave)
+                self._insertar(disp)
+        return omitidos
+
+    # --- Consultas indexadas ---
+    def buscar_nombres(self, texto):
+        """Nombres (en minúsculas) que contienen 'texto', en orden de alta."""
+        patron = "%" + texto.lower().replace("\\", "\\\\").replace("%", "\\%").replace("_", "\\_") + "%"
+        return [fila[0] for fila in self.conexion.execute(
+            "SELECT nombre_lower FROM dispositivos WHERE nombre_lower LIKE ? ESCAPE '\\' ORDER BY id", (patron,))]
+
+    def estadisticas(self):
+        """Conteos para el reporte estadístico, calculados con GROUP BY sobre columnas indexadas."""
+        consulta = self.conexion.execute
+        return {
+            "TOTAL": self.contar(),
+            "TIPOS": dict(consulta("SELECT tipo, COUNT(*) FROM dispositivos GROUP BY tipo")),
+            "UBICACIONES": dict(consulta("SELECT ubicacion, COUNT(*) FROM dispositivos WHERE ubicacion != 'N/A' GROUP BY ubicacion")),
+            "SERVICIOS": dict(consulta("SELECT servicio, COUNT(*) FROM servicios GROUP BY servicio")),
+            "VLANS": dict(consulta("SELECT vlan, COUNT(*) FROM vlans GROUP BY vlan")),
+            "DISPOSITIVOS_CON_VLANS": consulta("SELECT COUNT(DISTINCT dispositivo_id) FROM vlans").fetchone()[0],
+            "TOTAL_VLANS_CONFIGURADAS": consulta("SELECT COUNT(*) FROM vlans").fetchone()[0]
+        }
+
+    def iterar_para_exportar(self):
+        """Recorre los dispositivos fila a fila (sin cargarlos todos en memoria) con servicios y VLANs ya unidos."""
+        cursor = self.conexion.execute("""
+            SELECT d.nombre, d.ip, d.tipo, d.ubicacion,
+                   (SELECT group_concat(servicio, ', ') FROM (SELECT servicio FROM servicios WHERE dispositivo_id = d.id ORDER BY orden)),
+                   (SELECT group_concat(vlan, ', ') FROM (SELECT vlan FROM vlans WHERE dispositivo_id = d.id ORDER BY orden))
+            FROM dispositivos d ORDER BY d.id""")
+        for nombre, ip, tipo, ubicacion, servicios_str, vlans_str in cursor:
+            yield {
+                "TIPO": tipo, "NOMBRE": nombre, "IP": ip, "UBICACION": ubicacion,
+                "SERVICIOS": servicios_str.split(", ") if servicios_str else [],
+                "VLANS": [int(v) for v in vlans_str.split(", ")] if vlans_str else []
+            }
+
+_almacen_sqlite = None
+
+def obtener_almacen_sqlite():
+    """Devuelve la conexión compartida a la base SQLite, creándola (y su esquema) la primera vez."""
+    global _almacen_sqlite
+    if _almacen_sqlite is None:
+        _almacen_sqlite = AlmacenSQLite()
+    return _almacen_sqlite
+
+def migrar_json_a_sqlite():
+    """Copia el inventario JSON (instantánea + diario) a la base SQLite. Devuelve la cantidad migrada."""
+    dispositivos = _cargar_dispositivos_json()
+    omitidos = obtener_almacen_sqlite().reemplazar_todo(dispositivos)
+    if omitidos:
+        mostrar_mensaje(f"Se omitieron {len(omitidos)} dispositivos con nombre repetido: {', '.join(omitidos[:10])}", "advertencia")
+    return len(dispositivos) - len(omitidos)
+
+def _cargar_dispositivos_sqlite():
+    try:
+        almacen = obtener_almacen_sqlite()
+        if almacen.contar() == 0 and (os.path.exists(NOMBRE_ARCHIVO_DATOS) or os.path.exists(NOMBRE_ARCHIVO_DIARIO)):
+            migrados = migrar_json_a_sqlite()
+            mostrar_mensaje(f"Se migraron {migrados} dispositivos de '{NOMBRE_ARCHIVO_DATOS}' a '{almacen.ruta}'.", "exito")
+        dispositivos = almacen.cargar_todos()
+        mostrar_mensaje(f"Datos cargados desde '{almacen.ruta}'.", "info")
+        return dispositivos
+    except sqlite3.Error as e:
+        mostrar_mensaje(f"Error al cargar datos desde '{NOMBRE_BASE_DATOS}': {e}. Se iniciará con una lista vacía.", "error")
+        return []
+
+def _guardar_dispositivos_sqlite(dispositivos_lista):
+    almacen = obtener_almacen_sqlite()
+    if hasattr(dispositivos_lista, "cambios_pendientes"):
+        almacen.aplicar_cambios(dispositivos_lista.cambios_pendientes)
+        dispositivos_lista.cambios_pendientes.clear()
+    else:
+        almacen.reemplazar_todo(dispositivos_lista)
+
+# ---------------- ALMACENAMIENTO NDJSON (CARGA PEREZOSA) ----------------
+# La instantánea tiene un dispositivo por línea (JSON compacto). El índice, en un archivo aparte, guarda:
+#   cabecera _CABECERA_INDICE_NDJSON: marca, tamaño y fecha de modificación del archivo de datos, cantidad de
+#            registros y largo del bloque de claves;
+#   desplazamientos: array('Q') con el byte donde empieza cada línea;
+#   claves: JSON {"NOMBRES": [...], "IPS": [...]} con el nombre y la IP (como entero) de cada registro, para
+#           buscar y validar unicidad sin decodificar los registros.
+# El archivo de datos se abre con mmap y cada registro se decodifica recién cuando se lista, se busca o se edita.
+# Si el índice no coincide con el archivo (p. ej. el programa se cerró entre las dos escrituras) se reconstruye.
+_MARCA_INDICE_NDJSON = b"P1IDX001"
+_CABECERA_INDICE_NDJSON = struct.Struct("<8sQQQQ")
+_PATRONES_CAMPO_NDJSON = {campo: re.compile(rb'"' + campo.encode() + rb'": "((?:[^"\\]|\\.)*)"') for campo in ("NOMBRE", "IP")}
+
+def _ip_entera_o_none(ip):
+    return ip_a_entero(ip) if isinstance(ip, str) and ip != "N/A" else None
+
+def escribir_inventario_ndjson(dispositivos, ruta=NOMBRE_ARCHIVO_NDJSON, ruta_indice=NOMBRE_INDICE_NDJSON):
+    """Escribe la instantánea NDJSON y, después, su índice (ambos de forma atómica)."""
+    desplazamientos, nombres, ips = array('Q'), [], []
+    def escribir(f):
+        posicion, bloque = 0, []
+        for disp in dispositivos:
+            linea = (json.dumps(disp, ensure_ascii=False, default=serializar_dispositivo) + "\n").encode('utf-8')
+            desplazamientos.append(posicion)
+            nombres.append(disp.get("NOMBRE", ""))
+            ips.append(_ip_entera_o_none(disp.get("IP")))
+            posicion += len(linea)
+            bloque.append(linea)
+            if len(bloque) == 4096:
+                f.write(b"".join(bloque)); bloque.clear()
+        f.write(b"".join(bloque))
+    escribir_archivo_atomico(ruta, escribir, copias=COPIAS_SEGURIDAD, binario=True)
+    _escribir_indice_ndjson(ruta, ruta_indice, desplazamientos, nombres, ips)
+
+def _escribir_indice_ndjson(ruta, ruta_indice, desplazamientos, nombres, ips):
+    estado = os.stat(ruta)
+    datos = array('Q', desplazamientos)
+    if sys.byteorder == "big": # El índice se guarda siempre en little-endian
+        datos.byteswap()
+    claves = json.dumps({"NOMBRES": nombres, "IPS": ips}, ensure_ascii=False).encode('utf-8')
+    cabecera = _CABECERA_INDICE_NDJSON.pack(_MARCA_INDICE_NDJSON, estado.st_size, estado.st_mtime_ns, len(datos), len(claves))
+    escribir_archivo_atomico(ruta_indice, lambda f: f.write(cabecera + datos.tobytes() + claves), binario=True)
+
+class InventarioNDJSON:
+    """Acceso de solo lectura a la instantánea NDJSON: registro(n) decodifica solo la línea n."""
+    def __init__(self, ruta=NOMBRE_ARCHIVO_NDJSON, ruta_indice=NOMBRE_INDICE_NDJSON):
+        self.ruta, self.ruta_indice = ruta, ruta_indice
+        self._archivo = self._mapa = None
+        self._claves_crudas = None # Bloque de claves del índice, sin decodificar hasta que se use
+        self._claves = None # (nombres, IPs como entero) de cada registro
+        if os.path.exists(ruta):
+            self._archivo = open(ruta, 'rb')
+            if os.fstat(self._archivo.fileno()).st_size:
+                self._mapa = mmap.mmap(self._archivo.fileno(), 0, access=mmap.ACCESS_READ)
+        self.desplazamientos = self._leer_indice()
+        if self.desplazamientos is None:
+            self.desplazamientos = self._reconstruir_indice()
+
+    def __len__(self):
+        return len(self.desplazamientos)
+
+    def _leer_indice(self):
+        """Desplazamientos del archivo de índice, o None si falta o no corresponde al archivo de datos actual."""
+        if self._archivo is None:
+            self._claves = ([], [])
+            return array('Q')
+        try:
+            with open(self.ruta_indice, 'rb') as f:
+                contenido = f.read()
+            marca, tamano, modificado, cantidad, largo_claves = _CABECERA_INDICE_NDJSON.unpack_from(contenido)
+        except (OSError, struct.error):
+            return None
+        estado = os.fstat(self._archivo.fileno())
+        inicio_claves = _CABECERA_INDICE_NDJSON.size + 8 * cantidad
+        if (marca != _MARCA_INDICE_NDJSON or tamano != estado.st_size or modificado != estado.st_mtime_ns
+                or len(contenido) != inicio_claves + largo_claves):
+            return None
+        desplazamientos = array('Q')
+        desplazamientos.frombytes(contenido[_CABECERA_INDICE_NDJSON.size:inicio_claves])
+        if sys.byteorder == "big":
+            desplazamientos.byteswap()
+        self._claves_crudas = contenido[inicio_claves:]
+        return desplazamientos
+
+    def _reconstruir_indice(self):
+        desplazamientos = array('Q')
+        inicio, fin = 0, len(self._mapa) if self._mapa is not None else 0
+        while inicio < fin:
+            salto = self._mapa.find(b"\n", inicio)
+            if salto == -1:
+                salto = fin
+            if self._mapa[inicio:salto].strip(): # Las líneas en blanco no son registros
+                desplazamientos.append(inicio)
+            inicio = salto + 1
+        self.desplazamientos = desplazamientos
+        self._claves = self._extraer_claves()
+        mostrar_mensaje(f"Se reconstruyó el índice '{self.ruta_indice}' ({len(desplazamientos)} registros).", "advertencia")
+        try:
+            _escribir_indice_ndjson(self.ruta, self.ruta_indice, desplazamientos, *self._claves)
+        except OSError:
+            pass # Sin permiso de escritura: se vuelve a reconstruir en el próximo inicio
+        return desplazamientos
+
+    def _extraer_claves(self):
+        """Nombres e IPs leídos del mmap con una expresión regular, sin decodificar los registros.
+
+        La primera coincidencia de '"CAMPO": "..."' en cada línea es la del propio campo, porque las líneas se
+        escriben con el orden de claves de como_dict() (las claves extra van al final).
+        """
+        resultado = []
+        for campo in ("NOMBRE", "IP"):
+            valores = [None] * len(self.desplazamientos)
+            anterior = -1
+            for coincidencia in _PATRONES_CAMPO_NDJSON[campo].finditer(self._mapa if self._mapa is not None else b""):
+                numero = bisect.bisect_right(self.desplazamientos, coincidencia.start()) - 1
+                if numero != anterior and numero >= 0:
+                    texto = coincidencia.group(1)
+                    valores[numero] = json.loads(b'"' + texto + b'"') if b"\\" in texto else texto.decode('utf-8')
+                    anterior = numero
+            resultado.append(valores)
+        nombres, ips = resultado
+        return [nombre or "" for nombre in nombres], [_ip_entera_o_none(ip) for ip in ips]
+
+    def claves(self):
+        """(nombres, IPs como entero o None) de cada registro, en orden."""
+        if self._claves is None:
+            datos = json.loads(self._claves_crudas)
+            self._claves = (datos["NOMBRES"], datos["IPS"])
+            self._claves_crudas = None
+        return self._claves
+
+    def registro(self, numero):
+        """Decodifica el registro 'numero' (un diccionario con las claves del JSON)."""
+        inicio = self.desplazamientos[numero]
+        fin = self._mapa.find(b"\n", inicio)
+        try:
+            return json.loads(self._mapa[inicio:fin if fin != -1 else len(self._mapa)])
+        except (json.JSONDecodeError, UnicodeDecodeError) as e:
+            raise ValueError(f"El registro {numero + 1} de '{self.ruta}' está dañado: {e}") from None
+
+    def cerrar(self):
+        if self._mapa is not None:
+            self._mapa.close()
+        if self._archivo is not None:
+            self._archivo.close()
+        self._archivo = self._mapa = None
+
+def _perezoso(metodo):
+    """Usa la versión perezosa del método mientras no se haya materializado el repositorio completo."""
+    def envoltura(self, *args, **kwargs):
+        if self._completo is not None:
+            return getattr(self._completo, metodo.__name__)(*args, **kwargs)
+        return metodo(self, *args, **kwargs)
+    envoltura.__name__, envoltura.__doc__ = metodo.__name__, metodo.__doc__
+    return envoltura
+
+class RepositorioDiferido:
+    """Repositorio del modo 'ndjson': arranca sin decodificar el inventario.
+
+    Listar (len y acceso por posición), buscar por nombre o IP y agregar, modificar o eliminar decodifican solo
+    los registros que tocan; los nombres e IPs para validar salen del índice, sin decodificar registros. Cualquier otra
+    operación (estadísticas, consultas, filtros por índice, subredes, monitor...) materializa una sola vez el
+    RepositorioDispositivos completo y desde entonces todo se le delega.
+    """
+    def __init__(self, inventario):
+        self._inventario = inventario
+        self._entradas = list(range(len(inventario))) # Número de registro en el archivo, o el Dispositivo ya decodificado
+        self._completo = None
+        self._por_nombre = None # nombre en minúsculas -> posición (se arma al primer uso)
+        self._por_ip = None # IP como entero -> posición
+        self._candado = threading.RLock()
+        self.cambios_pendientes = [] # Mismo formato que RepositorioDispositivos, para el diario
+
+    def __getattr__(self, nombre):
+        if nombre.startswith("_"):
+            raise AttributeError(nombre)
+        return getattr(self._materializar(), nombre)
+
+    def _materializar(self):
+        with self._candado:
+            if self._completo is None:
+                if len(self._entradas) > 10000:
+                    mostrar_mensaje(f"Decodificando el inventario completo ({len(self._entradas)} dispositivos)...", "info")
+                completo = RepositorioDispositivos([self._decodificar(i) for i in range(len(self._entradas))])
+                completo.cambios_pendientes = self.cambios_pendientes
+                self._completo = completo
+                self._por_nombre = self._por_ip = None
+                self._inventario.cerrar()
+        return self._completo
+
+    def soltar_archivo(self):
+        """Decodifica lo que falte y cierra el mmap (antes de reescribir la instantánea)."""
+        with self._candado:
+            if self._completo is None:
+                for i in range(len(self._entradas)):
+                    self._decodificar(i)
+            self._inventario.cerrar()
+
+    def _decodificar(self, posicion):
+        entrada = self._entradas[posicion]
+        if type(entrada) is int:
+            with self._candado:
+                entrada = self._entradas[posicion]
+                if type(entrada) is int:
+                    entrada = self._entradas[posicion] = Dispositivo.desde(self._inventario.registro(entrada))
+        return entrada
+
+    def _nombre_en(self, posicion):
+        entrada = self._entradas[posicion]
+        return self._inventario.claves()[0][entrada] if type(entrada) is int else entrada.nombre
+
+    def _mapa_nombres(self):
+        if self._por_nombre is None:
+            nombres = self._inventario.claves()[0]
+            mapa = {}
+            for posicion, entrada in enumerate(self._entradas):
+                nombre = nombres[entrada] if type(entrada) is int else entrada.nombre
+                mapa.setdefault(nombre.lower() if isinstance(nombre, str) else "", posicion) # Con duplicados gana el primero
+            self._por_nombre = mapa
+        return self._por_nombre
+
+    def _mapa_ips(self):
+        if self._por_ip is None:
+            ips = self._inventario.claves()[1]
+            mapa = {}
+            for posicion, entrada in enumerate(self._entradas):
+                entero = ips[entrada] if type(entrada) is int else _ip_entera_o_none(entrada.ip)
+                if entero is not None:
+                    mapa.setdefault(entero, posicion)
+            self._por_ip = mapa
+        return self._por_ip
+
+    def _invalidar_mapas(self):
+        self._por_nombre = self._por_ip = None
+
+    def _posicion(self, disp):
+        for posicion, entrada in enumerate(self._entradas):
+            if entrada is disp:
+                return posicion
+        raise ValueError(f"El dispositivo '{disp.get('NOMBRE')}' no pertenece al repositorio.")
+
+    # --- Comportamiento de secuencia ---
+    @_perezoso
+    def __len__(self): return len(self._entradas)
+    @_perezoso
+    def __bool__(self): return bool(self._entradas)
+
+    @_perezoso
+    def __getitem__(self, indice):
+        if isinstance(indice, slice):
+            return [self._decodificar(i) for i in range(*indice.indices(len(self._entradas)))]
+        return self._decodificar(range(len(self._entradas))[indice]) # range valida el índice y resuelve los negativos
+
+    @_perezoso
+    def __iter__(self):
+        posicion = 0
+        while posicion < len(self._entradas): # Como una lista: se decodifica cada registro al llegar a él
+            yield self._decodificar(posicion)
+            posicion += 1
+
+    # --- Búsquedas por nombre e IP ---
+    @_perezoso
+    def buscar_por_nombre(self, nombre):
+        posicion = self._mapa_nombres().get(nombre.lower())
+        return self._decodificar(posicion) if posicion is not None else None
+
+    @_perezoso
+    def nombre_existe(self, nombre, excluir=None):
+        encontrado = self.buscar_por_nombre(nombre)
+        return encontrado is not None and encontrado is not excluir
+
+    @_perezoso
+    def nombres_que_contienen(self, texto):
+        texto = texto.lower()
+        return [self._decodificar(p) for p in sorted(p for nombre, p in self._mapa_nombres().items() if texto in nombre)]
+
+    @_perezoso
+    def con_prefijo_nombre(self, prefijo, limite=None):
+        """Dispositivos cuyo nombre empieza por 'prefijo', en orden alfabético."""
+        prefijo = prefijo.lower()
+        nombres = sorted(nombre for nombre in self._mapa_nombres() if nombre.startswith(prefijo))
+        return [self._decodificar(self._por_nombre[nombre]) for nombre in nombres[:limite]]
+
+    @_perezoso
+    def nombres_con_prefijo(self, prefijo, limite=None):
+        """Nombres originales que empiezan por 'prefijo', para autocompletar (sin decodificar registros)."""
+        prefijo = prefijo.lower()
+        nombres = sorted(nombre for nombre in self._mapa_nombres() if nombre.startswith(prefijo))
+        return [self._nombre_en(self._por_nombre[nombre]) for nombre in nombres[:limite]]
+
+    @_perezoso
+    def nombres_parecidos(self, texto, limite=5):
+        parecidos = difflib.get_close_matches(texto.lower(), list(self._mapa_nombres()), n=limite)
+        return [self._nombre_en(self._por_nombre[nombre]) for nombre in parecidos]
+
+    @_perezoso
+    def buscar_por_ip(self, ip):
+        entero = ip_a_entero(ip)
+        posicion = self._mapa_ips().get(entero) if entero is not None else None
+        return self._decodificar(posicion) if posicion is not None else None
+
+    @_perezoso
+    def ip_en_uso(self, ip, excluir=None):
+        """Devuelve el dispositivo (distinto de 'excluir') que ya usa la IP, o None."""
+        if not ip or ip == "N/A":
+            return None
+        encontrado = self.buscar_por_ip(ip)
+        return encontrado if encontrado is not excluir else None
+
+    # --- Altas, cambios y bajas (las mismas validaciones que RepositorioDispositivos) ---
+    @_perezoso
+    def agregar(self, disp, validar=True):
+        disp = Dispositivo.desde(disp)
+        if validar:
+            if self.nombre_existe(disp.get("NOMBRE", "")):
+                raise ValueError(f"El nombre '{disp.get('NOMBRE')}' ya existe.")
+            propietario = self.ip_en_uso(disp.get("IP"))
+            if propietario:
+                raise ValueError(f"La IP '{disp.get('IP')}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'.")
+        self._entradas.append(disp)
+        self._invalidar_mapas()
+        self.cambios_pendientes.append(("add", disp.get("NOMBRE", "").lower(), disp))
+        return disp
+
+    @_perezoso
+    def actualizar(self, disp, **cambios):
+        """Aplica cambios de campos (p. ej. NOMBRE=..., IP=...) validando unicidad de nombre e IP."""
+        if "NOMBRE" in cambios and self.nombre_existe(cambios["NOMBRE"], excluir=disp):
+            raise ValueError(f"El nombre '{cambios['NOMBRE']}' ya existe para otro dispositivo.")
+        if "IP" in cambios:
+            propietario = self.ip_en_uso(cambios["IP"], excluir=disp)
+            if propietario:
+                raise ValueError(f"La IP '{cambios['IP']}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'.")
+        clave_anterior = disp.get("NOMBRE", "").lower()
+        disp.update(cambios)
+        if "NOMBRE" in cambios or "IP" in cambios:
+            self._invalidar_mapas()
+        self.cambios_pendientes.append(("update", clave_anterior, disp))
+        return disp
+
+    @_perezoso
+    def eliminar(self, disp):
+        posicion = self._posicion(disp)
+        self.cambios_pendientes.append(("delete", disp.get("NOMBRE", "").lower(), disp))
+        del self._entradas[posicion]
+        self._invalidar_mapas()
+
+    def reproducir_diario(self, ruta):
+        """Aplica el diario decodificando solo los registros que cambian (mismas reglas que _reproducir_diario)."""
+        registros, descartados = _leer_diario(ruta)
+        mapa = self._mapa_nombres()
+        aplicados = 0
+        for operacion, clave, dispositivo in registros:
+            if operacion == "delete":
+                posicion = mapa.pop(clave, None)
+                if posicion is not None:
+                    self._entradas[posicion] = None # Se quitan todas juntas al final, para no correr las posiciones
+            elif operacion in ("add", "update"):
+                clave_nueva = dispositivo.get("NOMBRE", "").lower()
+                posicion = mapa.pop(clave) if clave_nueva != clave and clave in mapa else mapa.get(clave_nueva)
+                if posicion is None:
+                    posicion = len(self._entradas)
+                    self._entradas.append(None)
+                self._entradas[posicion] = Dispositivo.desde(dispositivo)
+                mapa[clave_nueva] = posicion
+            aplicados += 1
+        if None in self._entradas:
+            self._entradas = [entrada for entrada in self._entradas if entrada is not None]
+        self._invalidar_mapas()
+        _informar_diario(ruta, aplicados, descartados)
+
+def abrir_inventario_ndjson():
+    """Abre el inventario del modo 'ndjson' sin decodificarlo; la primera vez lo crea desde el archivo JSON."""
+    if not os.path.exists(NOMBRE_ARCHIVO_NDJSON):
+        if os.path.exists(NOMBRE_ARCHIVO_DATOS) or os.path.exists(NOMBRE_ARCHIVO_DIARIO):
+            dispositivos = _cargar_dispositivos_json()
+            escribir_inventario_ndjson(dispositivos)
+            mostrar_mensaje(f"Se migraron {len(dispositivos)} dispositivos de '{NOMBRE_ARCHIVO_DATOS}' a '{NOMBRE_ARCHIVO_NDJSON}'.", "exito")
+        else: # Se crean la instantánea y el índice vacíos, para no esperar a la primera compactación
+            if not os.path.exists(NOMBRE_DIARIO_NDJSON):
+                mostrar_mensaje(f"Archivo '{NOMBRE_ARCHIVO_NDJSON}' no encontrado. Se crea un inventario vacío.", "advertencia")
+            try:
+                escribir_inventario_ndjson([])
+            except OSError as e:
+                mostrar_mensaje(f"No se pudo crear '{NOMBRE_ARCHIVO_NDJSON}': {e}", "error")
+    repositorio = RepositorioDiferido(InventarioNDJSON())
+    if os.path.exists(NOMBRE_ARCHIVO_NDJSON):
+        mostrar_mensaje(f"Datos abiertos desde '{NOMBRE_ARCHIVO_NDJSON}' ({len(repositorio)} dispositivos, se leen a medida que se usan).", "info")
+    try:
+        if os.path.exists(NOMBRE_DIARIO_NDJSON):
+            repositorio.reproducir_diario(NOMBRE_DIARIO_NDJSON)
+    except (IOError, ValueError) as e:
+        mostrar_mensaje(f"Error al leer el diario '{NOMBRE_DIARIO_NDJSON}': {e}", "error")
+    repositorio.cambios_pendientes.clear()
+    return repositorio
 
 # ---------------- SISTEMA DE INICIO DE SESIÓN ----------------
 USUARIOS_PREDEFINIDOS = {
@@ -119,16 +934,17 @@ def iniciar_sesion():
             restantes = max_intentos - intentos_fallidos
             if restantes > 0:
                 mostrar_mensaje(f"Usuario o contraseña incorrectos. Intentos restantes: {restantes}", "error")
-                sleep(2)
+                pausa(2)
             else:
                 mostrar_mensaje("Demasiados intentos fallidos. El programa se cerrará.", "error")
-                sleep(3); limpiar_pantalla(); sys.exit()
+                pausa(3); limpiar_pantalla(); sys.exit()
     return False
 
 # ---------------- DEFINICIÓN DE CONSTANTES Y VALIDACIONES ----------------
 SERVICIOS_VALIDOS = {'DNS': '🔍 DNS', 'DHCP': '🌐 DHCP', 'WEB': '🕸️ Servicio Web', 'BD': '🗃️ Base de Datos', 'CORREO': '✉️ Servicio de Correo', 'VPN': '🛡️ VPN'}
 TIPOS_DISPOSITIVO = {'PC': '💻 PC', 'SERVIDOR':'🖧 Servidor', 'ROUTER': '📶 Router', 'SWITCH': '🔀 Switch', 'FIREWALL': '🔥 Firewall', 'IMPRESORA': '🖨️ Impresora'}
 CAPAS_RED = {'NUCLEO': '💎 Núcleo (Core)', 'DISTRIBUCION': '📦 Distribución', 'ACCESO': '🔌 Acceso', 'N/A': 'N/A'} # N/A añadido
+CLAVE_POR_TIPO = {v: k for k, v in TIPOS_DISPOSITIVO.items()} # Búsqueda inversa: '🔀 Switch' -> 'SWITCH'
 
 def validar_ip(ip):
     if not ip: # Permite IP vacía que se tratará como "N/A"
@@ -173,206 +989,2229 @@ def validar_servicios_lista(servicios_lista):
             raise ValueError(f"Servicio inválido en la lista: {servicio}")
     return True
 
-def validar_vlans_input(vlans_str):
+def validar_vlans_input(vlans_str, avisar_duplicados=True):
+    """Convierte '10,20,30-40' en la lista ordenada de VLANs. Acepta números sueltos y rangos 'desde-hasta'."""
     if not vlans_str.strip():
         return []
-    vlan_list_str = vlans_str.split(',')
-    vlans_int = []
-    for v_str in vlan_list_str:
+    mascara = 0
+    for v_str in vlans_str.split(','):
         v_str = v_str.strip()
-        if not v_str.isdigit():
-            raise ValueError(f"VLAN '{v_str}' no es un número válido.")
-        v_int = int(v_str)
-        if not (1 <= v_int <= 4094):
-            raise ValueError(f"VLAN '{v_int}' fuera del rango válido (1-4094).")
-        if v_int in vlans_int:
-             mostrar_mensaje(f"VLAN '{v_int}' ya ingresada en esta lista. Se omitirá el duplicado.", "advertencia")
+        desde_str, guion, hasta_str = (parte.strip() for parte in v_str.partition('-'))
+        if not desde_str.isdigit() or (guion and not hasta_str.isdigit()):
+            raise ValueError(f"VLAN '{v_str}' no es un número ni un rango válido (ej: 10 o 10-200).")
+        desde = int(desde_str)
+        hasta = int(hasta_str) if guion else desde
+        for v_int in (desde, hasta):
+            if not (VLAN_MINIMA <= v_int <= VLAN_MAXIMA):
+                raise ValueError(f"VLAN '{v_int}' fuera del rango válido ({VLAN_MINIMA}-{VLAN_MAXIMA}).")
+        if desde > hasta:
+            raise ValueError(f"Rango de VLANs '{v_str}' invertido: el inicio es mayor que el final.")
+        nuevas = mascara_de_rango_vlans(desde, hasta)
+        repetidas = vlans_de_mascara(mascara & nuevas)
+        if repetidas and avisar_duplicados:
+            if len(repetidas) == 1:
+                mostrar_mensaje(f"VLAN '{repetidas[0]}' ya ingresada en esta lista. Se omitirá el duplicado.", "advertencia")
+            else:
+                mostrar_mensaje(f"VLANs {formatear_vlans(repetidas)} ya ingresadas en esta lista. Se omitirán los duplicados.", "advertencia")
+        mascara |= nuevas
+    return vlans_de_mascara(mascara)
+
+
+# ---------------- CONJUNTOS DE VLANS ----------------
+# Un conjunto de VLANs se representa como un entero usado de bitset (4094 bits): el bit n vale 1 si la
+# VLAN n está presente. Pertenencia, intersección, unión y diferencia son &, | y & ~ sobre esos enteros.
+VLAN_MINIMA, VLAN_MAXIMA = 1, 4094
+
+def mascara_de_vlans(vlans):
+    """Bitset de una lista de VLANs (los valores fuera de 1-4094 o no enteros se ignoran)."""
+    mascara = 0
+    for vlan in vlans:
+        if type(vlan) is int and VLAN_MINIMA <= vlan <= VLAN_MAXIMA:
+            mascara |= 1 << vlan
+    return mascara
+
+def mascara_de_rango_vlans(desde, hasta):
+    return ((1 << (hasta - desde + 1)) - 1) << desde
+
+def vlans_de_mascara(mascara):
+    """VLANs presentes en el bitset, en orden ascendente."""
+    return [vlan for vlan, bit in enumerate(bin(mascara)[:1:-1]) if bit == "1"] if mascara else []
+
+def formatear_vlans(vlans):
+    """Texto compacto de una lista ordenada de VLANs: [10, 11, 12, 20, 21] -> '10-12, 20, 21'."""
+    if not all(type(v) is int for v in vlans): # Valores editados a mano en el JSON: se muestran tal cual
+        return ", ".join(map(str, vlans))
+    partes, i = [], 0
+    while i < len(vlans):
+        j = i
+        while j + 1 < len(vlans) and vlans[j + 1] == vlans[j] + 1:
+            j += 1
+        if j - i >= 2: # Tres o más consecutivas se muestran como rango
+            partes.append(f"{vlans[i]}-{vlans[j]}")
+        else:
+            partes.extend(str(v) for v in vlans[i:j + 1])
+        i = j + 1
+    return ", ".join(partes)
+
+def vlans_compartidas(disp_a, disp_b):
+    """(VLANs en ambos dispositivos, solo en el primero, solo en el segundo), calculadas con sus bitsets."""
+    mascara_a, mascara_b = disp_a.mascara_vlans(), disp_b.mascara_vlans()
+    return vlans_de_mascara(mascara_a & mascara_b), vlans_de_mascara(mascara_a & ~mascara_b), vlans_de_mascara(mascara_b & ~mascara_a)
+
+
+# ---------------- MODELO COMPACTO DE DISPOSITIVO ----------------
+# Los servicios se guardan como una máscara de bits sobre SERVICIOS_VALIDOS. Los bits siguen el orden
+# alfabético del texto mostrado, que es el orden en que normalizar_servicios() ya los deja, así que al
+# decodificar la máscara se obtiene la misma lista que antes.
+_SERVICIOS_POR_BIT = tuple(sorted(SERVICIOS_VALIDOS.values()))
+_BIT_POR_SERVICIO = {servicio: 1 << i for i, servicio in enumerate(_SERVICIOS_POR_BIT)}
+_servicios_por_mascara = {0: ()} # Máscara -> tupla de servicios (hay pocas combinaciones distintas)
+_mascara_por_servicios = {(): (0, None)} # Lo inverso, para no recalcular la máscara en cada carga
+
+def _servicios_de_mascara(mascara):
+    servicios = _servicios_por_mascara.get(mascara)
+    if servicios is None:
+        servicios = _servicios_por_mascara[mascara] = tuple(s for i, s in enumerate(_SERVICIOS_POR_BIT) if mascara >> i & 1)
+    return servicios
+
+def _internar(valor):
+    return sys.intern(valor) if type(valor) is str else valor
+
+class Dispositivo:
+    """Un dispositivo con __slots__ en lugar de un diccionario por registro.
+
+    Tipo y ubicación son cadenas internadas (una sola copia por valor), los servicios una máscara de
+    bits y las VLANs un array('H') ordenado y sin duplicados. Se usa como el diccionario de siempre:
+    disp["NOMBRE"], disp.get("SERVICIOS", []), "IP" in disp, etc.; SERVICIOS y VLANS devuelven listas
+    nuevas, así que se cambian con disp["VLANS"] = [...] (o RepositorioDispositivos.actualizar), no in situ.
+    Los servicios desconocidos y las claves extra de un JSON se conservan aparte para no perderlos al guardar.
+    """
+    __slots__ = ("tipo", "nombre", "ip", "ubicacion", "mascara_servicios", "servicios_extra", "vlans", "otros")
+    CAMPOS = ("TIPO", "NOMBRE", "IP", "UBICACION", "SERVICIOS", "VLANS")
+    __hash__ = None # Como un diccionario: se compara por valor y no es hashable
+
+    def __init__(self, tipo="N/A", nombre="", ip="N/A", ubicacion="N/A", servicios=(), vlans=()):
+        self.tipo = _internar(tipo)
+        self.nombre = nombre
+        self.ip = ip
+        self.ubicacion = _internar(ubicacion)
+        self.otros = None
+        self._asignar_servicios(servicios)
+        self._asignar_vlans(vlans)
+
+    @classmethod
+    def desde(cls, registro):
+        """Convierte un diccionario con las claves del JSON en Dispositivo (si ya lo es, lo devuelve tal cual)."""
+        if isinstance(registro, cls):
+            return registro
+        get = registro.get
+        disp = cls(get("TIPO", "N/A"), get("NOMBRE", ""), get("IP", "N/A"),
+                   get("UBICACION", "N/A"), get("SERVICIOS") or (), get("VLANS") or ())
+        if len(registro) != len(cls.CAMPOS) or not all(clave in registro for clave in cls.CAMPOS):
+            for clave in registro:
+                if clave not in cls.CAMPOS:
+                    disp[clave] = registro[clave]
+        return disp
+
+    def _asignar_servicios(self, servicios):
+        try:
+            self.mascara_servicios, self.servicios_extra = _mascara_por_servicios[tuple(servicios)]
+            return
+        except (KeyError, TypeError): # Combinación nueva (o con elementos no hashables)
+            pass
+        mascara, extra = 0, []
+        for servicio in servicios:
+            bit = _BIT_POR_SERVICIO.get(servicio) if isinstance(servicio, str) else None
+            if bit is None:
+                if servicio not in extra:
+                    extra.append(servicio)
+            else:
+                mascara |= bit
+        self.mascara_servicios = mascara
+        self.servicios_extra = tuple(extra) or None
+        if self.servicios_extra is None:
+            _mascara_por_servicios[tuple(servicios)] = (mascara, None)
+
+    def _asignar_vlans(self, vlans):
+        if not vlans:
+            self.vlans = ()
+            return
+        try:
+            self.vlans = array('H', sorted(set(vlans)))
+        except (TypeError, OverflowError): # Valores que no caben en 'H' (JSON editado a mano): se guardan tal cual
+            self.vlans = tuple(vlans)
+
+    def servicios(self):
+        """Tupla de servicios sin copiar a lista (para lecturas frecuentes como indexar o serializar)."""
+        servicios = _servicios_de_mascara(self.mascara_servicios)
+        return servicios + self.servicios_extra if self.servicios_extra else servicios
+
+    def mascara_vlans(self):
+        """Bitset de las VLANs (ver CONJUNTOS DE VLANS). Se calcula al vuelo: guardarlo costaría hasta 512 bytes por dispositivo."""
+        return mascara_de_vlans(self.vlans)
+
+    # --- Interfaz de diccionario ---
+    def __getitem__(self, clave):
+        if clave == "NOMBRE": return self.nombre
+        if clave == "IP": return self.ip
+        if clave == "TIPO": return self.tipo
+        if clave == "UBICACION": return self.ubicacion
+        if clave == "SERVICIOS": return list(self.servicios())
+        if clave == "VLANS": return list(self.vlans)
+        if self.otros is not None and clave in self.otros:
+            return self.otros[clave]
+        raise KeyError(clave)
+
+    def __setitem__(self, clave, valor):
+        if clave == "NOMBRE": self.nombre = valor
+        elif clave == "IP": self.ip = valor
+        elif clave == "TIPO": self.tipo = _internar(valor)
+        elif clave == "UBICACION": self.ubicacion = _internar(valor)
+        elif clave == "SERVICIOS": self._asignar_servicios(valor or ())
+        elif clave == "VLANS": self._asignar_vlans(valor or ())
         else:
-            vlans_int.append(v_int)
-    return sorted(list(set(vlans_int)))
+            if self.otros is None:
+                self.otros = {}
+            self.otros[clave] = valor
 
+    def get(self, clave, predeterminado=None):
+        try:
+            return self[clave]
+        except KeyError:
+            return predeterminado
+
+    def keys(self):
+        return self.CAMPOS + tuple(self.otros) if self.otros else self.CAMPOS
+
+    def __iter__(self): return iter(self.keys())
+    def __len__(self): return len(self.keys())
+    def __contains__(self, clave): return clave in self.CAMPOS or (self.otros is not None and clave in self.otros)
+    def values(self): return [self[clave] for clave in self.keys()]
+    def items(self): return [(clave, self[clave]) for clave in self.keys()]
+
+    def update(self, otro=(), **cambios):
+        for clave, valor in (otro.items() if hasattr(otro, "items") else otro):
+            self[clave] = valor
+        for clave, valor in cambios.items():
+            self[clave] = valor
+
+    def como_dict(self):
+        """Diccionario con el formato del JSON (mismas claves y en el mismo orden que antes)."""
+        datos = {"TIPO": self.tipo, "NOMBRE": self.nombre, "IP": self.ip, "UBICACION": self.ubicacion,
+                 "SERVICIOS": list(self.servicios()), "VLANS": list(self.vlans)}
+        if self.otros:
+            datos.update(self.otros)
+        return datos
+
+    def __eq__(self, otro):
+        if isinstance(otro, (Dispositivo, dict)):
+            return self.como_dict() == dict(otro.items())
+        return NotImplemented
+
+    def __repr__(self):
+        return f"Dispositivo({self.como_dict()!r})"
+
+def serializar_dispositivo(objeto):
+    """Para el parámetro 'default' de json.dump(s): escribe un Dispositivo como su diccionario."""
+    if type(objeto) is Dispositivo:
+        return objeto.como_dict()
+    raise TypeError(f"Objeto de tipo {type(objeto).__name__} no serializable a JSON")
+
+_json_servicios_por_mascara = {} # Máscara -> bloque "SERVICIOS" ya codificado con sangría
+
+def _json_lista_indentada(valores, codificar):
+    if not valores:
+        return "[]"
+    return "[\n            " + ",\n            ".join(map(codificar, valores)) + "\n        ]"
+
+def _json_dispositivo_indentado(disp):
+    """Texto de un dispositivo tal como lo escribe json.dump(..., indent=4, ensure_ascii=False) dentro de la lista."""
+    if disp.otros or disp.servicios_extra or type(disp.vlans) is tuple: # Casos raros: se delega en json
+        texto = json.dumps(disp.como_dict(), indent=4, ensure_ascii=False)
+        return "    " + texto.replace("\n", "\n    ")
+    servicios = _json_servicios_por_mascara.get(disp.mascara_servicios)
+    if servicios is None:
+        servicios = _json_servicios_por_mascara[disp.mascara_servicios] = _json_lista_indentada(
+            _servicios_de_mascara(disp.mascara_servicios), _codificar_cadena_json)
+    return ("    {\n        \"TIPO\": " + _codificar_valor_json(disp.tipo)
+            + ",\n        \"NOMBRE\": " + _codificar_valor_json(disp.nombre)
+            + ",\n        \"IP\": " + _codificar_valor_json(disp.ip)
+            + ",\n        \"UBICACION\": " + _codificar_valor_json(disp.ubicacion)
+            + ",\n        \"SERVICIOS\": " + servicios
+            + ",\n        \"VLANS\": " + _json_lista_indentada(disp.vlans, str)
+            + "\n    }")
+
+def _codificar_valor_json(valor):
+    return _codificar_cadena_json(valor) if type(valor) is str else json.dumps(valor, ensure_ascii=False)
+
+_codificar_cadena_json = json.encoder.encode_basestring # La misma función que usa json con ensure_ascii=False
+
+def escribir_json_dispositivos(f, dispositivos):
+    """Escribe la lista en 'f' con el mismo texto que json.dump(indent=4, ensure_ascii=False), pero sin
+    pasar cada Dispositivo por un diccionario intermedio ni por el codificador en Python puro de json."""
+    if not dispositivos:
+        f.write("[]")
+        return
+    bloque, separador = [], "[\n"
+    for disp in dispositivos:
+        if type(disp) is Dispositivo:
+            bloque.append(_json_dispositivo_indentado(disp))
+        else:
+            bloque.append("    " + json.dumps(disp, indent=4, ensure_ascii=False).replace("\n", "\n    "))
+        if len(bloque) == 4096: # Se escribe por bloques para no armar todo el archivo en memoria
+            f.write(separador + ",\n".join(bloque))
+            bloque.clear()
+            separador = ",\n"
+    if bloque:
+        f.write(separador + ",\n".join(bloque))
+    f.write("\n]")
+
+
+def construir_dispositivo(tipo, nombre, ip=None, ubicacion=None, servicios=None, vlans=None):
+    """Valida y arma un Dispositivo. Lanza ValueError si algún dato no es válido."""
+    validar_nombre(nombre)
+    if ip and ip != "N/A": validar_ip(ip)
+    if servicios: validar_servicios_lista(servicios)
+
+    return Dispositivo(
+        tipo,
+        nombre,
+        ip if ip else "N/A",
+        ubicacion if ubicacion else "N/A", # Usando UBICACION consistentemente
+        servicios or (),
+        vlans or ()
+    )
+
+def normalizar_opcion(valor, opciones_dict, etiqueta):
+    """Convierte una clave ('switch') o un valor mostrado ('🔀 Switch') al valor mostrado del diccionario."""
+    if valor is None or valor == "":
+        return None
+    if not isinstance(valor, str):
+        raise ValueError(f"{etiqueta} debe ser texto, no {type(valor).__name__}.")
+    valor_limpio = valor.strip()
+    if valor_limpio.upper() in opciones_dict:
+        return opciones_dict[valor_limpio.upper()]
+    for valor_mostrado in opciones_dict.values():
+        if valor_limpio.lower() == valor_mostrado.lower():
+            return valor_mostrado
+    raise ValueError(f"{etiqueta} '{valor}' no válido. Opciones: {', '.join(opciones_dict)}")
+
+def normalizar_servicios(servicios_str):
+    """'DNS, vpn' -> ['🔍 DNS', '🛡️ VPN'] (ordenados y sin duplicados)."""
+    if not servicios_str or not servicios_str.strip():
+        return []
+    return sorted(set(normalizar_opcion(s, SERVICIOS_VALIDOS, "Servicio") for s in servicios_str.split(",") if s.strip()))
 
 def crear_dispositivo(tipo, nombre, ip=None, ubicacion=None, servicios=None, vlans=None): # 'capa' renombrada a 'ubicacion'
     try:
-        validar_nombre(nombre)
-        if ip and ip != "N/A": validar_ip(ip)
-        if servicios: validar_servicios_lista(servicios)
-
-        dispositivo_data = {
-            "TIPO": tipo,
-            "NOMBRE": nombre,
-            "IP": ip if ip else "N/A",
-            "UBICACION": ubicacion if ubicacion else "N/A", # Usando UBICACION consistentemente
-            "SERVICIOS": servicios if servicios else [],
-            "VLANS": vlans if vlans else []
-        }
-        return dispositivo_data
+        return construir_dispositivo(tipo, nombre, ip, ubicacion, servicios, vlans)
     except ValueError as e:
         mostrar_mensaje(f"Error al definir datos del dispositivo: {e}", "error")
         return None
 
-# ---------------- FUNCIONES DE MENÚ Y NAVEGACIÓN ----------------
-def push_menu_history(menu_function): menu_history.append(menu_function)
-def pop_menu_history():
-    if len(menu_history) > 1: menu_history.pop()
-    elif len(menu_history) == 1: return menu_history[0]
-    return menu_history[-1] if menu_history else None
+# ---------------- ÍNDICE DE NOMBRES (TRIE + TRIGRAMAS) ----------------
+class IndiceNombres:
+    """Nombres en minúsculas con un trie para prefijos y listas de trigramas para subcadenas y parecidos.
+
+    Se actualiza en cada alta, cambio de nombre y baja, así que ninguna búsqueda por nombre recorre
+    el inventario. Las consultas de menos de tres letras recorren solo las claves de nombres.
+    """
+    _FIN = "" # Clave del trie que marca el final de un nombre
+
+    def __init__(self):
+        self._trie = {}
+        self._trigramas = {} # trigrama -> {nombres}
+        self._nombres = set()
+
+    @staticmethod
+    def trigramas(texto):
+        return {texto[i:i + 3] for i in range(len(texto) - 2)}
+
+    def __len__(self): return len(self._nombres)
+    def __contains__(self, nombre): return nombre in self._nombres
+
+    def agregar(self, nombre):
+        if nombre in self._nombres:
+            return
+        self._nombres.add(nombre)
+        nodo = self._trie
+        for letra in nombre:
+            nodo = nodo.setdefault(letra, {})
+        nodo[self._FIN] = nombre
+        for trigrama in self.trigramas(nombre):
+            self._trigramas.setdefault(trigrama, set()).add(nombre)
+
+    def quitar(self, nombre):
+        if nombre not in self._nombres:
+            return
+        self._nombres.discard(nombre)
+        camino = [self._trie]
+        for letra in nombre:
+            camino.append(camino[-1][letra])
+        del camino[-1][self._FIN]
+        for nodo, letra in zip(reversed(camino[:-1]), reversed(nombre)): # Se podan las ramas que quedan vacías
+            if camino[-1]:
+                break
+            del nodo[letra]
+            camino.pop()
+        for trigrama in self.trigramas(nombre):
+            self._trigramas[trigrama].discard(nombre)
+            if not self._trigramas[trigrama]:
+                del self._trigramas[trigrama]
+
+    def con_prefijo(self, prefijo, limite=None):
+        """Nombres que empiezan por 'prefijo', en orden alfabético (hasta 'limite')."""
+        nodo = self._trie
+        for letra in prefijo:
+            nodo = nodo.get(letra)
+            if nodo is None:
+                return []
+        encontrados = []
+        pendientes = [nodo]
+        while pendientes and (limite is None or len(encontrados) < limite):
+            actual = pendientes.pop()
+            if self._FIN in actual:
+                encontrados.append(actual[self._FIN])
+            pendientes.extend(actual[letra] for letra in sorted((l for l in actual if l != self._FIN), reverse=True))
+        return encontrados
+
+    def que_contienen(self, texto):
+        """Nombres que contienen 'texto' (ya en minúsculas), sin un orden definido."""
+        if len(texto) < 3:
+            return [nombre for nombre in self._nombres if texto in nombre]
+        listas = sorted((self._trigramas.get(t, set()) for t in self.trigramas(texto)), key=len)
+        if not listas[0]:
+            return []
+        candidatos = listas[0].intersection(*listas[1:])
+        return [nombre for nombre in candidatos if texto in nombre] # El repositorio los ordena por alta
+
+    def parecidos(self, texto, limite=5, minimo=0.6):
+        """Sugerencias tipo '¿quiso decir...?': nombres con trigramas en común, ordenados por similitud."""
+        comunes = {}
+        for trigrama in self.trigramas(texto) or {texto}:
+            for nombre in self._trigramas.get(trigrama, ()):
+                comunes[nombre] = comunes.get(nombre, 0) + 1
+        if not comunes: # Nombres cortos o sin trigramas en común: se prueba con los que comparten el inicio
+            comunes = dict.fromkeys(self.con_prefijo(texto[:2], limite=200) or self.con_prefijo(texto[:1], limite=200), 0)
+        candidatos = sorted(comunes, key=comunes.get, reverse=True)[:200] # Se afina solo sobre los más prometedores
+        puntuados = []
+        for nombre in candidatos:
+            similitud = difflib.SequenceMatcher(None, texto, nombre).ratio()
+            if similitud >= minimo:
+                puntuados.append((similitud, nombre))
+        return [nombre for _, nombre in sorted(puntuados, key=lambda p: (-p[0], p[1]))[:limite]]
+
+
+# ---------------- ÍNDICE DE DIRECCIONES IP ----------------
+def ip_a_entero(ip):
+    """'192.168.1.10' -> 3232235786, o None si no es una IPv4 con cuatro octetos decimales.
+
+    Los ceros a la izquierda se leen en decimal ('010.0.0.1' == '10.0.0.1'), igual que los acepta validar_ip.
+    """
+    if not ip:
+        return None
+    octetos = ip.split(".")
+    if len(octetos) != 4:
+        return None
+    entero = 0
+    for octeto in octetos:
+        if not (octeto.isascii() and octeto.isdigit()) or len(octeto) > 3 or int(octeto) > 255:
+            return None
+        entero = (entero << 8) | int(octeto)
+    return entero
+
+def entero_a_ip(entero):
+    return f"{entero >> 24}.{(entero >> 16) & 255}.{(entero >> 8) & 255}.{entero & 255}"
+
+def rango_de_red(red):
+    """'192.172.10.0/24' (o un IPv4Network) -> (primera, última) como enteros, incluyendo red y broadcast."""
+    if not isinstance(red, ipaddress.IPv4Network):
+        try:
+            red = ipaddress.IPv4Network(red.strip(), strict=False)
+        except (ValueError, AttributeError):
+            raise ValueError(f"Red '{red}' no válida (ej: 192.168.1.0/24).")
+    return int(red.network_address), int(red.broadcast_address)
+
+def rango_asignable(red):
+    """Como rango_de_red, pero sin las direcciones de red y broadcast cuando la máscara es /30 o más amplia."""
+    primera, ultima = rango_de_red(red)
+    if ultima - primera >= 3:
+        return primera + 1, ultima - 1
+    return primera, ultima
+
+class IndiceIP:
+    """IPs como enteros de 32 bits en una lista ordenada (bisect) más un diccionario entero -> dispositivo.
+
+    Las consultas por red o rango cuestan O(log n + resultados) y los huecos libres se calculan recorriendo
+    solo las IPs usadas dentro del rango.
+    """
+    def __init__(self):
+        self._enteros = []
+        self._por_entero = {}
+        self._en_carga = False # Durante la carga inicial se agrega al final y se ordena una sola vez al terminar
+
+    def __len__(self): return len(self._enteros)
+
+    def iniciar_carga(self):
+        self._en_carga = True
+
+    def terminar_carga(self):
+        self._enteros.sort()
+        self._en_carga = False
+
+    def agregar(self, entero, disp):
+        if entero in self._por_entero: # Si hay duplicados en el archivo, se conserva el primero
+            return False
+        if self._en_carga:
+            self._enteros.append(entero)
+        else:
+            bisect.insort(self._enteros, entero)
+        self._por_entero[entero] = disp
+        return True
 
+    def quitar(self, entero, disp):
+        if self._por_entero.get(entero) is not disp:
+            return
+        del self._por_entero[entero]
+        del self._enteros[bisect.bisect_left(self._enteros, entero)]
+
+    def obtener(self, entero):
+        return self._por_entero.get(entero)
+
+    def _posiciones(self, primera, ultima):
+        return bisect.bisect_left(self._enteros, primera), bisect.bisect_right(self._enteros, ultima)
+
+    def en_rango(self, primera, ultima):
+        """[(entero, dispositivo)] con primera <= IP <= última, ordenados por IP."""
+        desde, hasta = self._posiciones(primera, ultima)
+        return [(entero, self._por_entero[entero]) for entero in self._enteros[desde:hasta]]
+
+    def contar_en_rango(self, primera, ultima):
+        desde, hasta = self._posiciones(primera, ultima)
+        return hasta - desde
+
+    def libres(self, primera, ultima):
+        """Genera las IPs (enteros) sin asignar entre primera y última, en orden."""
+        desde, hasta = self._posiciones(primera, ultima)
+        actual = primera
+        for usada in itertools.islice(self._enteros, desde, hasta):
+            yield from range(actual, usada)
+            actual = usada + 1
+        yield from range(actual, ultima + 1)
+
+    def items(self):
+        return ((entero, self._por_entero[entero]) for entero in self._enteros)
+
+def detectar_conflictos_ip(dispositivos, repositorio=None):
+    """Duplicados de IP dentro de 'dispositivos' y, si se indica, contra el repositorio. O(n log n).
+
+    Compara las IPs como enteros, así que '10.0.0.1' y '10.0.0.01' se detectan como la misma.
+    Devuelve una lista de {'IP', 'DISPOSITIVOS', 'MOTIVO'}.
+    """
+    pares = sorted((entero, disp.get("NOMBRE", "?")) for disp in dispositivos
+                   for entero in (ip_a_entero(disp.get("IP", "")),) if entero is not None)
+    conflictos = []
+    for entero, grupo in itertools.groupby(pares, key=lambda par: par[0]):
+        nombres = [nombre for _, nombre in grupo]
+        propietario = repositorio.buscar_por_ip(entero_a_ip(entero)) if repositorio is not None else None
+        if propietario is not None and propietario.get("NOMBRE", "?") not in nombres:
+            conflictos.append({"IP": entero_a_ip(entero), "DISPOSITIVOS": nombres + [propietario.get("NOMBRE", "?")],
+                               "MOTIVO": f"ya asignada a '{propietario.get('NOMBRE', '?')}' en el inventario"})
+        elif len(nombres) > 1:
+            conflictos.append({"IP": entero_a_ip(entero), "DISPOSITIVOS": nombres, "MOTIVO": "repetida en el lote"})
+    return conflictos
+
+
+# ---------------- ESTADÍSTICAS INCREMENTALES ----------------
+class ContadoresEstadisticas:
+    """Conteos del reporte estadístico mantenidos al día con cada alta, cambio y baja del repositorio.
+
+    El repositorio llama a aplicar(..., +1) al indexar un dispositivo y a aplicar(..., -1) al desindexarlo,
+    con los mismos valores que usa para sus índices; así el reporte cuesta O(categorías) y no O(dispositivos).
+    """
+    def __init__(self):
+        self.reiniciar()
+
+    def reiniciar(self):
+        self.total = 0
+        self.tipos = {}
+        self.ubicaciones = {} # Sin 'N/A', igual que el reporte
+        self.servicios = {}
+        self.vlans = {} # VLAN -> veces que aparece
+        self.dispositivos_con_vlans = 0
+        self.total_vlans_configuradas = 0
+
+    @staticmethod
+    def _sumar(conteo, clave, cantidad):
+        nuevo = conteo.get(clave, 0) + cantidad
+        if nuevo:
+            conteo[clave] = nuevo
+        else:
+            conteo.pop(clave, None) # Las categorías que quedan en cero desaparecen del reporte
 
-def ir_a_menu_principal():
-    global menu_history
-    if menu_history:
-        menu_principal_func = menu_history[0]
-        menu_history = [menu_principal_func]
-        mostrar_barra_progreso(0.5, "Volviendo al Menú Principal...")
-        menu_principal_func()
-    else:
-        mostrar_mensaje("Error: No se encuentra el menú principal en el historial.", "error")
-        main()
+    def aplicar(self, tipo, ubicacion, servicios, vlans, signo):
+        self.total += signo
+        self._sumar(self.tipos, tipo, signo)
+        if ubicacion != "N/A":
+            self._sumar(self.ubicaciones, ubicacion, signo)
+        for servicio in servicios:
+            self._sumar(self.servicios, servicio, signo)
+        if vlans:
+            self.dispositivos_con_vlans += signo
+            self.total_vlans_configuradas += signo * len(vlans)
+            for vlan in vlans:
+                self._sumar(self.vlans, vlan, signo)
+
+    def como_dict(self):
+        """Copia con la misma forma que devuelve calcular_estadisticas()."""
+        return {
+            "TOTAL": self.total,
+            "TIPOS": dict(self.tipos),
+            "UBICACIONES": dict(self.ubicaciones),
+            "SERVICIOS": dict(self.servicios),
+            "VLANS": dict(self.vlans),
+            "DISPOSITIVOS_CON_VLANS": self.dispositivos_con_vlans,
+            "TOTAL_VLANS_CONFIGURADAS": self.total_vlans_configuradas
+        }
+
+def contar_estadisticas(dispositivos):
+    """Recorre todos los dispositivos y cuenta desde cero (para listas sueltas y para verificar los contadores)."""
+    contadores = ContadoresEstadisticas()
+    for d in dispositivos:
+        contadores.aplicar(d.get("TIPO", "N/A"), d.get("UBICACION", "N/A"), d.get("SERVICIOS", []), d.get("VLANS", []), 1)
+    return contadores.como_dict()
+
+
+# ---------------- REPOSITORIO DE DISPOSITIVOS (ÍNDICES) ----------------
+class RepositorioDispositivos:
+    """Lista de dispositivos con índices hash por nombre, IP, tipo, ubicación/capa, servicio y VLAN.
+
+    Se comporta como una secuencia (len, iteración, acceso por posición) para que los menús sigan
+    recorriéndola igual que la lista original, pero las altas, cambios y bajas deben pasar por
+    agregar(), actualizar() y eliminar() para que los índices se mantengan consistentes.
+    """
+    CAMPOS_INDEXADOS = ("NOMBRE", "IP", "TIPO", "UBICACION", "SERVICIOS", "VLANS")
+
+    def __init__(self, dispositivos=None):
+        self._dispositivos = []
+        self._por_nombre = {} # nombre en minúsculas -> dispositivo
+        self._indice_nombres = IndiceNombres() # mismos nombres, para prefijos, subcadenas y parecidos
+        self._indice_ip = IndiceIP() # IP como entero -> dispositivo, ordenado para consultas por red
+        self._por_tipo = {} # tipo -> {id(dispositivo): dispositivo}
+        self._por_ubicacion = {}
+        self._por_servicio = {}
+        self._por_vlan = {}
+        self._claves = {} # id(dispositivo) -> valores indexados (para poder desindexar tras cambios in situ)
+        self._orden_alta = {} # id(dispositivo) -> número de alta creciente (mismo orden que la lista)
+        self._contador_altas = itertools.count()
+        self.estadisticas = ContadoresEstadisticas()
+        self.cambios_pendientes = [] # (operación, nombre en minúsculas previo al cambio, dispositivo) para el diario
+        self._indice_ip.iniciar_carga() # insort por cada IP sería O(n²) con el archivo desordenado
+        for disp in dispositivos or []:
+            self.agregar(disp, validar=False)
+        self._indice_ip.terminar_carga()
+        self.cambios_pendientes.clear()
+
+    # --- Comportamiento de secuencia ---
+    def __len__(self): return len(self._dispositivos)
+    def __iter__(self): return iter(self._dispositivos)
+    def __getitem__(self, indice): return self._dispositivos[indice]
+    def __bool__(self): return bool(self._dispositivos)
+
+    def contiene(self, disp):
+        return id(disp) in self._claves
+
+    # --- Mantenimiento de índices ---
+    @staticmethod
+    def _claves_de(disp):
+        ip = disp.ip # Todos los dispositivos del repositorio son Dispositivo (ver agregar)
+        return (
+            disp.nombre.lower(),
+            ip_a_entero(ip) if ip and ip != "N/A" else None,
+            disp.tipo,
+            disp.ubicacion,
+            disp.servicios(),
+            tuple(disp.vlans)
+        )
+
+    def _indexar(self, disp):
+        claves = self._claves_de(disp)
+        nombre_lower, ip, tipo, ubicacion, servicios, vlans = claves
+        self._claves[id(disp)] = claves
+        if nombre_lower not in self._por_nombre: # Si hay duplicados en el archivo, se conserva el primero
+            self._por_nombre[nombre_lower] = disp
+            self._indice_nombres.agregar(nombre_lower)
+        if ip is not None:
+            self._indice_ip.agregar(ip, disp)
+        self._por_tipo.setdefault(tipo, {})[id(disp)] = disp
+        self._por_ubicacion.setdefault(ubicacion, {})[id(disp)] = disp
+        for servicio in servicios:
+            self._por_servicio.setdefault(servicio, {})[id(disp)] = disp
+        for vlan in vlans:
+            self._por_vlan.setdefault(vlan, {})[id(disp)] = disp
+        self.estadisticas.aplicar(tipo, ubicacion, servicios, vlans, 1)
+
+    def _desindexar(self, disp):
+        nombre_lower, ip, tipo, ubicacion, servicios, vlans = self._claves.pop(id(disp))
+        self.estadisticas.aplicar(tipo, ubicacion, servicios, vlans, -1)
+        if self._por_nombre.get(nombre_lower) is disp:
+            del self._por_nombre[nombre_lower]
+            self._indice_nombres.quitar(nombre_lower)
+        if ip is not None:
+            self._indice_ip.quitar(ip, disp)
+        for indice, clave in ((self._por_tipo, tipo), (self._por_ubicacion, ubicacion)):
+            indice[clave].pop(id(disp), None)
+            if not indice[clave]:
+                del indice[clave]
+        for indice, valores in ((self._por_servicio, servicios), (self._por_vlan, vlans)):
+            for valor in valores:
+                indice[valor].pop(id(disp), None)
+                if not indice[valor]:
+                    del indice[valor]
+
+    # --- Altas, cambios y bajas ---
+    def agregar(self, disp, validar=True):
+        """Agrega un dispositivo (un diccionario se convierte en Dispositivo) y devuelve el objeto guardado."""
+        disp = Dispositivo.desde(disp)
+        if validar:
+            if self.nombre_existe(disp.get("NOMBRE", "")):
+                raise ValueError(f"El nombre '{disp.get('NOMBRE')}' ya existe.")
+            propietario = self.ip_en_uso(disp.get("IP"))
+            if propietario:
+                raise ValueError(f"La IP '{disp.get('IP')}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'.")
+        self._dispositivos.append(disp)
+        self._orden_alta[id(disp)] = next(self._contador_altas)
+        self._indexar(disp)
+        self.cambios_pendientes.append(("add", disp.get("NOMBRE", "").lower(), disp))
+        return disp
+
+    def actualizar(self, disp, **cambios):
+        """Aplica cambios de campos (p. ej. NOMBRE=..., IP=...) validando unicidad de nombre e IP."""
+        if "NOMBRE" in cambios and self.nombre_existe(cambios["NOMBRE"], excluir=disp):
+            raise ValueError(f"El nombre '{cambios['NOMBRE']}' ya existe para otro dispositivo.")
+        if "IP" in cambios:
+            propietario = self.ip_en_uso(cambios["IP"], excluir=disp)
+            if propietario:
+                raise ValueError(f"La IP '{cambios['IP']}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'.")
+        clave_anterior = self._claves[id(disp)][0]
+        self._desindexar(disp)
+        disp.update(cambios)
+        self._indexar(disp)
+        self.cambios_pendientes.append(("update", clave_anterior, disp))
+        return disp
+
+    def eliminar(self, disp):
+        self.cambios_pendientes.append(("delete", self._claves[id(disp)][0], disp))
+        self._desindexar(disp)
+        del self._orden_alta[id(disp)]
+        for i, actual in enumerate(self._dispositivos):
+            if actual is disp:
+                del self._dispositivos[i]
+                break
+
+    # --- Consultas O(1) ---
+    def buscar_por_nombre(self, nombre):
+        return self._por_nombre.get(nombre.lower())
+
+    def nombre_existe(self, nombre, excluir=None):
+        encontrado = self._por_nombre.get(nombre.lower())
+        return encontrado is not None and encontrado is not excluir
+
+    def nombres_que_contienen(self, texto):
+        """Dispositivos cuyo nombre contiene 'texto', en el orden del inventario (como el recorrido lineal)."""
+        encontrados = [self._por_nombre[n] for n in self._indice_nombres.que_contienen(texto.lower())]
+        return sorted(encontrados, key=lambda disp: self._orden_alta[id(disp)])
+
+    def con_prefijo_nombre(self, prefijo, limite=None):
+        """Dispositivos cuyo nombre empieza por 'prefijo', en orden alfabético."""
+        return [self._por_nombre[n] for n in self._indice_nombres.con_prefijo(prefijo.lower(), limite)]
+
+    def nombres_con_prefijo(self, prefijo, limite=None):
+        """Nombres originales (no en minúsculas) que empiezan por 'prefijo', para autocompletar."""
+        return [d.get("NOMBRE", "") for d in self.con_prefijo_nombre(prefijo, limite)]
+
+    def nombres_parecidos(self, texto, limite=5):
+        return [self._por_nombre[n].get("NOMBRE", n) for n in self._indice_nombres.parecidos(texto.lower(), limite)]
+
+    def buscar_por_ip(self, ip):
+        entero = ip_a_entero(ip)
+        return self._indice_ip.obtener(entero) if entero is not None else None
+
+    def ip_en_uso(self, ip, excluir=None):
+        """Devuelve el dispositivo (distinto de 'excluir') que ya usa la IP, o None."""
+        if not ip or ip == "N/A":
+            return None
+        encontrado = self.buscar_por_ip(ip)
+        return encontrado if encontrado is not excluir else None
+
+    def ips_asignadas(self):
+        """Copia de las IPs en uso, en orden. Segura para leer desde otro hilo (el monitor)."""
+        return [entero_a_ip(entero) for entero in list(self._indice_ip._enteros)]
+
+    # --- Consultas por red ---
+    def en_rango_ip(self, primera, ultima):
+        """Dispositivos con IP entre dos enteros (inclusive), ordenados por IP."""
+        return [disp for _, disp in self._indice_ip.en_rango(primera, ultima)]
+
+    def en_red(self, red):
+        """Dispositivos dentro de la red ('192.172.10.0/24'), ordenados por IP. Lanza ValueError si no es válida."""
+        return self.en_rango_ip(*rango_de_red(red))
+
+    def ips_libres(self, red, limite=None):
+        """Direcciones asignables sin usar de la red, en orden (hasta 'limite')."""
+        return [entero_a_ip(e) for e in itertools.islice(self._indice_ip.libres(*rango_asignable(red)), limite)]
+
+    def siguiente_ip_libre(self, red):
+        """Primera dirección asignable libre de la red, o None si está llena."""
+        primera, ultima = rango_asignable(red)
+        return next((entero_a_ip(e) for e in self._indice_ip.libres(primera, ultima)), None)
+
+    def resumen_red(self, red):
+        """Uso de la red: direcciones asignables, en uso y libres."""
+        primera, ultima = rango_asignable(red)
+        en_uso = self._indice_ip.contar_en_rango(primera, ultima)
+        return {"RED": str(ipaddress.IPv4Network(red, strict=False)) if isinstance(red, str) else str(red),
+                "ASIGNABLES": ultima - primera + 1, "EN_USO": en_uso, "LIBRES": ultima - primera + 1 - en_uso}
+
+    def por_tipo(self, tipo):
+        return list(self._por_tipo.get(tipo, {}).values())
+
+    def por_ubicacion(self, ubicacion):
+        return list(self._por_ubicacion.get(ubicacion, {}).values())
+
+    def por_servicio(self, servicio):
+        return list(self._por_servicio.get(servicio, {}).values())
+
+    def por_vlan(self, vlan):
+        return list(self._por_vlan.get(vlan, {}).values())
+
+    def por_vlans(self, mascara):
+        """Dispositivos que llevan al menos una VLAN del bitset (unión de las entradas del índice invertido)."""
+        resultado = {}
+        for vlan in vlans_de_mascara(mascara & self.mascara_vlans_en_uso()):
+            resultado.update(self._por_vlan[vlan])
+        return list(resultado.values())
+
+    def mascara_vlans_en_uso(self):
+        return mascara_de_vlans(self._por_vlan)
+
+    def vlans_exclusivas(self, dispositivos=None):
+        """VLANs configuradas en un solo dispositivo del grupo (por defecto, todo el inventario).
+
+        Devuelve [(dispositivo, vlans)] de los dispositivos que tienen alguna. Se recorre el grupo una vez
+        acumulando dos bitsets: 'una' (VLANs vistas exactamente una vez) y 'varias' (vistas dos o más veces).
+        """
+        mascaras = [(disp, disp.mascara_vlans()) for disp in (self._dispositivos if dispositivos is None else dispositivos)]
+        una = varias = 0
+        for _, mascara in mascaras:
+            varias |= una & mascara
+            una = (una | mascara) & ~varias
+        return [(disp, vlans_de_mascara(mascara & una)) for disp, mascara in mascaras if mascara & una]
+
+    # --- Estadísticas ---
+    def verificar_estadisticas(self, reparar=False):
+        """Compara los contadores con un recuento completo. Devuelve las claves que difieren ([] si coinciden).
+
+        Con 'reparar' los contadores se reconstruyen desde cero cuando hay diferencias.
+        """
+        esperado = contar_estadisticas(self._dispositivos)
+        actual = self.estadisticas.como_dict()
+        diferencias = [clave for clave in esperado if esperado[clave] != actual[clave]]
+        if diferencias and reparar:
+            self.reconstruir_estadisticas()
+        return diferencias
+
+    def reconstruir_estadisticas(self):
+        self.estadisticas.reiniciar()
+        for disp in self._dispositivos:
+            _, _, tipo, ubicacion, servicios, vlans = self._claves[id(disp)]
+            self.estadisticas.aplicar(tipo, ubicacion, servicios, vlans, 1)
+
+    # --- Acceso de solo lectura para el motor de consultas ---
+    def indice(self, campo):
+        """Índice {valor: {id(dispositivo): dispositivo}} de TIPO, UBICACION, SERVICIOS o VLANS. No modificar."""
+        return {"TIPO": self._por_tipo, "UBICACION": self._por_ubicacion,
+                "SERVICIOS": self._por_servicio, "VLANS": self._por_vlan}[campo]
+
+    def nombres_indexados(self):
+        return self._por_nombre.items()
+
+    def ips_indexadas(self):
+        """(IP, dispositivo) ordenados numéricamente por IP."""
+        return ((entero_a_ip(entero), disp) for entero, disp in self._indice_ip.items())
+
+
+# ---------------- CONSULTAS MULTICAMPO ----------------
+# Sintaxis: términos 'campo:valor' combinados con AND / OR / NOT (también Y, O, NO, &, |, -) y paréntesis.
+# Los términos seguidos sin operador se combinan con AND, que tiene prioridad sobre OR. Ejemplos:
+#   tipo:switch capa:core vlan:10
+#   (servicio:dns OR servicio:dhcp) AND ip:192.168.1.0/24 AND NOT nombre:lab*
+# Una palabra sin 'campo:' busca en el nombre. Los valores con espacios van entre comillas.
+CAMPOS_CONSULTA = {
+    "tipo": "TIPO", "capa": "UBICACION", "ubicacion": "UBICACION", "ubicación": "UBICACION",
+    "servicio": "SERVICIOS", "servicios": "SERVICIOS", "vlan": "VLANS", "vlans": "VLANS",
+    "ip": "IP", "nombre": "NOMBRE"
+}
+OPERADORES_CONSULTA = {"and": "and", "y": "and", "&": "and", "&&": "and",
+                       "or": "or", "o": "or", "|": "or", "||": "or",
+                       "not": "not", "no": "not", "-": "not", "!": "not"}
+_PATRON_TOKEN_CONSULTA = re.compile(r'\s*(\(|\)|&&|\|\||[&|!]|-(?=\S)|[^\s()"]+:"[^"]*"|"[^"]*"|[^\s()]+)')
+
+def _sin_tildes(texto):
+    return "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c)).lower()
+
+def _resolver_valores_opcion(valor, opciones_dict, etiqueta):
+    """Valores mostrados que coinciden con 'valor': clave o texto exacto, o si no, los que lo contienen ('core')."""
+    try:
+        return {normalizar_opcion(valor, opciones_dict, etiqueta)}
+    except ValueError:
+        buscado = _sin_tildes(valor)
+        coincidencias = {mostrado for clave, mostrado in opciones_dict.items()
+                         if buscado in clave.lower() or buscado in _sin_tildes(mostrado)}
+        if not coincidencias:
+            raise
+        return coincidencias
+
+def _compilar_termino(campo, valor):
+    """Traduce 'campo:valor' a un término listo para evaluar. Lanza ValueError si el valor no es válido."""
+    if not valor:
+        raise ValueError(f"Falta el valor para '{campo}:'.")
+    campo_interno = CAMPOS_CONSULTA.get(campo.lower())
+    if campo_interno is None:
+        raise ValueError(f"Campo de consulta '{campo}' no reconocido. Campos: {', '.join(sorted(set(CAMPOS_CONSULTA) - {'ubicación'}))}")
+    if campo_interno in ("TIPO", "UBICACION", "SERVICIOS"):
+        opciones = {"TIPO": TIPOS_DISPOSITIVO, "UBICACION": CAPAS_RED, "SERVICIOS": SERVICIOS_VALIDOS}[campo_interno]
+        valores = _resolver_valores_opcion(valor, opciones, campo.capitalize())
+        if campo_interno == "UBICACION" and valor.upper() == "N/A":
+            valores = {"N/A"}
+        return ("indice", campo_interno, valores)
+    if campo_interno == "VLANS":
+        rango = re.fullmatch(r"(\d+)(?:-(\d+))?", valor)
+        if not rango:
+            raise ValueError(f"VLAN '{valor}' no válida. Use un número o un rango (ej: 10 o 10-20).")
+        desde, hasta = int(rango.group(1)), int(rango.group(2) or rango.group(1))
+        return ("vlan", desde, hasta)
+    if campo_interno == "IP":
+        if "/" in valor:
+            return ("red", rango_de_red(valor))
+        entero = ip_a_entero(valor)
+        if entero is not None: # IP completa: coincidencia exacta
+            return ("red", (entero, entero))
+        rangos = _rangos_de_prefijo_ip(valor)
+        if rangos is not None: # Se resuelve con el índice de IPs en vez de comparar cadenas
+            return rangos[0] if len(rangos) == 1 else ("or", rangos)
+        return ("prefijo_ip", valor)
+    patron = valor.lower()
+    if any(c in patron for c in "*?["):
+        prefijo_fijo = re.split(r"[*?\[]", patron, maxsplit=1)[0]
+        return ("patron_nombre", re.compile(fnmatch.translate(patron)), prefijo_fijo)
+    return ("texto_nombre", patron)
+
+def _rangos_de_prefijo_ip(prefijo):
+    """'10.0.3.' -> la red 10.0.3.0/24; '10.0.1' -> 10.0.1.x, 10.0.10-19.x y 10.0.100-199.x. None si no aplica."""
+    octetos = prefijo.split(".")
+    fijos, parcial = octetos[:-1], octetos[-1]
+    if not 1 <= len(octetos) <= 4 or not all(o.isascii() and o.isdigit() and int(o) <= 255 for o in fijos):
+        return None
+    if parcial and not (parcial.isascii() and parcial.isdigit()):
+        return None
+    posicion = len(fijos) # Octeto (0-3) que completa el prefijo parcial
+    if posicion > 3:
+        return None
+    base = 0
+    for octeto in fijos:
+        base = (base << 8) | int(octeto)
+    base <<= 8 * (4 - len(fijos))
+    paso = 1 << 8 * (3 - posicion) # Direcciones por cada valor del octeto parcial
+    valores = [v for v in range(256) if str(v).startswith(parcial)] if parcial else list(range(256))
+    rangos = []
+    for _, grupo in itertools.groupby(enumerate(valores), key=lambda par: par[1] - par[0]): # Valores consecutivos
+        grupo = [v for _, v in grupo]
+        rangos.append(("red", (base + grupo[0] * paso, base + (grupo[-1] + 1) * paso - 1)))
+    return rangos or None
+
+def analizar_consulta(texto):
+    """Convierte el texto de la consulta en un árbol: ('and'|'or', [hijos]), ('not', hijo) o un término."""
+    tokens = []
+    posicion = 0
+    texto = texto.strip()
+    while posicion < len(texto):
+        coincidencia = _PATRON_TOKEN_CONSULTA.match(texto, posicion)
+        if not coincidencia:
+            raise ValueError(f"No se pudo interpretar la consulta a partir de '{texto[posicion:]}'.")
+        tokens.append(coincidencia.group(1))
+        posicion = coincidencia.end()
+    if not tokens:
+        raise ValueError("La consulta está vacía.")
+
+    def operador(token):
+        return OPERADORES_CONSULTA.get(token.lower()) if token and ":" not in token else None
+
+    def expresion_or(i):
+        hijos = []
+        nodo, i = expresion_and(i)
+        hijos.append(nodo)
+        while i < len(tokens) and operador(tokens[i]) == "or":
+            nodo, i = expresion_and(i + 1)
+            hijos.append(nodo)
+        return (hijos[0] if len(hijos) == 1 else ("or", hijos)), i
+
+    def expresion_and(i):
+        hijos = []
+        nodo, i = expresion_not(i)
+        hijos.append(nodo)
+        while i < len(tokens) and tokens[i] != ")" and operador(tokens[i]) != "or":
+            if operador(tokens[i]) == "and":
+                i += 1
+            nodo, i = expresion_not(i)
+            hijos.append(nodo)
+        return (hijos[0] if len(hijos) == 1 else ("and", hijos)), i
+
+    def expresion_not(i):
+        if i < len(tokens) and operador(tokens[i]) == "not":
+            nodo, i = expresion_not(i + 1)
+            return ("not", nodo), i
+        return primario(i)
+
+    def primario(i):
+        if i >= len(tokens):
+            raise ValueError("La consulta termina de forma inesperada.")
+        token = tokens[i]
+        if token == "(":
+            nodo, i = expresion_or(i + 1)
+            if i >= len(tokens) or tokens[i] != ")":
+                raise ValueError("Falta un paréntesis de cierre.")
+            return nodo, i + 1
+        if token == ")" or operador(token):
+            raise ValueError(f"Se esperaba un término y se encontró '{token}'.")
+        campo, separador, valor = token.partition(":")
+        if not separador: # Palabra suelta: búsqueda por nombre
+            campo, valor = "nombre", token
+        return _compilar_termino(campo, valor.strip('"')), i + 1
+
+    arbol, i = expresion_or(0)
+    if i != len(tokens):
+        raise ValueError(f"Sobra '{tokens[i]}' al final de la consulta.")
+    return arbol
+
+def _usa_indice(nodo):
+    """True si el nodo se resuelve solo con índices hash (sin recorrer registros)."""
+    if nodo[0] in ("indice", "vlan", "red"):
+        return True
+    if nodo[0] in ("and", "or"):
+        return all(_usa_indice(hijo) for hijo in nodo[1]) if nodo[0] == "or" else any(_usa_indice(hijo) for hijo in nodo[1])
+    return False
+
+def _predicado(nodo):
+    """Compila el nodo a una función disp -> bool (para filtrar candidatos ya acotados por un índice)."""
+    tipo = nodo[0]
+    if tipo in ("and", "or"):
+        hijos = [_predicado(hijo) for hijo in nodo[1]]
+        combinar = all if tipo == "and" else any
+        return lambda disp: combinar(hijo(disp) for hijo in hijos)
+    if tipo == "not":
+        hijo = _predicado(nodo[1])
+        return lambda disp: not hijo(disp)
+    if tipo == "indice":
+        campo, valores = nodo[1], nodo[2]
+        if campo == "SERVICIOS":
+            return lambda disp: not valores.isdisjoint(disp.get(campo, []))
+        return lambda disp: disp.get(campo, "N/A") in valores
+    if tipo == "vlan":
+        desde, hasta = nodo[1], nodo[2]
+        return lambda disp: any(desde <= vlan <= hasta for vlan in disp.get("VLANS", []))
+    if tipo == "red":
+        primera, ultima = nodo[1]
+        def en_red(disp):
+            entero = ip_a_entero(disp.get("IP", ""))
+            return entero is not None and primera <= entero <= ultima
+        return en_red
+    if tipo == "prefijo_ip":
+        prefijo = nodo[1]
+        return lambda disp: disp.get("IP", "").startswith(prefijo)
+    if tipo == "patron_nombre":
+        coincide = nodo[1].match
+        return lambda disp: coincide(disp.get("NOMBRE", "").lower()) is not None
+    texto = nodo[1]
+    return lambda disp: texto in disp.get("NOMBRE", "").lower()
+
+def _evaluar_nodo(repositorio, nodo):
+    """Devuelve {id(dispositivo): dispositivo} con los que cumplen el nodo."""
+    tipo = nodo[0]
+    if tipo == "and":
+        # Los términos con índice acotan los candidatos; el resto se comprueba solo sobre ellos
+        indexados = [hijo for hijo in nodo[1] if _usa_indice(hijo)]
+        filtros = [hijo for hijo in nodo[1] if not _usa_indice(hijo)]
+        if not indexados:
+            filtros.sort(key=lambda hijo: hijo[0] == "not") # Un NOT como punto de partida devolvería casi todo
+            indexados = [filtros.pop(0)]
+        parciales = sorted((_evaluar_nodo(repositorio, hijo) for hijo in indexados), key=len) # Se intersecta desde el menor
+        resultado = parciales[0]
+        for parcial in parciales[1:]:
+            resultado = {clave: disp for clave, disp in resultado.items() if clave in parcial}
+        if filtros:
+            cumple = _predicado(("and", filtros)) if len(filtros) > 1 else _predicado(filtros[0])
+            resultado = {clave: disp for clave, disp in resultado.items() if cumple(disp)}
+        return resultado
+    if tipo == "or":
+        resultado = {} # Diccionario nuevo: los de los hijos pueden ser los propios índices
+        for hijo in nodo[1]:
+            resultado.update(_evaluar_nodo(repositorio, hijo))
+        return resultado
+    if tipo == "not":
+        excluidos = _evaluar_nodo(repositorio, nodo[1])
+        return {id(d): d for d in repositorio if id(d) not in excluidos}
+    if tipo == "indice":
+        indice = repositorio.indice(nodo[1])
+        if len(nodo[2]) == 1:
+            return indice.get(next(iter(nodo[2])), {}) # El propio índice, sin copiarlo (nunca se modifica aquí)
+        resultado = {}
+        for valor in nodo[2]:
+            resultado.update(indice.get(valor, {}))
+        return resultado
+    if tipo == "vlan":
+        indice = repositorio.indice("VLANS")
+        if nodo[1] == nodo[2]:
+            return indice.get(nodo[1], {})
+        resultado = {}
+        if nodo[2] - nodo[1] < len(indice): # Rango corto: se consulta VLAN a VLAN
+            for vlan in range(nodo[1], nodo[2] + 1):
+                resultado.update(indice.get(vlan, {}))
+        else:
+            for vlan, dispositivos in indice.items():
+                if nodo[1] <= vlan <= nodo[2]:
+                    resultado.update(dispositivos)
+        return resultado
+    if tipo == "red":
+        return {id(disp): disp for disp in repositorio.en_rango_ip(*nodo[1])} # Búsqueda binaria en el índice de IPs
+    if tipo == "prefijo_ip":
+        return {id(disp): disp for ip, disp in repositorio.ips_indexadas() if ip.startswith(nodo[1])}
+    if tipo == "patron_nombre":
+        if nodo[2]: # El patrón empieza con texto fijo ('sw-*'): solo se revisan los nombres con ese prefijo
+            candidatos = ((d.get("NOMBRE", "").lower(), d) for d in repositorio.con_prefijo_nombre(nodo[2]))
+        else:
+            candidatos = repositorio.nombres_indexados()
+        return {id(disp): disp for nombre, disp in candidatos if nodo[1].match(nombre)}
+    return {id(disp): disp for disp in repositorio.nombres_que_contienen(nodo[1])} # texto_nombre
+
+def consultar_dispositivos(repositorio, consulta):
+    """Dispositivos que cumplen la consulta multicampo ('texto' o árbol ya analizado). Lanza ValueError si no es válida.
+
+    Solo se recorren los índices implicados; el resultado no se reordena (el paginador permite ordenarlo).
+    """
+    if not isinstance(consulta, tuple):
+        consulta = analizar_consulta(consulta)
+    return list(_evaluar_nodo(repositorio, consulta).values())
+
+
+# ---------------- FUNCIONES DE MENÚ Y NAVEGACIÓN ----------------
+# Cada pantalla recibe el repositorio y devuelve qué hacer al terminar; main() es el único bucle que las
+# ejecuta, así que navegar no anida llamadas y la pila de Python no crece en toda la sesión.
+#   None o NAV_VOLVER -> cerrar la pantalla y volver a la anterior
+#   NAV_PRINCIPAL     -> volver al menú principal
+#   NAV_SALIR         -> pedir confirmación para salir (si se cancela, se repite la pantalla actual)
+#   NAV_REPETIR       -> volver a mostrar la pantalla actual desde el principio
+#   una función       -> abrir esa pantalla encima de la actual
+NAV_VOLVER = "b"
+NAV_PRINCIPAL = "m"
+NAV_SALIR = "s"
+NAV_REPETIR = "repetir"
+ACCIONES_NAVEGACION = (NAV_VOLVER, NAV_PRINCIPAL, NAV_SALIR) # Las que el usuario puede escribir
 
 def salir_del_programa():
+    """Pide confirmación y termina el programa. Si el usuario cancela, simplemente retorna."""
     mostrar_titulo("SALIR DEL PROGRAMA")
     confirmar = input(f"{Color.YELLOW}❓ ¿Está seguro de que desea salir? (s/n): {Color.END}").lower()
     if confirmar == 's':
         mostrar_barra_progreso(1, "Cerrando sesión y saliendo...", sufijo="¡Hasta pronto! 👋")
         limpiar_pantalla(); sys.exit()
     else:
-        mostrar_mensaje("Operación cancelada.", "info"); sleep(1)
-        if menu_history: menu_history[-1]()
-        else: main()
+        mostrar_mensaje("Operación cancelada.", "info"); pausa(1)
+
+def mostrar_opciones_navegacion(es_menu_principal=False):
+    """Imprime las opciones de navegación y lee la opción elegida.
 
-def mostrar_opciones_navegacion(menu_actual_func, es_menu_principal=False):
+    Devuelve lo que escribió el usuario; si es una de las opciones de navegación mostradas, la pantalla debe
+    devolverla tal cual al despachador.
+    """
     print(f"\n{Color.BLUE}{'─' * 70}{Color.END}")
     opciones_nav = {}
     if not es_menu_principal and len(menu_history) > 1:
-        opciones_nav['b'] = (f"{Color.YELLOW}b. ⬅️ Volver al Menú Anterior{Color.END}", lambda: pop_menu_history()())
+        opciones_nav[NAV_VOLVER] = f"{Color.YELLOW}b. ⬅️ Volver al Menú Anterior{Color.END}"
     if not es_menu_principal:
-        opciones_nav['m'] = (f"{Color.YELLOW}m. 🏠 Volver al Menú Principal{Color.END}", ir_a_menu_principal)
-    opciones_nav['s'] = (f"{Color.YELLOW}s. 🚪 Salir del Programa (Directo){Color.END}", salir_del_programa)
-
-    if not opciones_nav and es_menu_principal:
-        print(f"{Color.BLUE}{'─' * 70}{Color.END}")
-        return input(f"{Color.GREEN}↳ Seleccione una opción del menú: {Color.END}").strip().lower()
+        opciones_nav[NAV_PRINCIPAL] = f"{Color.YELLOW}m. 🏠 Volver al Menú Principal{Color.END}"
+    opciones_nav[NAV_SALIR] = f"{Color.YELLOW}s. 🚪 Salir del Programa (Directo){Color.END}"
 
-    for _, (texto, _) in opciones_nav.items(): print(texto)
+    for texto in opciones_nav.values(): print(texto)
     print(f"{Color.BLUE}{'─' * 70}{Color.END}")
 
-    while True:
-        prompt_partes = ["↳ Seleccione opción del menú"]
-        nav_keys = list(opciones_nav.keys())
-        if nav_keys: prompt_partes.append(f"o navegación ({', '.join(nav_keys)})")
-
-        opcion_input = input(f"{Color.GREEN}{' '.join(prompt_partes)}: {Color.END}").strip().lower()
-
-        if opcion_input in opciones_nav:
-            _, funcion_nav = opciones_nav[opcion_input]
-            if funcion_nav.__code__.co_name == "<lambda>":
-                funcion_destino = pop_menu_history()
-                if funcion_destino:
-                    mostrar_barra_progreso(0.5, "Volviendo...")
-                    funcion_destino()
-                    return None
-                else:
-                    mostrar_mensaje("No hay menú anterior o error de navegación.", "info")
-                    sleep(1)
-                    menu_actual_func()
-                    return None
-            else:
-                funcion_nav()
-                return None
-        else:
-            return opcion_input
+    prompt_partes = ["↳ Seleccione opción del menú", f"o navegación ({', '.join(opciones_nav)})"]
+    return input(f"{Color.GREEN}{' '.join(prompt_partes)}: {Color.END}").strip().lower()
 
 
 # ------------------- FUNCIONALIDAD DE PING (MEJORADA) -------------------
-def hacer_ping(ip_address):
+PING_CONTEO_PREDETERMINADO = 4
+PING_TIMEOUT_PREDETERMINADO = 10 # Segundos por host
+PING_CONCURRENCIA_PREDETERMINADA = 32 # Pings simultáneos en un barrido
+MOTOR_SONDEO = os.environ.get("P1_MOTOR_SONDEO", "auto") # 'auto', 'icmp', 'tcp' o 'subprocess'
+PUERTO_TCP_SONDEO = int(os.environ.get("P1_PUERTO_TCP_SONDEO", "22")) # Puerto usado por el motor 'tcp'
+
+def _detectar_fallo_logico_ping(salida):
+    """Revisa la salida de un ping con código 0 para detectar pérdida total de paquetes."""
+    fallo_logico = False
+    if platform.system().lower() != 'windows':
+        if "0 received" in salida or \
+           "100.0% packet loss" in salida or \
+           "100% packet loss" in salida:
+            fallo_logico = True
+    elif platform.system().lower() == 'windows':
+         if "Host de destino inaccesible." in salida or \
+            "Destination host unreachable." in salida or \
+            "Tiempo de espera agotado para esta solicitud." in salida or \
+            "Request timed out." in salida or \
+            "inaccesible" in salida.lower() or \
+            "unreachable" in salida.lower():
+            if "recibidos = 0" in salida or "Received = 0" in salida:
+                 fallo_logico = True
+         elif 'ttl=' not in salida.lower():
+                match_perdida_total = re.search(r"(perdidos|Lost)\s*=\s*4\s*\(100%\s*(pérdida|loss)\)", salida)
+                if match_perdida_total:
+                    fallo_logico = True
+         elif 'bytes=' not in salida.lower() and 'tiempo=' not in salida.lower() and 'time=' not in salida.lower():
+                     fallo_logico = True
+    return fallo_logico
+
+MetricasPing = namedtuple("MetricasPing", "formato enviados recibidos perdida rtts rtt_min rtt_prom rtt_max rtt_mdev errores duplicados")
+MetricasPing.__doc__ = """Lo que informa el comando ping: conteos, % de pérdida y latencias en ms (None si no las imprimió)."""
+
+# Líneas de iputils (Linux), BusyBox y Windows. Todas se buscan línea a línea, sin depender del orden.
+# Windows en español abrevia las respuestas de menos de 1 ms como 'tiempo<1m'
+_PATRON_RESPUESTA_PING = re.compile(r"(?:bytes from|Respuesta desde|Reply from)\b.*?(?:time|tiempo)[=<]\s*([\d.]+)\s*ms?(.*)$", re.IGNORECASE)
+_PATRON_TOTALES_PING = re.compile(r"^(\d+) packets transmitted, (\d+) (?:packets )?received(.*)$")
+_PATRON_EXTRA_PING = re.compile(r"\+(\d+) (errors|duplicates)")
+_PATRON_INALCANZABLE_PING = re.compile(r"unreachable|inaccesible", re.IGNORECASE)
+_PATRON_PERDIDA_PING = re.compile(r"([\d.]+)% (?:packet loss|perdidos|loss)")
+_PATRON_RTT_PING = re.compile(r"^(?:rtt|round-trip) min/avg/max(/mdev|/stddev)? = ([\d.]+)/([\d.]+)/([\d.]+)(?:/([\d.]+))? ms")
+_PATRON_TOTALES_PING_WINDOWS = re.compile(r"(?:enviados|Sent) = (\d+), (?:recibidos|Received) = (\d+)")
+_PATRON_RTT_PING_WINDOWS = re.compile(r"(?:Mínimo|Minimum) = (\d+)ms, (?:Máximo|Maximum) = (\d+)ms, (?:Media|Average) = (\d+)ms")
+
+def _desviacion_rtt(rtts_ms):
+    """Desviación media cuadrática de las latencias, calculada igual que la 'mdev' de iputils."""
+    media = sum(rtts_ms) / len(rtts_ms)
+    return max(0.0, sum(rtt * rtt for rtt in rtts_ms) / len(rtts_ms) - media * media) ** 0.5
+
+def analizar_salida_ping(salida):
+    """Convierte la salida del comando ping (iputils, BusyBox o Windows) en un MetricasPing.
+
+    Devuelve None si no se reconoce la línea de totales (salida truncada o en un formato desconocido).
+    Las respuestas duplicadas no cuentan como recibidas. En Windows, un 'Destination host unreachable'
+    enviado por un router cuenta como recibido en los totales del comando, por lo que allí se usan
+    solo las respuestas con latencia.
+    """
+    formato, enviados, recibidos, perdida = None, None, None, None
+    errores = duplicados = inalcanzables = 0
+    rtt_resumen = None
+    rtts = []
+    for linea in salida.splitlines():
+        linea = linea.strip()
+        match = _PATRON_RESPUESTA_PING.search(linea)
+        if match:
+            if "DUP!" not in match.group(2):
+                rtts.append(float(match.group(1)))
+            continue
+        if _PATRON_INALCANZABLE_PING.search(linea):
+            inalcanzables += 1
+            continue
+        match = _PATRON_TOTALES_PING.match(linea)
+        if match:
+            enviados, recibidos = int(match.group(1)), int(match.group(2))
+            for cantidad, tipo in _PATRON_EXTRA_PING.findall(match.group(3)):
+                if tipo == "errors":
+                    errores = int(cantidad)
+                else:
+                    duplicados = int(cantidad)
+            match_perdida = _PATRON_PERDIDA_PING.search(match.group(3))
+            perdida = float(match_perdida.group(1)) if match_perdida else None
+            formato = "busybox" if "packets received" in linea else "iputils"
+            continue
+        match = _PATRON_RTT_PING.match(linea)
+        if match:
+            rtt_resumen = tuple(float(v) if v is not None else None for v in match.groups()[1:])
+            continue
+        match = _PATRON_TOTALES_PING_WINDOWS.search(linea)
+        if match:
+            formato = "windows"
+            enviados, recibidos = int(match.group(1)), int(match.group(2))
+            continue
+        match = _PATRON_RTT_PING_WINDOWS.search(linea)
+        if match:
+            minimo, maximo, media = (float(v) for v in match.groups())
+            rtt_resumen = (minimo, media, maximo, None)
+
+    if formato is None:
+        return None
+    if formato == "windows":
+        recibidos = min(recibidos, len(rtts))
+        perdida = None
+    if perdida is None:
+        perdida = round(100.0 * (enviados - recibidos) / enviados, 1) if enviados else 100.0
+    if rtt_resumen is None and rtts:
+        rtt_resumen = (min(rtts), sum(rtts) / len(rtts), max(rtts), None)
+    if rtt_resumen is not None and rtt_resumen[3] is None and rtts: # BusyBox y Windows no informan la desviación
+        rtt_resumen = rtt_resumen[:3] + (round(_desviacion_rtt(rtts), 3),)
+    errores = max(errores, inalcanzables)
+    rtt_min, rtt_prom, rtt_max, rtt_mdev = rtt_resumen if recibidos and rtt_resumen else (None, None, None, None)
+    return MetricasPing(formato, enviados, recibidos, perdida, tuple(rtts), rtt_min, rtt_prom, rtt_max, rtt_mdev, errores, duplicados)
+
+class MotorSondeoNoDisponible(Exception):
+    """El motor de sondeo pedido no puede usarse en este sistema."""
+
+def _resultado_sondeo_base(ip_address, motor, conteo):
+    """Estructura común del resultado de un sondeo, sea cual sea el motor usado."""
+    return {
+        "IP": ip_address,
+        "MOTOR": motor,
+        "ALCANZABLE": False,
+        "ENVIADOS": conteo,
+        "RECIBIDOS": 0,
+        "PERDIDA": 100.0, # Porcentaje
+        "RTT_MIN": None, # Milisegundos
+        "RTT_PROM": None,
+        "RTT_MAX": None,
+        "RTT_MDEV": None, # Desviación de las latencias, como la 'mdev' de iputils
+        "RTTS": [], # Latencia de cada respuesta, en orden de llegada
+        "CODIGO": None, # Solo para el motor 'subprocess'
+        "SALIDA": "",
+        "ERROR": "",
+        "DETALLE": "",
+        "DURACION": 0.0,
+        "EN_CACHE": False, # True si el resultado viene de CACHE_SONDEOS y no de un sondeo nuevo
+        "EDAD": 0.0 # Segundos desde que se hizo el sondeo
+    }
+
+def _completar_estadisticas_rtt(resultado, rtts_ms):
+    """Rellena recibidos, pérdida y RTT mín/prom/máx a partir de las latencias medidas."""
+    resultado["RECIBIDOS"] = len(rtts_ms)
+    if resultado["ENVIADOS"]:
+        resultado["PERDIDA"] = round(100.0 * (resultado["ENVIADOS"] - len(rtts_ms)) / resultado["ENVIADOS"], 1)
+    if rtts_ms:
+        resultado["ALCANZABLE"] = True
+        resultado["RTT_MIN"] = round(min(rtts_ms), 3)
+        resultado["RTT_PROM"] = round(sum(rtts_ms) / len(rtts_ms), 3)
+        resultado["RTT_MAX"] = round(max(rtts_ms), 3)
+        resultado["RTT_MDEV"] = round(_desviacion_rtt(rtts_ms), 3)
+        resultado["RTTS"] = [round(rtt, 3) for rtt in rtts_ms]
+        resultado["DETALLE"] = f"{len(rtts_ms)}/{resultado['ENVIADOS']} resp., prom {resultado['RTT_PROM']:.2f} ms"
+    else:
+        resultado["DETALLE"] = "Sin respuesta (100% de pérdida)"
+    return resultado
+
+def _checksum_icmp(datos):
+    if len(datos) % 2:
+        datos += b'\x00'
+    suma = sum(struct.unpack(f"!{len(datos) // 2}H", datos))
+    suma = (suma >> 16) + (suma & 0xFFFF)
+    suma += suma >> 16
+    return ~suma & 0xFFFF
+
+def _abrir_socket_icmp():
+    """Abre un socket ICMP sin privilegios (SOCK_DGRAM) o, si no se permite, uno raw."""
+    for tipo_socket in (socket.SOCK_DGRAM, socket.SOCK_RAW):
+        try:
+            return socket.socket(socket.AF_INET, tipo_socket, socket.IPPROTO_ICMP)
+        except OSError:
+            continue
+    raise MotorSondeoNoDisponible("El sistema no permite sockets ICMP (ni sin privilegios ni raw).")
+
+_secuencia_icmp = itertools.count(1)
+
+def _sondear_icmp(ip_address, conteo, timeout):
+    """Ping en proceso mediante sockets ICMP, sin lanzar el binario 'ping'."""
+    resultado = _resultado_sondeo_base(ip_address, "icmp", conteo)
+    espera_por_paquete = max(timeout / conteo, 0.05) if conteo else timeout
+    identificador = (os.getpid() + next(_secuencia_icmp)) & 0xFFFF
+    rtts_ms = []
+    with _abrir_socket_icmp() as sock:
+        for secuencia in range(1, conteo + 1):
+            cabecera = struct.pack("!BBHHH", 8, 0, 0, identificador, secuencia)
+            carga = b"P1-PING" + bytes(49)
+            paquete = struct.pack("!BBHHH", 8, 0, _checksum_icmp(cabecera + carga), identificador, secuencia) + carga
+            envio = perf_counter()
+            limite = envio + espera_por_paquete
+            try:
+                sock.sendto(paquete, (ip_address, 0))
+            except OSError as e:
+                resultado["DETALLE"] = f"Error de envío: {e}"
+                return resultado
+            while True:
+                restante = limite - perf_counter()
+                if restante <= 0 or not select.select([sock], [], [], restante)[0]:
+                    break
+                datos, origen = sock.recvfrom(2048)
+                if origen[0] != ip_address:
+                    continue
+                if datos and datos[0] >> 4 == 4: # Respuesta con cabecera IP (socket raw o macOS)
+                    datos = datos[(datos[0] & 0x0F) * 4:]
+                if len(datos) < 8:
+                    continue
+                tipo_icmp, _, _, id_respuesta, seq_respuesta = struct.unpack("!BBHHH", datos[:8])
+                # Con SOCK_DGRAM el kernel reescribe el identificador, por eso solo se exige con sockets raw
+                if tipo_icmp == 0 and seq_respuesta == secuencia and (sock.type == socket.SOCK_DGRAM or id_respuesta == identificador):
+                    rtts_ms.append((perf_counter() - envio) * 1000)
+                    break
+    return _completar_estadisticas_rtt(resultado, rtts_ms)
+
+def _sondear_tcp(ip_address, conteo, timeout, puerto=None):
+    """Comprueba la alcanzabilidad abriendo conexiones TCP a un puerto.
+
+    Un rechazo de conexión (RST) también cuenta como respuesta: el host está vivo aunque el puerto esté cerrado.
+    """
+    puerto = puerto or PUERTO_TCP_SONDEO
+    resultado = _resultado_sondeo_base(ip_address, f"tcp/{puerto}", conteo)
+    espera_por_intento = max(timeout / conteo, 0.05) if conteo else timeout
+    rtts_ms = []
+    for _ in range(conteo):
+        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as sock:
+            sock.settimeout(espera_por_intento)
+            inicio = perf_counter()
+            try:
+                sock.connect((ip_address, puerto))
+                rtts_ms.append((perf_counter() - inicio) * 1000)
+            except ConnectionRefusedError:
+                rtts_ms.append((perf_counter() - inicio) * 1000)
+            except OSError:
+                continue
+    return _completar_estadisticas_rtt(resultado, rtts_ms)
+
+def _sondear_subprocess(ip_address, conteo, timeout):
+    """Ejecuta el binario 'ping' del sistema e interpreta su salida."""
+    param_conteo = '-n' if platform.system().lower() == 'windows' else '-c'
+    comando = ['ping', param_conteo, str(conteo), ip_address]
+    resultado = _resultado_sondeo_base(ip_address, "subprocess", conteo)
+    try:
+        resultado_proceso = subprocess.run(comando, capture_output=True, text=True, timeout=timeout, check=False, errors='replace')
+    except subprocess.TimeoutExpired:
+        resultado["DETALLE"] = f"Tiempo de espera agotado ({timeout} s)"
+        return resultado
+    except FileNotFoundError:
+        raise MotorSondeoNoDisponible("Comando 'ping' no encontrado")
+
+    resultado["CODIGO"] = resultado_proceso.returncode
+    resultado["SALIDA"] = resultado_proceso.stdout or ""
+    resultado["ERROR"] = resultado_proceso.stderr or ""
+    salida = resultado["SALIDA"]
+
+    metricas = analizar_salida_ping(salida)
+    if metricas is not None:
+        resultado.update(ENVIADOS=metricas.enviados, RECIBIDOS=metricas.recibidos, PERDIDA=metricas.perdida, RTTS=list(metricas.rtts),
+                         RTT_MIN=metricas.rtt_min, RTT_PROM=metricas.rtt_prom, RTT_MAX=metricas.rtt_max, RTT_MDEV=metricas.rtt_mdev)
+        if metricas.recibidos:
+            resultado["ALCANZABLE"] = True
+            resultado["DETALLE"] = f"{metricas.recibidos}/{metricas.enviados} resp." + \
+                (f", prom {metricas.rtt_prom:.2f} ms" if metricas.rtt_prom is not None else "")
+        elif metricas.errores:
+            resultado["DETALLE"] = f"Host inalcanzable ({metricas.errores} errores ICMP)"
+        else:
+            resultado["DETALLE"] = "Sin respuesta (100% de pérdida)"
+    elif resultado_proceso.returncode == 0: # Salida en un formato que no se reconoce
+        if _detectar_fallo_logico_ping(salida):
+            resultado["DETALLE"] = "Pérdida total de paquetes o host inalcanzable"
+        else:
+            resultado["ALCANZABLE"] = True
+            resultado["DETALLE"] = f"{resultado['RECIBIDOS']}/{resultado['ENVIADOS']} resp." + \
+                (f", prom {resultado['RTT_PROM']:.2f} ms" if resultado["RTT_PROM"] is not None else "")
+    else:
+        resultado["DETALLE"] = f"Código de retorno {resultado_proceso.returncode}"
+    return resultado
+
+MOTORES_SONDEO = {
+    'icmp': _sondear_icmp,
+    'tcp': _sondear_tcp,
+    'subprocess': _sondear_subprocess
+}
+ORDEN_MOTORES_AUTO = ['icmp', 'subprocess', 'tcp'] # Orden de prueba con MOTOR_SONDEO = 'auto'
+_motores_no_disponibles = set()
+
+def ejecutar_ping(ip_address, conteo=PING_CONTEO_PREDETERMINADO, timeout=PING_TIMEOUT_PREDETERMINADO, motor=None):
+    """Sondea una IP sin interacción y devuelve un diccionario con el resultado.
+
+    'motor' puede ser 'icmp', 'tcp', 'subprocess' o 'auto' (por defecto MOTOR_SONDEO). En modo 'auto'
+    se prueba cada motor de ORDEN_MOTORES_AUTO y se recuerda cuáles no están disponibles en este sistema.
+    No imprime nada, por lo que puede usarse desde varios hilos a la vez (barridos).
+    """
+    motor = motor or MOTOR_SONDEO
+    candidatos = [m for m in ORDEN_MOTORES_AUTO if m not in _motores_no_disponibles] if motor == 'auto' else [motor]
+    if not candidatos:
+        candidatos = ['subprocess']
+
+    inicio = perf_counter()
+    resultado = None
+    for nombre_motor in candidatos:
+        funcion_motor = MOTORES_SONDEO.get(nombre_motor)
+        if funcion_motor is None:
+            resultado = _resultado_sondeo_base(ip_address, nombre_motor, conteo)
+            resultado["DETALLE"] = f"Motor de sondeo desconocido: '{nombre_motor}'"
+            break
+        try:
+            resultado = funcion_motor(ip_address, conteo, timeout)
+            break
+        except MotorSondeoNoDisponible as e:
+            if motor == 'auto':
+                _motores_no_disponibles.add(nombre_motor)
+            resultado = _resultado_sondeo_base(ip_address, nombre_motor, conteo)
+            resultado["DETALLE"] = str(e)
+        except Exception as e:
+            resultado = _resultado_sondeo_base(ip_address, nombre_motor, conteo)
+            resultado["DETALLE"] = f"Error inesperado: {e}"
+            break
+    resultado["DURACION"] = perf_counter() - inicio
+    return resultado
+
+def hacer_ping(ip_address, forzar=False):
+    """Ping interactivo a una IP. Si hay un resultado reciente en CACHE_SONDEOS se muestra ese, salvo con 'forzar'."""
     if not ip_address or ip_address == "N/A":
         mostrar_mensaje("Este dispositivo no tiene una IP asignada para hacer ping.", "advertencia", esperar_enter=True)
         return
 
-    param_conteo = '-n' if platform.system().lower() == 'windows' else '-c'
-    comando = ['ping', param_conteo, '4', ip_address]
-
     mostrar_titulo(f"PING A {ip_address}")
-    print(f"{Color.CYAN}Ejecutando comando: {' '.join(comando)}{Color.END}\n")
-    print(f"{Color.YELLOW}Enviando paquetes, por favor espere (timeout 10s)...{Color.END}\n")
-
-    try:
-        resultado_proceso = subprocess.run(comando, capture_output=True, text=True, timeout=10, check=False, errors='replace')
+    resultado = None if forzar else CACHE_SONDEOS.obtener(ip_address)
+    if resultado is None:
+        print(f"{Color.CYAN}Motor de sondeo: {MOTOR_SONDEO}{Color.END}\n")
+        print(f"{Color.YELLOW}Enviando {PING_CONTEO_PREDETERMINADO} paquetes, por favor espere (timeout {PING_TIMEOUT_PREDETERMINADO}s)...{Color.END}\n")
+        resultado = sondear_con_cache(ip_address, forzar=True)
+    else:
+        print(f"{Color.DARKCYAN}🗃️  Resultado en caché de hace {resultado['EDAD']:.0f} s (vigencia {CACHE_SONDEOS.ttl:.0f} s).{Color.END}\n")
 
+    if resultado["SALIDA"] or resultado["ERROR"]:
         print(f"{Color.BLUE}{'-'*30} INICIO SALIDA PING {'-'*30}{Color.END}")
-        if resultado_proceso.stdout:
-            print(f"{Color.DARKCYAN}Salida Estándar:{Color.END}\n{resultado_proceso.stdout}")
-        if resultado_proceso.stderr:
-            print(f"{Color.RED}Salida de Error:{Color.END}\n{resultado_proceso.stderr}")
+        if resultado["SALIDA"]:
+            print(f"{Color.DARKCYAN}Salida Estándar:{Color.END}\n{resultado['SALIDA']}")
+        if resultado["ERROR"]:
+            print(f"{Color.RED}Salida de Error:{Color.END}\n{resultado['ERROR']}")
         print(f"{Color.BLUE}{'-'*31} FIN SALIDA PING {'-'*31}{Color.END}\n")
 
-        if resultado_proceso.returncode == 0:
-            fallo_logico = False
-            if platform.system().lower() != 'windows':
-                if "0 received" in resultado_proceso.stdout or \
-                   "100.0% packet loss" in resultado_proceso.stdout or \
-                   "100% packet loss" in resultado_proceso.stdout:
-                    fallo_logico = True
-            elif platform.system().lower() == 'windows':
-                 if "Host de destino inaccesible." in resultado_proceso.stdout or \
-                    "Destination host unreachable." in resultado_proceso.stdout or \
-                    "Tiempo de espera agotado para esta solicitud." in resultado_proceso.stdout or \
-                    "Request timed out." in resultado_proceso.stdout or \
-                    "inaccesible" in resultado_proceso.stdout.lower() or \
-                    "unreachable" in resultado_proceso.stdout.lower():
-                    if "recibidos = 0" in resultado_proceso.stdout or "Received = 0" in resultado_proceso.stdout:
-                         fallo_logico = True
-                 elif 'ttl=' not in resultado_proceso.stdout.lower():
-                        match_perdida_total = re.search(r"(perdidos|Lost)\s*=\s*4\s*\(100%\s*(pérdida|loss)\)", resultado_proceso.stdout)
-                        if match_perdida_total:
-                            fallo_logico = True
-                 elif 'bytes=' not in resultado_proceso.stdout.lower() and 'tiempo=' not in resultado_proceso.stdout.lower() and 'time=' not in resultado_proceso.stdout.lower():
-                             fallo_logico = True
-
-            if fallo_logico:
-                 mostrar_mensaje(f"⚠️  PING a {ip_address} PARECE HABER FALLADO (posible pérdida total de paquetes o host inalcanzable), aunque el comando finalizó sin error del sistema.", "advertencia")
+    print(f"{Color.CYAN}Motor usado:{Color.END} {resultado['MOTOR']}")
+    print(f"{Color.CYAN}Paquetes:{Color.END} enviados {resultado['ENVIADOS']}, recibidos {resultado['RECIBIDOS']}, pérdida {resultado['PERDIDA']}%")
+    if resultado["RTT_PROM"] is not None:
+        print(f"{Color.CYAN}RTT (ms):{Color.END} mín {resultado['RTT_MIN']:.3f} / prom {resultado['RTT_PROM']:.3f} / máx {resultado['RTT_MAX']:.3f}" +
+              (f" / desv. {resultado['RTT_MDEV']:.3f}" if resultado.get("RTT_MDEV") is not None else ""))
+    print()
+
+    if resultado["ALCANZABLE"]:
+        mostrar_mensaje(f"✅ PING a {ip_address} EXITOSO ({resultado['DETALLE']}).", "exito")
+    elif resultado["CODIGO"] == 0:
+        mostrar_mensaje(f"⚠️  PING a {ip_address} PARECE HABER FALLADO (posible pérdida total de paquetes o host inalcanzable), aunque el comando finalizó sin error del sistema.", "advertencia")
+    elif resultado["CODIGO"] is not None:
+        mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO (código de retorno del sistema: {resultado['CODIGO']}). El host podría ser inalcanzable o la red tener problemas.", "error")
+    else:
+        mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO: {resultado['DETALLE']}.", "error")
+
+    if resultado["EN_CACHE"]:
+        if input(f"{Color.GREEN}Presione Enter para continuar ('r' para repetir el ping ahora)...{Color.END}").strip().lower() == "r":
+            hacer_ping(ip_address, forzar=True)
+        return
+    input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+
+def barrido_ping(dispositivos, concurrencia=PING_CONCURRENCIA_PREDETERMINADA, conteo=PING_CONTEO_PREDETERMINADO, timeout=PING_TIMEOUT_PREDETERMINADO, motor=None, forzar=False):
+    """Hace ping a varios dispositivos en paralelo con un número acotado de hilos.
+
+    Es un generador: entrega pares (dispositivo, resultado) a medida que cada ping termina. Los
+    dispositivos con un resultado vigente en CACHE_SONDEOS se entregan primero, sin sondear (salvo con 'forzar').
+    """
+    dispositivos_con_ip = [d for d in dispositivos if d.get("IP") and d.get("IP") != "N/A"]
+    if not forzar:
+        pendientes = []
+        for d in dispositivos_con_ip:
+            resultado = CACHE_SONDEOS.obtener(d.get("IP"))
+            if resultado is None:
+                pendientes.append(d)
             else:
-                mostrar_mensaje(f"✅ PING a {ip_address} EXITOSO (código de retorno del sistema: {resultado_proceso.returncode}).", "exito")
-        else:
-            mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO (código de retorno del sistema: {resultado_proceso.returncode}). El host podría ser inalcanzable o la red tener problemas.", "error")
+                yield d, resultado
+        dispositivos_con_ip = pendientes
+    if not dispositivos_con_ip:
+        return
+    max_hilos = max(1, min(concurrencia, len(dispositivos_con_ip)))
+    with ThreadPoolExecutor(max_workers=max_hilos) as ejecutor:
+        futuros = {ejecutor.submit(sondear_con_cache, d.get("IP"), conteo, timeout, motor, True): d for d in dispositivos_con_ip}
+        try:
+            for futuro in as_completed(futuros):
+                yield futuros[futuro], futuro.result()
+        finally:
+            for futuro in futuros: # Si se interrumpe el barrido, no lanzar los pings pendientes
+                futuro.cancel()
+
+def _mostrar_resumen_barrido(resultados_barrido, duracion_total):
+    """Imprime una tabla con los dispositivos alcanzables e inalcanzables de un barrido."""
+    alcanzables = sorted((r for r in resultados_barrido if r[1]["ALCANZABLE"]), key=lambda r: r[0].get("NOMBRE", "").lower())
+    inalcanzables = sorted((r for r in resultados_barrido if not r[1]["ALCANZABLE"]), key=lambda r: r[0].get("NOMBRE", "").lower())
+
+    print(f"\n{Color.BOLD}{Color.PURPLE}📋 RESUMEN DEL BARRIDO{Color.END}")
+    print(f"{Color.BLUE}{'─' * 70}{Color.END}")
+    print(f"{Color.BOLD}{'ESTADO':<14}{'NOMBRE':<24}{'IP':<17}{'DETALLE'}{Color.END}")
+    print(f"{Color.BLUE}{'─' * 70}{Color.END}")
+    for disp, resultado in alcanzables:
+        print(f"{Color.GREEN}{'✅ Alcanzable':<14}{Color.END}{disp.get('NOMBRE', 'N/A')[:23]:<24}{resultado['IP']:<17}{resultado['DETALLE']}")
+    for disp, resultado in inalcanzables:
+        print(f"{Color.RED}{'❌ Sin resp.':<14}{Color.END}{disp.get('NOMBRE', 'N/A')[:23]:<24}{resultado['IP']:<17}{resultado['DETALLE']}")
+    print(f"{Color.BLUE}{'─' * 70}{Color.END}")
+    print(f"{Color.CYAN}Total:{Color.END} {len(resultados_barrido)}   "
+          f"{Color.GREEN}Alcanzables:{Color.END} {len(alcanzables)}   "
+          f"{Color.RED}Inalcanzables:{Color.END} {len(inalcanzables)}   "
+          f"{Color.CYAN}Duración:{Color.END} {duracion_total:.1f} s")
 
-    except subprocess.TimeoutExpired:
-        mostrar_mensaje(f"❌ PING a {ip_address} FALLIDO: Tiempo de espera agotado (10 segundos).", "error")
-    except FileNotFoundError:
-        mostrar_mensaje(f"❌ Error Crítico: El comando 'ping' no se encontró en el sistema. Asegúrese de que esté instalado y en el PATH del sistema.", "error")
-    except Exception as e:
-        mostrar_mensaje(f"❌ Ocurrió un error inesperado al ejecutar el comando ping: {e}", "error")
+def _pedir_entero_con_predeterminado(prompt, predeterminado, minimo=1, maximo=None):
+    """Pide un entero al usuario; Enter devuelve el valor predeterminado."""
+    while True:
+        valor_str = input(f"{Color.GREEN}↳ {prompt} (Enter = {predeterminado}): {Color.END}").strip()
+        if not valor_str:
+            return predeterminado
+        if valor_str.isdigit() and int(valor_str) >= minimo and (maximo is None or int(valor_str) <= maximo):
+            return int(valor_str)
+        rango = f"{minimo}-{maximo}" if maximo is not None else f"mayor o igual a {minimo}"
+        mostrar_mensaje(f"Valor inválido. Debe ser un número {rango}.", "error")
+
+def _filtrar_dispositivos_para_barrido(dispositivos_lista):
+    """Permite elegir un subconjunto de dispositivos por tipo, ubicación/capa, VLAN o nombre.
+
+    Los filtros por tipo, capa y VLAN usan los índices del repositorio.
+    """
+    print(f"\n{Color.BOLD}Filtrar dispositivos por:{Color.END}")
+    print(f"{Color.YELLOW}1.{Color.END} Tipo de dispositivo")
+    print(f"{Color.YELLOW}2.{Color.END} Ubicación/Capa de red")
+    print(f"{Color.YELLOW}3.{Color.END} VLAN")
+    print(f"{Color.YELLOW}4.{Color.END} Nombre (o parte del nombre)")
+    print(f"{Color.YELLOW}0.{Color.END} Cancelar")
+    opcion = input(f"\n{Color.GREEN}↳ Opción (0-4): {Color.END}").strip()
+
+    if opcion == "1":
+        tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo:", "Tipo", permitir_cancelar=True)
+        if tipo is None: return None
+        return dispositivos_lista.por_tipo(tipo)
+    elif opcion == "2":
+        ubicacion = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la ubicación/capa:", "Ubicación/Capa", permitir_cancelar=True)
+        if ubicacion is None: return None
+        return dispositivos_lista.por_ubicacion(ubicacion)
+    elif opcion == "3":
+        vlan_str = input(f"{Color.GREEN}↳ VLAN o rango de VLANs (1-4094, ej: 20 o 10-200): {Color.END}").strip()
+        try:
+            vlans = validar_vlans_input(vlan_str, avisar_duplicados=False)
+        except ValueError:
+            vlans = []
+        if not vlans:
+            mostrar_mensaje("VLAN inválida.", "error"); pausa(1)
+            return None
+        return dispositivos_lista.por_vlans(mascara_de_vlans(vlans))
+    elif opcion == "4":
+        texto = input(f"{Color.GREEN}↳ Nombre o parte del nombre: {Color.END}").strip().lower()
+        if not texto: return None
+        return [d for d in dispositivos_lista if texto in d.get("NOMBRE", "").lower()]
+    return None
+
+def menu_barrido_ping(dispositivos_lista, filtrar=False):
+    """Ping a todos (o a un subconjunto filtrado) de los dispositivos, mostrando resultados en vivo."""
+    mostrar_titulo("📡 BARRIDO DE PING")
+    objetivos = dispositivos_lista
+    if filtrar:
+        objetivos = _filtrar_dispositivos_para_barrido(dispositivos_lista)
+        if objetivos is None:
+            mostrar_mensaje("Barrido cancelado.", "info"); pausa(1)
+            return
+    objetivos = [d for d in objetivos if d.get("IP") and d.get("IP") != "N/A"]
+    if not objetivos:
+        mostrar_mensaje("Ningún dispositivo con IP coincide con el filtro.", "advertencia", esperar_enter=True)
+        return
 
-    input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
+    print(f"\n{Color.BOLD}Dispositivos a probar: {len(objetivos)}{Color.END}")
+    concurrencia = _pedir_entero_con_predeterminado("Pings simultáneos", PING_CONCURRENCIA_PREDETERMINADA, 1, 512)
+    conteo = _pedir_entero_con_predeterminado("Paquetes por host", PING_CONTEO_PREDETERMINADO, 1, 100)
+    timeout = _pedir_entero_con_predeterminado("Timeout por host en segundos", PING_TIMEOUT_PREDETERMINADO, 1, 300)
+    motor = ""
+    while motor not in MOTORES_SONDEO and motor != "auto":
+        motor = input(f"{Color.GREEN}↳ Motor de sondeo (auto, {', '.join(MOTORES_SONDEO)}) (Enter = {MOTOR_SONDEO}): {Color.END}").strip().lower() or MOTOR_SONDEO
+        if motor not in MOTORES_SONDEO and motor != "auto":
+            mostrar_mensaje(f"Motor '{motor}' no reconocido.", "error")
+    forzar = False
+    en_cache = sum(1 for d in objetivos if CACHE_SONDEOS.estado(d.get("IP")) is not None)
+    if en_cache:
+        respuesta = input(f"{Color.GREEN}↳ {en_cache} dispositivo(s) tienen un resultado de menos de {CACHE_SONDEOS.ttl:.0f} s. ¿Reutilizarlos? (s/n, Enter = s): {Color.END}").strip().lower()
+        forzar = respuesta in ("n", "no")
+
+    mostrar_titulo(f"📡 BARRIDO DE PING ({len(objetivos)} dispositivos)")
+    print(f"{Color.YELLOW}Concurrencia: {concurrencia} | Paquetes: {conteo} | Timeout: {timeout}s | Motor: {motor}  (Ctrl+C para detener){Color.END}\n")
+
+    resultados_barrido = []
+    inicio = perf_counter()
+    try:
+        for disp, resultado in barrido_ping(objetivos, concurrencia, conteo, timeout, motor, forzar):
+            resultados_barrido.append((disp, resultado))
+            progreso = f"[{len(resultados_barrido)}/{len(objetivos)}]"
+            origen = f"caché, hace {resultado['EDAD']:.0f} s" if resultado["EN_CACHE"] else f"{resultado['DURACION']:.1f} s"
+            if resultado["ALCANZABLE"]:
+                print(f"{Color.DARKCYAN}{progreso}{Color.END} {Color.GREEN}✅ {disp.get('NOMBRE')} ({resultado['IP']}){Color.END} - {resultado['DETALLE']} ({origen})")
+            else:
+                print(f"{Color.DARKCYAN}{progreso}{Color.END} {Color.RED}❌ {disp.get('NOMBRE')} ({resultado['IP']}){Color.END} - {resultado['DETALLE']}" + (f" ({origen})" if resultado["EN_CACHE"] else ""))
+    except KeyboardInterrupt:
+        mostrar_mensaje("Barrido interrumpido por el usuario. Se muestran los resultados parciales.", "advertencia")
+
+    _mostrar_resumen_barrido(resultados_barrido, perf_counter() - inicio)
+    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+
+# ---------------- CACHÉ DE SONDEOS ----------------
+CACHE_SONDEOS_TTL = float(os.environ.get("P1_CACHE_SONDEOS_TTL", "30")) # Segundos que un resultado se considera vigente (0 = sin caché)
+CACHE_SONDEOS_MAXIMO = int(os.environ.get("P1_CACHE_SONDEOS_MAXIMO", "4096")) # IPs guardadas como máximo; se descarta la menos usada
+
+class CacheSondeos:
+    """Último resultado de sondeo por IP, con caducidad (TTL) y tamaño acotado (LRU).
+
+    La comparten el ping individual, los barridos, el monitor y los reportes, así que repetir un ping
+    reciente no vuelve a esperar los segundos del sondeo. Es segura para usar desde varios hilos.
+    """
+    def __init__(self, ttl=CACHE_SONDEOS_TTL, maximo=CACHE_SONDEOS_MAXIMO):
+        self.ttl = ttl
+        self.maximo = max(1, maximo)
+        self._entradas = OrderedDict() # IP -> (momento monotónico, momento de reloj, resultado)
+        self._candado = threading.Lock()
+        self.aciertos = 0
+        self.fallos = 0
+
+    def __len__(self):
+        return len(self._entradas)
+
+    def _vigente(self, ip, ahora):
+        """Entrada vigente de la IP (moviéndola al final del LRU) o None. Llamar con el candado tomado."""
+        entrada = self._entradas.get(ip)
+        if entrada is None:
+            return None
+        if ahora - entrada[0] > self.ttl:
+            del self._entradas[ip]
+            return None
+        self._entradas.move_to_end(ip)
+        return entrada
+
+    def obtener(self, ip):
+        """Copia del resultado guardado para la IP, marcada con EN_CACHE y EDAD, o None si no hay uno vigente."""
+        if self.ttl <= 0:
+            return None
+        ahora = monotonic()
+        with self._candado:
+            entrada = self._vigente(ip, ahora)
+            if entrada is None:
+                self.fallos += 1
+                return None
+            self.aciertos += 1
+        return dict(entrada[2], EN_CACHE=True, EDAD=ahora - entrada[0])
+
+    def guardar(self, ip, resultado, momento=None):
+        if self.ttl <= 0 or not ip or ip == "N/A":
+            return
+        with self._candado:
+            self._entradas[ip] = (monotonic(), momento or time(), resultado)
+            self._entradas.move_to_end(ip)
+            while len(self._entradas) > self.maximo:
+                self._entradas.popitem(last=False)
+
+    def estado(self, ip):
+        """EstadoAlcanzabilidad de un solo sondeo con el resultado vigente de la IP (None si no lo hay). No cuenta como acierto."""
+        if self.ttl <= 0:
+            return None
+        with self._candado:
+            entrada = self._vigente(ip, monotonic())
+        if entrada is None:
+            return None
+        estado = EstadoAlcanzabilidad(ip, tamano_historial=1)
+        estado.registrar(entrada[2]["ALCANZABLE"], entrada[2]["RTT_PROM"], entrada[1])
+        return estado
+
+    def resumen(self):
+        ahora = monotonic()
+        with self._candado:
+            vigentes = sum(1 for momento, _, _ in self._entradas.values() if ahora - momento <= self.ttl)
+        return {"ttl": self.ttl, "maximo": self.maximo, "vigentes": vigentes, "aciertos": self.aciertos, "fallos": self.fallos}
+
+CACHE_SONDEOS = CacheSondeos()
+
+def sondear_con_cache(ip_address, conteo=PING_CONTEO_PREDETERMINADO, timeout=PING_TIMEOUT_PREDETERMINADO, motor=None, forzar=False):
+    """Como ejecutar_ping, pero devuelve el resultado de CACHE_SONDEOS si es reciente.
+
+    Con 'forzar' se sondea siempre; el resultado nuevo reemplaza al guardado y se agrega al historial de latencias.
+    """
+    if not forzar:
+        resultado = CACHE_SONDEOS.obtener(ip_address)
+        if resultado is not None:
+            return resultado
+    resultado = ejecutar_ping(ip_address, conteo, timeout, motor)
+    CACHE_SONDEOS.guardar(ip_address, resultado)
+    registrar_en_historial(resultado)
+    return resultado
+
+
+# ---------------- HISTORIAL DE LATENCIAS ----------------
+# Cada sondeo nuevo (ping individual, barridos y monitor) se agrega a una base SQLite aparte, indexada por
+# momento. Los sondeos más antiguos que HISTORIAL_DETALLE_DIAS se resumen en una fila por IP y por
+# HISTORIAL_RESOLUCION segundos, y los más antiguos que HISTORIAL_RETENCION_DIAS se borran.
+HISTORIAL_ACTIVO = os.environ.get("P1_HISTORIAL_LATENCIAS", "1").strip().lower() not in ("0", "false", "no", "n")
+NOMBRE_BASE_HISTORIAL = "dispositivos_red.historial.db"
+HISTORIAL_DETALLE_DIAS = float(os.environ.get("P1_HISTORIAL_DETALLE_DIAS", "7")) # Días con un registro por sondeo
+HISTORIAL_RETENCION_DIAS = float(os.environ.get("P1_HISTORIAL_RETENCION_DIAS", "90")) # Días que se conserva algo
+HISTORIAL_RESOLUCION = int(os.environ.get("P1_HISTORIAL_RESOLUCION", "3600")) # Segundos que abarca cada fila resumida
+HISTORIAL_LOTE = 256 # Sondeos acumulados en memoria antes de escribirlos
+HISTORIAL_ESPERA_MAXIMA = 5 # Segundos que un sondeo puede esperar en memoria antes de escribirse
+HISTORIAL_MANTENIMIENTO_CADA = 3600 # Segundos entre resúmenes/borrados automáticos
+PERCENTILES_LATENCIA = (50, 95, 99)
+AGRUPACIONES_LATENCIA = {"dispositivo": "NOMBRE", "tipo": "TIPO", "capa": "UBICACION"}
+
+class HistorialLatencias:
+    """Serie temporal de sondeos en SQLite, con escritura por lotes y segura entre hilos.
+
+    Las filas se identifican por IP (lo que se sondea); el reporte las agrupa por dispositivo, tipo o capa
+    según el inventario actual. Una fila resumida representa 'sondeos' sondeos, de los cuales 'respondidos'
+    tuvieron respuesta; su 'rtt' es el promedio de estos últimos y pesa 'respondidos' en los percentiles.
+    """
+    ESQUEMA = """
+        CREATE TABLE IF NOT EXISTS sondeos (
+            momento INTEGER NOT NULL,
+            ip TEXT NOT NULL,
+            sondeos INTEGER NOT NULL DEFAULT 1,
+            respondidos INTEGER NOT NULL,
+            enviados INTEGER NOT NULL,
+            recibidos INTEGER NOT NULL,
+            rtt REAL,
+            resumido INTEGER NOT NULL DEFAULT 0
+        );
+        CREATE INDEX IF NOT EXISTS idx_sondeos_momento ON sondeos(momento);
+        CREATE INDEX IF NOT EXISTS idx_sondeos_ip_momento ON sondeos(ip, momento);
+    """
+
+    def __init__(self, ruta=None):
+        self.ruta = ruta or NOMBRE_BASE_HISTORIAL
+        self.conexion = sqlite3.connect(self.ruta, check_same_thread=False)
+        self.conexion.execute("PRAGMA journal_mode = WAL")
+        self.conexion.executescript(self.ESQUEMA)
+        self._candado = threading.Lock()
+        self._pendientes = []
+        self._ultima_escritura = monotonic()
+        self._ultimo_mantenimiento = None
+
+    def cerrar(self):
+        self.escribir_pendientes()
+        with self._candado:
+            self.conexion.close()
+
+    def registrar(self, resultado, momento=None):
+        """Agrega un resultado de sondeo (diccionario de ejecutar_ping) al lote pendiente."""
+        rtt = resultado["RTT_PROM"] if resultado["ALCANZABLE"] else None
+        fila = (int(momento or time()), resultado["IP"], 1 if rtt is not None else 0,
+                resultado["ENVIADOS"] or 0, resultado["RECIBIDOS"] or 0, rtt)
+        with self._candado:
+            self._pendientes.append(fila)
+            lleno = len(self._pendientes) >= HISTORIAL_LOTE or monotonic() - self._ultima_escritura >= HISTORIAL_ESPERA_MAXIMA
+        if lleno:
+            self.escribir_pendientes()
+
+    def escribir_pendientes(self):
+        with self._candado:
+            filas, self._pendientes = self._pendientes, []
+            self._ultima_escritura = monotonic()
+            if filas:
+                with self.conexion:
+                    self.conexion.executemany(
+                        "INSERT INTO sondeos (momento, ip, respondidos, enviados, recibidos, rtt) VALUES (?, ?, ?, ?, ?, ?)", filas)
+            mantener = self._ultimo_mantenimiento is None or monotonic() - self._ultimo_mantenimiento >= HISTORIAL_MANTENIMIENTO_CADA
+        if mantener:
+            self.mantener()
+
+    def mantener(self, ahora=None):
+        """Resume los sondeos viejos y borra los que superan la retención. Devuelve (resumidos, borrados)."""
+        ahora = ahora or time()
+        limite_detalle = int(ahora - HISTORIAL_DETALLE_DIAS * 86400)
+        limite_retencion = int(ahora - HISTORIAL_RETENCION_DIAS * 86400)
+        paso = max(1, HISTORIAL_RESOLUCION)
+        with self._candado, self.conexion:
+            self._ultimo_mantenimiento = monotonic()
+            borrados = self.conexion.execute("DELETE FROM sondeos WHERE momento < ?", (limite_retencion,)).rowcount
+            self.conexion.execute("""
+                INSERT INTO sondeos (momento, ip, sondeos, respondidos, enviados, recibidos, rtt, resumido)
+                SELECT (momento / ?) * ?, ip, SUM(sondeos), SUM(respondidos), SUM(enviados), SUM(recibidos),
+                       SUM(rtt * respondidos) / NULLIF(SUM(CASE WHEN rtt IS NULL THEN 0 ELSE respondidos END), 0), 1
+                FROM sondeos WHERE momento < ? AND resumido = 0 GROUP BY ip, momento / ?""", (paso, paso, limite_detalle, paso))
+            resumidos = self.conexion.execute("DELETE FROM sondeos WHERE momento < ? AND resumido = 0", (limite_detalle,)).rowcount
+        return resumidos, borrados
+
+    def reporte(self, grupos_por_ip, desde, percentiles=PERCENTILES_LATENCIA):
+        """Sondeos, pérdida y percentiles de RTT por grupo, para los sondeos posteriores a 'desde'.
+
+        'grupos_por_ip' asocia cada IP a su grupo (nombre, tipo o capa). Los percentiles se calculan
+        recorriendo las latencias ya ordenadas por SQLite, sin cargar el historial en memoria.
+        Devuelve {grupo: {"SONDEOS", "PERDIDA", "P50", ...}} (percentiles en None si no hubo respuestas).
+        """
+        self.escribir_pendientes()
+        with self._candado:
+            self.conexion.execute("CREATE TEMP TABLE IF NOT EXISTS grupos_reporte (ip TEXT PRIMARY KEY, grupo TEXT NOT NULL)")
+            self.conexion.execute("DELETE FROM grupos_reporte")
+            self.conexion.executemany("INSERT OR IGNORE INTO grupos_reporte (ip, grupo) VALUES (?, ?)", grupos_por_ip.items())
+            reporte, pesos = {}, {}
+            for grupo, sondeos, enviados, recibidos, respondidos in self.conexion.execute("""
+                    SELECT g.grupo, SUM(s.sondeos), SUM(s.enviados), SUM(s.recibidos), SUM(CASE WHEN s.rtt IS NULL THEN 0 ELSE s.respondidos END)
+                    FROM sondeos s JOIN grupos_reporte g ON g.ip = s.ip WHERE s.momento >= ? GROUP BY g.grupo""", (int(desde),)):
+                reporte[grupo] = dict({"SONDEOS": sondeos, "PERDIDA": round(100.0 * (enviados - recibidos) / enviados, 1) if enviados else 100.0},
+                                      **{f"P{p}": None for p in percentiles})
+                pesos[grupo] = respondidos
+            grupo_actual, acumulado, pendientes = None, 0, []
+            for grupo, rtt, peso in self.conexion.execute("""
+                    SELECT g.grupo, s.rtt, s.respondidos FROM sondeos s JOIN grupos_reporte g ON g.ip = s.ip
+                    WHERE s.momento >= ? AND s.rtt IS NOT NULL AND s.respondidos > 0 ORDER BY g.grupo, s.rtt""", (int(desde),)):
+                if grupo != grupo_actual: # Percentil por rango más cercano: primer valor cuyo peso acumulado alcanza p% del total
+                    grupo_actual, acumulado = grupo, 0
+                    pendientes = [(p, max(1, -(-p * pesos[grupo] // 100))) for p in percentiles]
+                acumulado += peso
+                while pendientes and acumulado >= pendientes[0][1]:
+                    reporte[grupo][f"P{pendientes.pop(0)[0]}"] = round(rtt, 3)
+        return reporte
+
+_historial = None
+_candado_historial = threading.Lock() # Los hilos del barrido y del monitor llegan aquí a la vez
+
+def obtener_historial():
+    """Historial compartido (se crea al primer uso). None si está desactivado o no se pudo abrir."""
+    global _historial, HISTORIAL_ACTIVO
+    if not HISTORIAL_ACTIVO:
+        return None
+    if _historial is None:
+        with _candado_historial:
+            if _historial is None and HISTORIAL_ACTIVO: # Otro hilo pudo crearlo (o fallar) mientras se esperaba
+                try:
+                    _historial = HistorialLatencias()
+                    atexit.register(_historial.escribir_pendientes) # Sin cerrar: el monitor puede seguir sondeando al salir
+                except sqlite3.Error as e:
+                    HISTORIAL_ACTIVO = False
+                    mostrar_mensaje(f"No se pudo abrir el historial de latencias '{NOMBRE_BASE_HISTORIAL}': {e}", "advertencia")
+    return _historial
+
+def registrar_en_historial(resultado):
+    """Agrega un sondeo al historial. Si la base falla, el historial se desactiva en esta sesión (avisando una vez)."""
+    global HISTORIAL_ACTIVO
+    historial = obtener_historial()
+    if historial is None:
+        return
+    try:
+        historial.registrar(resultado)
+    except sqlite3.Error as e:
+        HISTORIAL_ACTIVO = False
+        mostrar_mensaje(f"Se desactiva el historial de latencias por un error de '{historial.ruta}': {e}", "advertencia")
+
+def reporte_latencias(dispositivos_lista, horas=24, por="dispositivo"):
+    """Percentiles de RTT y pérdida de las últimas 'horas', agrupados por 'dispositivo', 'tipo' o 'capa'."""
+    if por not in AGRUPACIONES_LATENCIA:
+        raise ValueError(f"Agrupación desconocida: '{por}'. Use una de: {', '.join(AGRUPACIONES_LATENCIA)}.")
+    historial = obtener_historial()
+    if historial is None:
+        return {}
+    campo = AGRUPACIONES_LATENCIA[por]
+    grupos_por_ip = {}
+    for disp in dispositivos_lista:
+        ip = disp.get("IP")
+        if ip and ip != "N/A":
+            grupos_por_ip.setdefault(ip, disp.get(campo) or "N/A")
+    return historial.reporte(grupos_por_ip, time() - horas * 3600)
+
+def menu_reporte_latencias(dispositivos_lista):
+    mostrar_titulo("📈 HISTORIAL DE LATENCIA")
+    if obtener_historial() is None:
+        mostrar_mensaje("El historial de latencias está desactivado (P1_HISTORIAL_LATENCIAS=0).", "advertencia", esperar_enter=True)
+        return
+    horas = _pedir_entero_con_predeterminado("Ventana en horas", 24, 1, int(HISTORIAL_RETENCION_DIAS * 24))
+    print(f"{Color.BOLD}Agrupar por:{Color.END} {Color.YELLOW}1.{Color.END} Dispositivo  {Color.YELLOW}2.{Color.END} Tipo  {Color.YELLOW}3.{Color.END} Capa de red")
+    por = {"2": "tipo", "3": "capa"}.get(input(f"{Color.GREEN}↳ Opción (Enter = 1): {Color.END}").strip(), "dispositivo")
+    reporte = reporte_latencias(dispositivos_lista, horas, por)
+
+    mostrar_titulo(f"📈 LATENCIA POR {por.upper()} (ÚLTIMAS {horas} H)")
+    if not reporte:
+        mostrar_mensaje("No hay sondeos registrados en esa ventana. Haga pings, barridos o active el monitor.", "info", esperar_enter=True)
+        return
+    print(f"{Color.BOLD}{'GRUPO':<26}{'SONDEOS':>9}{'PÉRDIDA':>9}" + "".join(f"{f'P{p} ms':>10}" for p in PERCENTILES_LATENCIA) + Color.END)
+    print(f"{Color.BLUE}{'─' * (44 + 10 * len(PERCENTILES_LATENCIA))}{Color.END}")
+    for grupo, datos in sorted(reporte.items(), key=lambda item: (-item[1]["PERDIDA"], _sin_icono(item[0]).lower())):
+        color = Color.RED if datos["PERDIDA"] >= 50 else (Color.YELLOW if datos["PERDIDA"] > 0 else Color.GREEN)
+        percentiles = "".join(f"{datos[f'P{p}']:>10.2f}" if datos[f"P{p}"] is not None else f"{'-':>10}" for p in PERCENTILES_LATENCIA)
+        print(f"{_sin_icono(grupo)[:25]:<26}{datos['SONDEOS']:>9}{color}{datos['PERDIDA']:>8.1f}%{Color.END}{percentiles}")
+    input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+
+# ---------------- MONITOR DE ALCANZABILIDAD ----------------
+MONITOR_INTERVALO_PREDETERMINADO = 60 # Segundos entre sondeos de un host que responde
+MONITOR_INTERVALO_MINIMO, MONITOR_INTERVALO_MAXIMO = 5, 86400 # Límites del intervalo (menú, CLI y MonitorAlcanzabilidad)
+MONITOR_JITTER = 0.2 # Variación aleatoria (±20 %) del intervalo para no sondear todos los hosts a la vez
+MONITOR_ESPERA_MAXIMA = 900 # Tope (s) del backoff exponencial para hosts que siguen sin responder
+MONITOR_TAMANO_HISTORIAL = 32 # Sondeos que se guardan por IP
+MONITOR_CONTEO = 1 # Paquetes por sondeo: basta uno para saber si el host está arriba
+MONITOR_TIMEOUT = 2 # Segundos por sondeo
+MONITOR_RESINCRONIZAR_CADA = 5 # Segundos entre revisiones de las IPs del inventario
+
+class EstadoAlcanzabilidad:
+    """Estado actual de una IP y un buffer circular con sus últimos sondeos (momento, alcanzable, RTT en ms)."""
+    __slots__ = ("ip", "alcanzable", "ultimo_rtt", "ultimo_sondeo", "ultimo_cambio", "fallos_consecutivos", "historial")
+
+    def __init__(self, ip, tamano_historial=MONITOR_TAMANO_HISTORIAL):
+        self.ip = ip
+        self.alcanzable = None # None mientras no se haya sondeado
+        self.ultimo_rtt = None
+        self.ultimo_sondeo = None
+        self.ultimo_cambio = None
+        self.fallos_consecutivos = 0
+        self.historial = deque(maxlen=tamano_historial)
+
+    def registrar(self, alcanzable, rtt, momento):
+        """Anota un sondeo. Devuelve True si cambió el estado (incluido el primer sondeo)."""
+        self.historial.append((momento, alcanzable, rtt))
+        self.ultimo_sondeo = momento
+        self.ultimo_rtt = rtt if alcanzable else None
+        self.fallos_consecutivos = 0 if alcanzable else self.fallos_consecutivos + 1
+        if alcanzable == self.alcanzable:
+            return False
+        self.alcanzable = alcanzable
+        self.ultimo_cambio = momento
+        return True
+
+    def texto_corto(self):
+        return "-" if self.alcanzable is None else ("UP" if self.alcanzable else "DOWN")
+
+    def descripcion(self):
+        """'🟢 Alcanzable (RTT 1.2 ms) desde 10:32:05' para los listados."""
+        if self.alcanzable is None:
+            return "⏳ Pendiente de sondeo"
+        desde = datetime.fromtimestamp(self.ultimo_cambio).strftime('%Y-%m-%d %H:%M:%S')
+        if self.alcanzable:
+            rtt = f" (RTT {self.ultimo_rtt:.1f} ms)" if self.ultimo_rtt is not None else ""
+            return f"🟢 Alcanzable{rtt} desde {desde}"
+        return f"🔴 Sin respuesta desde {desde} ({self.fallos_consecutivos} fallos seguidos)"
+
+    def como_dict(self):
+        return {"IP": self.ip, "ALCANZABLE": self.alcanzable, "ULTIMO_RTT": self.ultimo_rtt,
+                "ULTIMO_SONDEO": self.ultimo_sondeo, "ULTIMO_CAMBIO": self.ultimo_cambio,
+                "FALLOS_CONSECUTIVOS": self.fallos_consecutivos}
+
+class MonitorAlcanzabilidad:
+    """Sondea periódicamente, en un hilo de fondo, todas las IPs del repositorio.
+
+    Cada IP tiene su propio próximo sondeo en una agenda (heap). Los que responden se repiten cada
+    'intervalo' segundos y los que fallan esperan el doble tras cada fallo, hasta MONITOR_ESPERA_MAXIMA.
+    Todas las esperas llevan un jitter de ±MONITOR_JITTER. Las IPs nuevas arrancan en un momento aleatorio
+    dentro del primer intervalo, para no lanzar todos los sondeos de golpe.
+    'al_cambiar(estado)' se llama desde el hilo del monitor cada vez que una IP cambia de estado.
+    """
+    def __init__(self, repositorio, intervalo=MONITOR_INTERVALO_PREDETERMINADO, concurrencia=PING_CONCURRENCIA_PREDETERMINADA,
+                 motor=None, al_cambiar=None):
+        self.repositorio = repositorio
+        self.intervalo = min(max(intervalo, MONITOR_INTERVALO_MINIMO), MONITOR_INTERVALO_MAXIMO) # Con 0 se sondearía sin pausa
+        self.concurrencia = max(1, concurrencia)
+        self.motor = motor
+        self.al_cambiar = al_cambiar
+        self.estados = {} # IP -> EstadoAlcanzabilidad
+        self.sondeos_realizados = 0
+        self._agenda = [] # heap de (momento monotónico, IP, generación)
+        self._objetivos = set()
+        self._generaciones = {} # IP -> generación vigente; las entradas de la agenda con otra generación se descartan
+        self._contador_generaciones = itertools.count()
+        self._detener = threading.Event()
+        self._hilo = None
+
+    @property
+    def activo(self):
+        return self._hilo is not None and self._hilo.is_alive()
+
+    def iniciar(self):
+        if self.activo:
+            return
+        self._detener.clear()
+        self._hilo = threading.Thread(target=self._bucle, name="monitor-alcanzabilidad", daemon=True)
+        self._hilo.start()
+
+    def detener(self, esperar=True):
+        self._detener.set()
+        if esperar and self._hilo is not None:
+            self._hilo.join(timeout=MONITOR_TIMEOUT + 1)
+
+    def _espera_siguiente(self, estado):
+        base = self.intervalo
+        if estado.fallos_consecutivos:
+            base = min(self.intervalo * 2 ** (estado.fallos_consecutivos - 1), max(self.intervalo, MONITOR_ESPERA_MAXIMA))
+        return base * random.uniform(1 - MONITOR_JITTER, 1 + MONITOR_JITTER)
+
+    def _sincronizar_objetivos(self, ahora):
+        """Agrega a la agenda las IPs nuevas del inventario y olvida las que ya no están."""
+        actuales = set(self.repositorio.ips_asignadas())
+        for ip in actuales - self._objetivos:
+            self.estados.setdefault(ip, EstadoAlcanzabilidad(ip))
+            generacion = self._generaciones[ip] = next(self._contador_generaciones)
+            heapq.heappush(self._agenda, (ahora + random.uniform(0, self.intervalo), ip, generacion))
+        for ip in self._objetivos - actuales:
+            self.estados.pop(ip, None)
+            # Su entrada en la agenda (o su sondeo en curso) queda con una generación vieja y se descarta; así, si
+            # la IP vuelve antes de que venza, no termina agendada dos veces
+            del self._generaciones[ip]
+        self._objetivos = actuales
+
+    def _bucle(self):
+        en_curso = {} # futuro -> (IP, generación)
+        proxima_sincronizacion = 0
+        with ThreadPoolExecutor(max_workers=self.concurrencia) as ejecutor:
+            while not self._detener.is_set():
+                ahora = monotonic()
+                if ahora >= proxima_sincronizacion:
+                    self._sincronizar_objetivos(ahora)
+                    proxima_sincronizacion = ahora + MONITOR_RESINCRONIZAR_CADA
+                while self._agenda and self._agenda[0][0] <= ahora and len(en_curso) < self.concurrencia:
+                    _, ip, generacion = heapq.heappop(self._agenda)
+                    if self._generaciones.get(ip) == generacion:
+                        en_curso[ejecutor.submit(sondear_con_cache, ip, MONITOR_CONTEO, MONITOR_TIMEOUT, self.motor, True)] = (ip, generacion)
+
+                for futuro in [f for f in en_curso if f.done()]:
+                    ip, generacion = en_curso.pop(futuro)
+                    if self._generaciones.get(ip) != generacion: # La IP salió del inventario mientras se sondeaba
+                        continue
+                    estado = self.estados[ip]
+                    try:
+                        resultado = futuro.result()
+                        alcanzable, rtt = resultado["ALCANZABLE"], resultado["RTT_PROM"]
+                    except Exception:
+                        alcanzable, rtt = False, None
+                    self.sondeos_realizados += 1
+                    if estado.registrar(alcanzable, rtt, time()) and self.al_cambiar:
+                        self.al_cambiar(estado)
+                    heapq.heappush(self._agenda, (monotonic() + self._espera_siguiente(estado), ip, generacion))
+
+                espera = min(0.5, max(0.01, self._agenda[0][0] - monotonic())) if self._agenda else 0.5
+                if en_curso:
+                    futures_wait(list(en_curso), timeout=espera, return_when=FIRST_COMPLETED)
+                else:
+                    self._detener.wait(espera)
+            for futuro in en_curso:
+                futuro.cancel()
+
+    def resumen(self):
+        estados = list(self.estados.values())
+        return {"activo": self.activo, "intervalo": self.intervalo, "ips": len(estados), "sondeos": self.sondeos_realizados,
+                "alcanzables": sum(1 for e in estados if e.alcanzable is True),
+                "inalcanzables": sum(1 for e in estados if e.alcanzable is False),
+                "pendientes": sum(1 for e in estados if e.alcanzable is None)}
+
+_monitor = None
+
+def iniciar_monitor(repositorio, intervalo=MONITOR_INTERVALO_PREDETERMINADO, concurrencia=PING_CONCURRENCIA_PREDETERMINADA, motor=None, al_cambiar=None):
+    """Arranca el monitor global (deteniendo el anterior, si lo había). Conserva los estados ya conocidos."""
+    global _monitor
+    anterior = _monitor
+    if anterior is not None:
+        anterior.detener()
+    else:
+        atexit.register(detener_monitor)
+    _monitor = MonitorAlcanzabilidad(repositorio, intervalo, concurrencia, motor, al_cambiar)
+    if anterior is not None:
+        _monitor.estados.update(anterior.estados)
+    _monitor.iniciar()
+    return _monitor
+
+def detener_monitor():
+    if _monitor is not None:
+        _monitor.detener()
+
+def estado_alcanzabilidad(ip):
+    """Último estado conocido de la IP según el monitor o, si no lo sondeó, según CACHE_SONDEOS.
+
+    Devuelve None si no hay ninguno. No hace ningún ping.
+    """
+    if not ip or ip == "N/A":
+        return None
+    estado = _monitor.estados.get(ip) if _monitor is not None else None
+    if estado is not None and estado.alcanzable is not None:
+        return estado
+    return CACHE_SONDEOS.estado(ip) or estado
+
+def menu_monitor_alcanzabilidad(dispositivos_lista):
+    while True:
+        mostrar_titulo("📶 MONITOR DE ALCANZABILIDAD")
+        if _monitor is not None:
+            resumen = _monitor.resumen()
+            print(f"{Color.BOLD}Estado:{Color.END} {'🟢 activo' if resumen['activo'] else '⏸️ detenido'} · intervalo {resumen['intervalo']} s · {resumen['sondeos']} sondeos")
+            print(f"{Color.GREEN}Alcanzables: {resumen['alcanzables']}{Color.END} · {Color.RED}Sin respuesta: {resumen['inalcanzables']}{Color.END} · Pendientes: {resumen['pendientes']}\n")
+        else:
+            print(f"{Color.DARKCYAN}El monitor no se ha iniciado en esta sesión.{Color.END}\n")
+        print(f"{Color.YELLOW}1.{Color.END} ▶️ Iniciar / reiniciar monitor")
+        print(f"{Color.YELLOW}2.{Color.END} ⏹️ Detener monitor")
+        print(f"{Color.YELLOW}3.{Color.END} 📋 Ver estado de los dispositivos")
+        print(f"{Color.YELLOW}4.{Color.END} 🕑 Historial de un dispositivo")
+        opcion = input(f"\n{Color.GREEN}↳ Opción (Enter para volver): {Color.END}").strip().lower()
+        if opcion == "":
+            return
+        elif opcion == "1":
+            intervalo = _pedir_entero_con_predeterminado("Intervalo entre sondeos en segundos", MONITOR_INTERVALO_PREDETERMINADO,
+                                                         MONITOR_INTERVALO_MINIMO, MONITOR_INTERVALO_MAXIMO)
+            concurrencia = _pedir_entero_con_predeterminado("Sondeos simultáneos", PING_CONCURRENCIA_PREDETERMINADA, 1, 512)
+            iniciar_monitor(dispositivos_lista, intervalo, concurrencia)
+            mostrar_mensaje(f"Monitor iniciado: {len(dispositivos_lista.ips_asignadas())} IPs cada ~{intervalo} s, en segundo plano.", "exito"); pausa(1)
+        elif opcion == "2":
+            detener_monitor()
+            mostrar_mensaje("Monitor detenido. Se conservan los últimos estados.", "info"); pausa(1)
+        elif opcion == "3":
+            con_ip = [d for d in dispositivos_lista if d.get("IP") and d.get("IP") != "N/A"]
+            con_ip.sort(key=CRITERIOS_ORDEN["e"][1]) # Primero los caídos, luego los pendientes y por último los que responden
+            if paginar_dispositivos(con_ip, "📶 ESTADO DE LOS DISPOSITIVOS") == "s":
+                salir_del_programa()
+        elif opcion == "4":
+            entrada = pedir_nombre_con_autocompletado(dispositivos_lista, f"{Color.GREEN}↳ Nombre del dispositivo: {Color.END}")
+            disp = resolver_seleccion_dispositivo(dispositivos_lista, entrada) if entrada else None
+            estado = estado_alcanzabilidad(disp.get("IP")) if disp else None
+            if disp is not None and estado is None:
+                mostrar_mensaje("Ese dispositivo todavía no tiene sondeos registrados.", "advertencia")
+            elif estado is not None:
+                print(f"\n{Color.BOLD}{disp.get('NOMBRE')} ({estado.ip}){Color.END} - {estado.descripcion()}")
+                for momento, alcanzable, rtt in reversed(estado.historial):
+                    marca = datetime.fromtimestamp(momento).strftime('%H:%M:%S')
+                    print(f"  {marca}  {'🟢' if alcanzable else '🔴'}  {f'{rtt:.1f} ms' if rtt is not None else '-'}")
+            input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+        else:
+            mostrar_mensaje("Opción inválida.", "error"); pausa(1)
 
 
 def menu_ping_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: menu_ping_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     while True:
         mostrar_titulo("🌐 PROBAR CONECTIVIDAD (PING)")
         dispositivos_con_ip = [d for d in dispositivos_lista if d.get("IP") and d.get("IP") != "N/A"]
         if not dispositivos_con_ip:
             mostrar_mensaje("No hay dispositivos con IPs asignadas para hacer ping.", "advertencia", esperar_enter=True)
-            pop_menu_history()(); return
+            return
 
         print(f"{Color.BOLD}Seleccione un dispositivo para hacer PING:{Color.END}")
         for i, d in enumerate(dispositivos_con_ip, 1):
             print(f"{Color.YELLOW}{i}.{Color.END} {d.get('NOMBRE')} ({d.get('IP')})")
+        print(f"\n{Color.YELLOW}t.{Color.END} 📡 Ping a TODOS los dispositivos ({len(dispositivos_con_ip)})")
+        print(f"{Color.YELLOW}f.{Color.END} 🔎 Ping a un conjunto filtrado (tipo, capa, VLAN o nombre)")
+        print(f"{Color.YELLOW}o.{Color.END} 📶 Monitor de alcanzabilidad en segundo plano")
+        print(f"{Color.YELLOW}h.{Color.END} 📈 Historial de latencia (p50/p95/p99 y pérdida)")
 
-        opcion = mostrar_opciones_navegacion(current_menu_func)
+        opcion = mostrar_opciones_navegacion()
 
-        if opcion is None: return
+        if opcion in ACCIONES_NAVEGACION: return opcion
+
+        if opcion == "t":
+            menu_barrido_ping(dispositivos_lista); continue
+        if opcion == "f":
+            menu_barrido_ping(dispositivos_lista, filtrar=True); continue
+        if opcion == "o":
+            menu_monitor_alcanzabilidad(dispositivos_lista); continue
+        if opcion == "h":
+            menu_reporte_latencias(dispositivos_lista); continue
 
         try:
             opcion_num = int(opcion)
             if 1 <= opcion_num <= len(dispositivos_con_ip):
                 hacer_ping(dispositivos_con_ip[opcion_num - 1].get("IP"))
             else:
-                mostrar_mensaje(f"Opción inválida. Debe ser entre 1 y {len(dispositivos_con_ip)} o una opción de navegación.", "error"); sleep(2)
+                mostrar_mensaje(f"Opción inválida. Debe ser entre 1 y {len(dispositivos_con_ip)}, 't', 'f', 'o', 'h' o una opción de navegación.", "error"); pausa(2)
         except ValueError:
-            mostrar_mensaje("Entrada inválida. Por favor, ingrese un número o una opción de navegación.", "error"); sleep(2)
+            mostrar_mensaje("Entrada inválida. Por favor, ingrese un número o una opción de navegación.", "error"); pausa(2)
 
 
 # ---------------- FUNCIONES DE GESTIÓN DE DISPOSITIVOS ----------------
@@ -413,36 +3252,43 @@ def ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=None):
 
         if not ip: # Para agregar nuevo dispositivo o si se borra la IP en modificación
             return "N/A"
+        if "/" in ip: # Se indicó una red: se propone la siguiente IP libre
+            try:
+                siguiente = dispositivos_lista.siguiente_ip_libre(ip)
+            except ValueError as e:
+                mostrar_mensaje(str(e), "error"); continue
+            if siguiente is None:
+                mostrar_mensaje(f"No quedan IPs libres en {ip}.", "advertencia"); continue
+            resumen = dispositivos_lista.resumen_red(ip)
+            print(f"{Color.DARKCYAN}Red {resumen['RED']}: {resumen['EN_USO']} en uso, {resumen['LIBRES']} libres.{Color.END}")
+            if input(f"{Color.GREEN}¿Usar la siguiente IP libre {siguiente}? (s/n): {Color.END}").strip().lower() != 's':
+                continue
+            ip = siguiente
         try:
             validar_ip(ip)
-            if ip != "N/A":
-                for disp in dispositivos_lista:
-                    if disp is dispositivo_actual: # No comparar consigo mismo si se está modificando
-                        continue
-                    if disp.get("IP") == ip:
-                        raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{disp.get('NOMBRE')}'. Use una IP única.")
+            propietario = dispositivos_lista.ip_en_uso(ip, excluir=dispositivo_actual) # No comparar consigo mismo si se está modificando
+            if propietario:
+                raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'. Use una IP única.")
             return ip
         except ValueError as e:
             mostrar_mensaje(f"{str(e)}", "error")
             if "Formato incorrecto" in str(e) or "Octeto" in str(e):
-                print(f"{Color.YELLOW}💡 Ejemplos: 192.168.1.10, 10.0.0.5{Color.END}")
+                print(f"{Color.YELLOW}💡 Ejemplos: 192.168.1.10, 10.0.0.5 (o una red como 10.0.0.0/24 para usar la siguiente IP libre){Color.END}")
 
 
 def agregar_dispositivo_interactivo(dispositivos_lista):
-    current_menu_func = lambda: agregar_dispositivo_interactivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📱 AGREGAR NUEVO DISPOSITIVO")
 
     tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo de dispositivo:", "Tipo", permitir_cancelar=True)
     if tipo is None:
-        pop_menu_history()(); return
+        return
 
     nombre = ""
     while not nombre:
         temp_nombre = input(f"{Color.GREEN}↳ Nombre del dispositivo (3-50 caract.): {Color.END}").strip()
         try:
             validar_nombre(temp_nombre)
-            if any(d.get("NOMBRE","").lower() == temp_nombre.lower() for d in dispositivos_lista):
+            if dispositivos_lista.nombre_existe(temp_nombre):
                 mostrar_mensaje(f"El nombre '{temp_nombre}' ya existe. Intente con otro.", "advertencia")
             else:
                 nombre = temp_nombre
@@ -450,11 +3296,11 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
             mostrar_mensaje(str(e), "error")
 
     ip_asignada = "N/A"
-    tipo_key = next((k for k, v in TIPOS_DISPOSITIVO.items() if v == tipo), None)
+    tipo_key = CLAVE_POR_TIPO.get(tipo)
     # Todos los dispositivos pueden tener IP opcionalmente
     ip_asignada = ingresar_ip_interactivo(dispositivos_lista)
     if ip_asignada is None: # Esto no debería pasar con la lógica actual de ingresar_ip_interactivo
-        pop_menu_history()(); return
+        return
 
 
     ubicacion_asignada = "N/A" # Usamos 'ubicacion' en lugar de 'capa'
@@ -463,7 +3309,7 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
         ubicacion_sel = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la ubicación/capa de red:", "Ubicación/Capa", permitir_cancelar=True)
         if ubicacion_sel is None:
             mostrar_mensaje("Se asignará 'N/A' a la ubicación/capa de red.", "info")
-            sleep(1)
+            pausa(1)
         else:
             ubicacion_asignada = ubicacion_sel
     else: # Para otros tipos de dispositivo, preguntar si se desea añadir ubicación
@@ -513,15 +3359,15 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
     # VLANs pueden aplicar a muchos dispositivos, no solo switches.
     if input(f"{Color.GREEN}¿Desea asignar VLANs a este {tipo}? (s/n): {Color.END}").lower() == 's':
         print(f"\n{Color.BOLD}🔗 Agregar VLANs al dispositivo '{nombre}':{Color.END}")
-        print(f"{Color.DARKCYAN}Puede ingresar varias VLANs separadas por comas (ej: 10,20,30).{Color.END}")
+        print(f"{Color.DARKCYAN}Puede ingresar varias VLANs separadas por comas y rangos (ej: 10,20,30-40).{Color.END}")
         print(f"{Color.DARKCYAN}Presione Enter si no desea asignar VLANs.{Color.END}")
         while True:
-            vlans_input_str = input(f"{Color.GREEN}↳ Ingrese VLANs (números entre 1-4094, separados por coma): {Color.END}").strip()
+            vlans_input_str = input(f"{Color.GREEN}↳ Ingrese VLANs (números entre 1-4094 o rangos, separados por coma): {Color.END}").strip()
             if not vlans_input_str:
                 break
             try:
                 vlans_list = validar_vlans_input(vlans_input_str)
-                mostrar_mensaje(f"VLANs asignadas: {', '.join(map(str, vlans_list)) if vlans_list else 'Ninguna'}", "exito")
+                mostrar_mensaje(f"VLANs asignadas: {formatear_vlans(vlans_list) if vlans_list else 'Ninguna'}", "exito")
                 break
             except ValueError as e:
                 mostrar_mensaje(str(e), "error")
@@ -530,126 +3376,332 @@ def agregar_dispositivo_interactivo(dispositivos_lista):
     nuevo_disp = crear_dispositivo(tipo, nombre, ip_asignada, ubicacion_asignada, servicios_sel_list, vlans_list)
 
     if nuevo_disp:
-        dispositivos_lista.append(nuevo_disp)
+        dispositivos_lista.agregar(nuevo_disp)
         guardar_dispositivos_en_archivo(dispositivos_lista) # <<< GUARDAR DATOS
         mostrar_mensaje(f"Dispositivo '{nombre}' agregado exitosamente!", "exito")
         mostrar_barra_progreso(1, "Guardando datos del dispositivo...", sufijo="¡Dispositivo guardado!")
     else:
-        mostrar_mensaje("No se pudo agregar el dispositivo debido a errores previos.", "error"); sleep(2)
-
-    pop_menu_history()();
+        mostrar_mensaje("No se pudo agregar el dispositivo debido a errores previos.", "error"); pausa(2)
 
 
 def formatear_dispositivo_para_mostrar(disp_data, numero=None):
-    partes = []
-    if numero:
-        partes.append(f"{Color.YELLOW}{numero}.{Color.END}")
-
-    partes.append(f"{Color.CYAN}🔧 TIPO:{Color.END} {disp_data.get('TIPO', 'N/A')}")
-    partes.append(f"{Color.CYAN}🏷️ NOMBRE:{Color.END} {disp_data.get('NOMBRE', 'N/A')}")
-    partes.append(f"{Color.CYAN}🌍 IP:{Color.END} {disp_data.get('IP', 'N/A')}")
-    partes.append(f"{Color.CYAN}📍 UBICACIÓN/CAPA:{Color.END} {disp_data.get('UBICACION', 'N/A')}") # Cambiado 'CAPA' a 'UBICACION'
-
     servicios_lista = disp_data.get('SERVICIOS', [])
-    servicios_str = ", ".join(servicios_lista) if servicios_lista else "Ninguno"
-    partes.append(f"{Color.CYAN}🛠️ SERVICIOS:{Color.END} {servicios_str}")
-
     vlans_lista = disp_data.get('VLANS', [])
-    vlans_str = ", ".join(map(str, vlans_lista)) if vlans_lista else "Ninguna"
-    partes.append(f"{Color.CYAN}🔗 VLANs:{Color.END} {vlans_str}")
-
-    text_parts_for_width = []
-    if numero: text_parts_for_width.append(f"{numero}.")
-    text_parts_for_width.extend([
-        f" TIPO: {disp_data.get('TIPO', 'N/A')}",
-        f" NOMBRE: {disp_data.get('NOMBRE', 'N/A')}",
-        f" IP: {disp_data.get('IP', 'N/A')}",
-        f" UBICACIÓN/CAPA: {disp_data.get('UBICACION', 'N/A')}", # Cambiado
-        f" SERVICIOS: {servicios_str}",
-        f" VLANs: {vlans_str}"
-    ])
-    separador_ancho = max(70, max(len(p) for p in text_parts_for_width) + 4 if text_parts_for_width else 70)
+    campos = (
+        ("🔧 TIPO:", " TIPO: ", disp_data.get('TIPO', 'N/A')),
+        ("🏷️ NOMBRE:", " NOMBRE: ", disp_data.get('NOMBRE', 'N/A')),
+        ("🌍 IP:", " IP: ", disp_data.get('IP', 'N/A')),
+        ("📍 UBICACIÓN/CAPA:", " UBICACIÓN/CAPA: ", disp_data.get('UBICACION', 'N/A')), # Cambiado 'CAPA' a 'UBICACION'
+        ("🛠️ SERVICIOS:", " SERVICIOS: ", ", ".join(servicios_lista) if servicios_lista else "Ninguno"),
+        ("🔗 VLANs:", " VLANs: ", formatear_vlans(vlans_lista) if vlans_lista else "Ninguna")
+    )
+    estado = estado_alcanzabilidad(disp_data.get('IP'))
+    if estado is not None: # Último resultado del monitor; no se hace ningún ping
+        campos += (("📶 ESTADO:", " ESTADO: ", estado.descripcion()),)
+    partes = [f"{Color.YELLOW}{numero}.{Color.END}"] if numero else []
+    partes.extend(f"{Color.CYAN}{etiqueta}{Color.END} {valor}" for etiqueta, _, valor in campos)
+
+    # El ancho se calcula con las longitudes del texto plano, sin construir una segunda lista de cadenas
+    ancho_texto = max(len(etiqueta_plana) + len(str(valor)) for _, etiqueta_plana, valor in campos)
+    if numero: ancho_texto = max(ancho_texto, len(str(numero)) + 1)
+    separador_ancho = max(70, ancho_texto + 4)
     separador = f"{Color.BLUE}{'─' * separador_ancho}{Color.END}"
     return f"\n{separador}\n" + "\n".join(partes) + f"\n{separador}"
 
 
+# ---------------- Listado paginado ----------------
+TAMANO_PAGINA_PREDETERMINADO = int(os.environ.get("P1_TAMANO_PAGINA", "10")) # Dispositivos por página en el paginador
+
+def _sin_icono(valor):
+    """'🔀 Switch' -> 'Switch'. Los valores mostrados llevan un emoji delante que descuadra las columnas."""
+    partes = str(valor).split(" ", 1)
+    return partes[1] if len(partes) == 2 and not partes[0].isalnum() else str(valor)
+
+def _clave_orden_ip(disp):
+    """Orden numérico de IPs; los dispositivos sin IP válida van al final."""
+    entero = ip_a_entero(disp.get("IP", ""))
+    return (0, entero) if entero is not None else (1, 0)
+
+CRITERIOS_ORDEN = {
+    "o": ("original", None),
+    "n": ("nombre", lambda d: d.get("NOMBRE", "").lower()),
+    "i": ("IP", _clave_orden_ip),
+    "t": ("tipo", lambda d: (_sin_icono(d.get("TIPO", "")).lower(), d.get("NOMBRE", "").lower())),
+    "e": ("estado", lambda d: ({False: 0, None: 1, True: 2}[getattr(estado_alcanzabilidad(d.get("IP")), "alcanzable", None)], d.get("NOMBRE", "").lower())),
+}
+
+COLUMNAS_TABLA = (("#", 6), ("NOMBRE", 22), ("IP", 16), ("TIPO", 10), ("CAPA", 14), ("SERV.", 5), ("VLANS", 5), ("ESTADO", 6))
+
+def formatear_fila_compacta(disp_data, numero):
+    """Una línea por dispositivo para la vista de tabla."""
+    valores = (
+        f"{numero}.", disp_data.get("NOMBRE", "N/A"), disp_data.get("IP", "N/A"), _sin_icono(disp_data.get("TIPO", "N/A")),
+        _sin_icono(disp_data.get("UBICACION", "N/A")), len(disp_data.get("SERVICIOS", [])), len(disp_data.get("VLANS", [])),
+        getattr(estado_alcanzabilidad(disp_data.get("IP")), "texto_corto", lambda: "-")()
+    )
+    celdas = []
+    for (_, ancho), valor in zip(COLUMNAS_TABLA, valores):
+        texto = str(valor)
+        celdas.append((texto[:ancho - 1] + "…" if len(texto) > ancho else texto).ljust(ancho))
+    return f"{Color.YELLOW}{celdas[0]}{Color.END} " + " ".join(celdas[1:])
+
+def paginar_dispositivos(dispositivos_lista, titulo, tamano_pagina=None, acciones=None):
+    """Paginador interactivo: solo se formatean los dispositivos de la página visible.
+
+    Comandos: n/p (siguiente/anterior), un número (ir a página), v (detalle/tabla),
+    o + criterio (ordenar: on, oi, ot, oe, oo), t + número (tamaño de página).
+    'acciones' agrega comandos propios ({'e': 'exportar'}) que, igual que Enter, 'm', 'b' o 's',
+    terminan el paginador. Devuelve el comando con el que el usuario salió ('' para Enter).
+    """
+    tamano_pagina = max(1, tamano_pagina or TAMANO_PAGINA_PREDETERMINADO)
+    pagina = 0
+    vista_tabla = False
+    criterio = "o"
+    orden = dispositivos_lista # Se ordenan referencias, nunca copias ni textos formateados
+    mensaje = None
+
+    while True:
+        total = len(orden)
+        total_paginas = max(1, -(-total // tamano_pagina))
+        pagina = min(max(pagina, 0), total_paginas - 1)
+        inicio = pagina * tamano_pagina
+
+        mostrar_titulo(titulo)
+        if vista_tabla:
+            print(f"{Color.BOLD}" + " ".join(nombre.ljust(ancho) for nombre, ancho in COLUMNAS_TABLA) + f"{Color.END}")
+            print(f"{Color.BLUE}{'─' * 70}{Color.END}")
+        for i in range(inicio, min(inicio + tamano_pagina, total)):
+            disp_data = orden[i]
+            print(formatear_fila_compacta(disp_data, i + 1) if vista_tabla else formatear_dispositivo_para_mostrar(disp_data, i + 1))
+
+        print(f"\n{Color.DARKCYAN}Página {pagina + 1}/{total_paginas} · {total} dispositivos · orden: {CRITERIOS_ORDEN[criterio][0]} · "
+              f"vista: {'tabla' if vista_tabla else 'detalle'}{Color.END}")
+        print(f"{Color.YELLOW}n/p{Color.END} pág. siguiente/anterior · {Color.YELLOW}<número>{Color.END} ir a página · "
+              f"{Color.YELLOW}v{Color.END} cambiar vista · {Color.YELLOW}on/oi/ot/oe/oo{Color.END} ordenar · {Color.YELLOW}t<N>{Color.END} tamaño")
+        if acciones:
+            print(" · ".join(f"{Color.YELLOW}{comando}{Color.END} {descripcion}" for comando, descripcion in acciones.items()))
+        print(f"{Color.YELLOW}Enter{Color.END} volver · {Color.YELLOW}m{Color.END} menú principal · {Color.YELLOW}s{Color.END} salir")
+        if mensaje:
+            mostrar_mensaje(mensaje, "error"); mensaje = None
+
+        opcion = input(f"{Color.GREEN}↳ Opción: {Color.END}").strip().lower()
+        if opcion in ("", "b", "m", "s") or (acciones and opcion in acciones):
+            return opcion
+        elif opcion in ("n", "p"):
+            pagina += 1 if opcion == "n" else -1
+        elif opcion.isdigit():
+            if 1 <= int(opcion) <= total_paginas: pagina = int(opcion) - 1
+            else: mensaje = f"Página fuera de rango (1-{total_paginas})."
+        elif opcion == "v":
+            vista_tabla = not vista_tabla
+        elif opcion.startswith("o") and opcion[1:] in CRITERIOS_ORDEN:
+            criterio = opcion[1:]
+            clave = CRITERIOS_ORDEN[criterio][1]
+            orden = dispositivos_lista if clave is None else sorted(dispositivos_lista, key=clave)
+            pagina = 0
+        elif opcion.startswith("t") and opcion[1:].strip().isdigit() and int(opcion[1:]) > 0:
+            primero = inicio # Se conserva el primer dispositivo visible al cambiar el tamaño
+            tamano_pagina = int(opcion[1:])
+            pagina = primero // tamano_pagina
+        else:
+            mensaje = "Opción inválida."
+
+
 def mostrar_dispositivos(dispositivos_lista, titulo_menu="📜 MOSTRAR TODOS LOS DISPOSITIVOS"):
-    current_menu_func = lambda: mostrar_dispositivos(dispositivos_lista, titulo_menu)
-    push_menu_history(current_menu_func)
     mostrar_titulo(titulo_menu)
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para mostrar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return
 
-    for i, disp_data in enumerate(dispositivos_lista, 1):
-        print(formatear_dispositivo_para_mostrar(disp_data, i))
+    opcion = paginar_dispositivos(dispositivos_lista, titulo_menu)
+    if opcion in (NAV_PRINCIPAL, NAV_SALIR):
+        return opcion
 
-    print(f"\n{Color.GREEN}Presione Enter o seleccione una opción de navegación para volver...{Color.END}")
-    opcion = mostrar_opciones_navegacion(current_menu_func)
-    if opcion is None: return
-    elif opcion == "" or opcion.lower() == "enter":
-        pop_menu_history()()
-        return
-    else:
-        mostrar_mensaje("Volviendo al menú anterior...", "info"); sleep(1)
-        pop_menu_history()()
+
+def buscar_dispositivos_por_nombre(dispositivos_lista, nombre_buscar):
+    """Dispositivos cuyo nombre contiene 'nombre_buscar' (sin distinguir mayúsculas)."""
+    if MODO_ALMACENAMIENTO == "sqlite" and hasattr(dispositivos_lista, "buscar_por_nombre"):
+        nombres = obtener_almacen_sqlite().buscar_nombres(nombre_buscar)
+        return [d for d in map(dispositivos_lista.buscar_por_nombre, nombres) if d is not None]
+    if hasattr(dispositivos_lista, "nombres_que_contienen"):
+        return dispositivos_lista.nombres_que_contienen(nombre_buscar) # Índice de trigramas, sin recorrer el inventario
+    nombre_buscar_lower = nombre_buscar.lower()
+    return [d for d in dispositivos_lista if nombre_buscar_lower in d.get("NOMBRE", "").lower()]
 
 
 def buscar_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: buscar_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
-    mostrar_titulo("🔍 BUSCAR DISPOSITIVO")
+    while True: # Al volver de los resultados se ofrece una nueva búsqueda
+        mostrar_titulo("🔍 BUSCAR DISPOSITIVO")
 
-    if not dispositivos_lista:
-        mostrar_mensaje("No hay dispositivos para buscar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        if not dispositivos_lista:
+            mostrar_mensaje("No hay dispositivos para buscar.", "advertencia", esperar_enter=True)
+            return
 
-    nombre_buscar = input(f"{Color.GREEN}↳ Ingrese el nombre (o parte del nombre) a buscar (Enter para cancelar): {Color.END}").strip()
-    if not nombre_buscar:
-        mostrar_mensaje("Búsqueda cancelada.", "info"); sleep(1)
-        pop_menu_history()(); return
+        print(f"{Color.DARKCYAN}Escriba parte del nombre, o una consulta con campos: tipo:, capa:, servicio:, vlan:, ip:, nombre:{Color.END}")
+        print(f"{Color.DARKCYAN}Ej: tipo:switch capa:core vlan:10-20   |   (servicio:dns OR servicio:dhcp) AND ip:192.168.1.0/24 AND NOT nombre:lab*{Color.END}\n")
+        nombre_buscar = pedir_nombre_con_autocompletado(dispositivos_lista, f"{Color.GREEN}↳ Nombre o consulta a buscar (Enter para cancelar): {Color.END}")
+        if not nombre_buscar:
+            mostrar_mensaje("Búsqueda cancelada.", "info"); pausa(1)
+            return
 
-    nombre_buscar_lower = nombre_buscar.lower()
-    encontrados = [d for d in dispositivos_lista if nombre_buscar_lower in d.get("NOMBRE", "").lower()]
+        if ":" in nombre_buscar or "(" in nombre_buscar: # Consulta multicampo
+            try:
+                encontrados = consultar_dispositivos(dispositivos_lista, nombre_buscar)
+            except ValueError as e:
+                mostrar_mensaje(f"Consulta no válida: {e}", "error", esperar_enter=True)
+                return
+        else:
+            encontrados = buscar_dispositivos_por_nombre(dispositivos_lista, nombre_buscar)
+
+        if not encontrados:
+            sugerencias = dispositivos_lista.nombres_parecidos(nombre_buscar) if ":" not in nombre_buscar else []
+            if sugerencias:
+                mostrar_mensaje(f"No se encontraron dispositivos para '{nombre_buscar}'. ¿Quiso decir: {', '.join(sugerencias)}?", "advertencia", esperar_enter=True)
+            else:
+                mostrar_mensaje(f"No se encontraron dispositivos para '{nombre_buscar}'.", "advertencia", esperar_enter=True)
+            return
 
-    if encontrados:
         mostrar_barra_progreso(0.5, "Buscando dispositivos...")
-        # Llamar a una función que no reinicie el historial para la sub-vista de resultados
-        _mostrar_resultados_busqueda(encontrados, f"✨ RESULTADOS DE BÚSQUEDA PARA '{nombre_buscar}'", current_menu_func)
-    else:
-        mostrar_mensaje(f"No se encontraron dispositivos con el nombre '{nombre_buscar}'.", "advertencia", esperar_enter=True)
-        pop_menu_history()();
+        accion = _mostrar_resultados_busqueda(encontrados, f"✨ RESULTADOS DE BÚSQUEDA PARA '{nombre_buscar}'")
+        if accion in (NAV_PRINCIPAL, NAV_SALIR):
+            return accion
 
-def _mostrar_resultados_busqueda(dispositivos_encontrados, titulo, menu_anterior_func):
-    """Función auxiliar para mostrar resultados sin afectar tanto el historial principal."""
+def _mostrar_resultados_busqueda(dispositivos_encontrados, titulo):
+    """Muestra los resultados en el paginador. Devuelve NAV_PRINCIPAL o NAV_SALIR si el usuario los eligió, o None."""
     mostrar_titulo(titulo)
     if not dispositivos_encontrados: # doble chequeo
         mostrar_mensaje("No hay dispositivos para mostrar.", "advertencia", esperar_enter=True)
-        menu_anterior_func(); return # Vuelve al menú de búsqueda
+        return None
+
+    acciones = {"e": "exportar resultados", "g": "barrido de ping a los resultados"}
+    while True:
+        opcion = paginar_dispositivos(dispositivos_encontrados, titulo, acciones=acciones)
+        if opcion == "e":
+            try:
+                ruta = escribir_reporte_dispositivos(dispositivos_encontrados)
+                mostrar_mensaje(f"Resultados ({len(dispositivos_encontrados)}) exportados a: {os.path.abspath(ruta)}", "exito", esperar_enter=True)
+            except OSError as e:
+                mostrar_mensaje(f"Error al exportar: {e}", "error", esperar_enter=True)
+        elif opcion == "g":
+            menu_barrido_ping(dispositivos_encontrados)
+        else:
+            break
+    return opcion if opcion in (NAV_PRINCIPAL, NAV_SALIR) else None
 
-    for i, disp_data in enumerate(dispositivos_encontrados, 1):
-        print(formatear_dispositivo_para_mostrar(disp_data, i))
 
-    print(f"\n{Color.GREEN}Presione Enter para volver a la búsqueda o 'm' para Menú Principal...{Color.END}")
+def menu_consultas_vlan(dispositivos_lista):
+    """Consultas por VLAN resueltas con el índice invertido VLAN -> dispositivos y los bitsets de cada dispositivo."""
     while True:
-        opcion = input(f"{Color.GREEN}↳ Opción: {Color.END}").strip().lower()
-        if opcion == "":
-            menu_anterior_func(); return
-        elif opcion == "m":
-            ir_a_menu_principal(); return
+        mostrar_titulo("🔗 CONSULTAS DE VLAN")
+        if not dispositivos_lista:
+            mostrar_mensaje("No hay dispositivos registrados.", "advertencia", esperar_enter=True)
+            return
+        print(f"{Color.DARKCYAN}VLANs en uso en la red: {len(vlans_de_mascara(dispositivos_lista.mascara_vlans_en_uso()))}{Color.END}\n")
+        print(f"{Color.YELLOW}1.{Color.END} Dispositivos que llevan una VLAN (o alguna de un rango)")
+        print(f"{Color.YELLOW}2.{Color.END} VLANs compartidas entre dos dispositivos")
+        print(f"{Color.YELLOW}3.{Color.END} VLANs configuradas en un solo dispositivo de un tipo (p. ej. en un solo switch)")
+        print(f"{Color.YELLOW}0.{Color.END} Volver")
+        opcion = input(f"\n{Color.GREEN}↳ Opción (0-3): {Color.END}").strip()
+
+        if opcion == "0" or not opcion:
+            return
+        elif opcion == "1":
+            vlans_str = input(f"{Color.GREEN}↳ VLANs (ej: 20, 10-200 o 10,30-40): {Color.END}").strip()
+            try:
+                vlans = validar_vlans_input(vlans_str, avisar_duplicados=False)
+            except ValueError as e:
+                mostrar_mensaje(str(e), "error", esperar_enter=True); continue
+            if not vlans: continue
+            encontrados = dispositivos_lista.por_vlans(mascara_de_vlans(vlans))
+            if not encontrados:
+                mostrar_mensaje(f"Ningún dispositivo lleva la(s) VLAN(s) {formatear_vlans(vlans)}.", "advertencia", esperar_enter=True)
+                continue
+            accion = _mostrar_resultados_busqueda(encontrados, f"🔗 DISPOSITIVOS CON VLAN {formatear_vlans(vlans)}")
+            if accion in (NAV_PRINCIPAL, NAV_SALIR):
+                return accion
+        elif opcion == "2":
+            dispositivos = []
+            for orden in ("primer", "segundo"):
+                nombre = pedir_nombre_con_autocompletado(dispositivos_lista, f"{Color.GREEN}↳ Nombre del {orden} dispositivo (Enter para cancelar): {Color.END}")
+                disp = dispositivos_lista.buscar_por_nombre(nombre) if nombre else None
+                if disp is None:
+                    if nombre: mostrar_mensaje(f"Dispositivo '{nombre}' no encontrado.", "error", esperar_enter=True)
+                    break
+                dispositivos.append(disp)
+            if len(dispositivos) < 2: continue
+            compartidas, solo_a, solo_b = vlans_compartidas(*dispositivos)
+            nombre_a, nombre_b = (d.get("NOMBRE") for d in dispositivos)
+            print(f"\n{Color.BOLD}VLANs compartidas:{Color.END} {formatear_vlans(compartidas) or 'Ninguna'}")
+            print(f"{Color.CYAN}Solo en {nombre_a}:{Color.END} {formatear_vlans(solo_a) or 'Ninguna'}")
+            print(f"{Color.CYAN}Solo en {nombre_b}:{Color.END} {formatear_vlans(solo_b) or 'Ninguna'}")
+            input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
+        elif opcion == "3":
+            tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el tipo de dispositivo:", "Tipo", permitir_cancelar=True)
+            if tipo is None: continue
+            exclusivas = dispositivos_lista.vlans_exclusivas(dispositivos_lista.por_tipo(tipo))
+            if not exclusivas:
+                mostrar_mensaje(f"No hay VLANs configuradas en un solo dispositivo de tipo {tipo}.", "info", esperar_enter=True)
+                continue
+            print(f"\n{Color.BOLD}VLANs que solo aparecen en un dispositivo de tipo {tipo}:{Color.END}")
+            for disp, vlans in exclusivas:
+                print(f"  {Color.YELLOW}{disp.get('NOMBRE')}:{Color.END} {formatear_vlans(vlans)}")
+            input(f"\n{Color.GREEN}Presione Enter para continuar...{Color.END}")
         else:
-            mostrar_mensaje("Opción inválida.", "error")
+            mostrar_mensaje("Opción inválida.", "error"); pausa(1)
+
+
+def pedir_nombre_con_autocompletado(dispositivos_lista, prompt):
+    """input() con autocompletado de nombres de dispositivo (Tab) cuando readline está disponible."""
+    if readline is None or not hasattr(dispositivos_lista, "nombres_con_prefijo"):
+        return input(prompt).strip()
+    coincidencias = []
+    def completar(texto, estado):
+        if estado == 0:
+            coincidencias[:] = dispositivos_lista.nombres_con_prefijo(texto, limite=50)
+        return coincidencias[estado] if estado < len(coincidencias) else None
+    completador_anterior = readline.get_completer()
+    delimitadores_anteriores = readline.get_completer_delims()
+    readline.set_completer(completar)
+    readline.set_completer_delims("") # Los nombres pueden llevar guiones o puntos
+    readline.parse_and_bind("tab: complete")
+    try:
+        return input(prompt).strip()
+    finally:
+        readline.set_completer(completador_anterior)
+        readline.set_completer_delims(delimitadores_anteriores)
+
+def resolver_seleccion_dispositivo(dispositivos_lista, entrada):
+    """Convierte la entrada del usuario (número de la lista, nombre o inicio único del nombre) en un dispositivo.
+
+    Si no hay coincidencia única muestra el motivo (con sugerencias) y devuelve None.
+    """
+    if entrada.isdigit():
+        indice = int(entrada) - 1
+        if 0 <= indice < len(dispositivos_lista):
+            return dispositivos_lista[indice]
+        mostrar_mensaje(f"Número de dispositivo inválido. Debe ser entre 1 y {len(dispositivos_lista)} o 0.", "error")
+        return None
+    disp = dispositivos_lista.buscar_por_nombre(entrada)
+    if disp is not None:
+        return disp
+    por_prefijo = dispositivos_lista.nombres_con_prefijo(entrada, limite=6)
+    if len(por_prefijo) == 1:
+        return dispositivos_lista.buscar_por_nombre(por_prefijo[0])
+    if por_prefijo:
+        mostrar_mensaje(f"'{entrada}' coincide con varios dispositivos: {', '.join(por_prefijo[:5])}{'...' if len(por_prefijo) > 5 else ''}", "advertencia")
+        return None
+    sugerencias = dispositivos_lista.nombres_parecidos(entrada)
+    mostrar_mensaje(f"No existe el dispositivo '{entrada}'." + (f" ¿Quiso decir: {', '.join(sugerencias)}?" if sugerencias else ""), "error")
+    return None
 
 
 # <<< NUEVA FUNCIÓN PARA MODIFICAR DISPOSITIVO >>>
 def modificar_dispositivo_interactivo(dispositivos_lista):
-    current_menu_func = lambda: modificar_dispositivo_interactivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("✏️ MODIFICAR DISPOSITIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para modificar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return
 
     print(f"{Color.BOLD}Seleccione el dispositivo a modificar:{Color.END}\n")
     for i, d in enumerate(dispositivos_lista, 1):
@@ -657,19 +3709,16 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
     print(f"{Color.YELLOW}0.{Color.END} Cancelar / Volver")
 
     try:
-        num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (0-{len(dispositivos_lista)}): {Color.END}").strip()
-        if num_in == "0":
-            mostrar_mensaje("Modificación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+        num_in = pedir_nombre_con_autocompletado(dispositivos_lista, f"\n{Color.GREEN}↳ Número (0-{len(dispositivos_lista)}) o nombre del dispositivo (Tab autocompleta): {Color.END}")
+        if num_in in ("0", ""):
+            mostrar_mensaje("Modificación cancelada.", "info"); pausa(1)
+            return
 
-        idx_sel = int(num_in) - 1
-        if not (0 <= idx_sel < len(dispositivos_lista)):
-            mostrar_mensaje("Número de dispositivo inválido.", "error"); sleep(2)
-            # No salir del menú de modificar, permitir reintentar la selección del dispositivo
-            # modificar_dispositivo_interactivo(dispositivos_lista) # Esto crea recursión, mejor bucle o re-llamar desde el menú principal
-            return # Volverá a llamar al menú de modificar desde el bucle principal si es necesario
+        disp_a_modificar = resolver_seleccion_dispositivo(dispositivos_lista, num_in)
+        if disp_a_modificar is None:
+            pausa(2)
+            return NAV_REPETIR # No salir del menú de modificar, permitir reintentar la selección del dispositivo
 
-        disp_a_modificar = dispositivos_lista[idx_sel]
         nombre_original = disp_a_modificar.get("NOMBRE")
         modificado = False
 
@@ -699,8 +3748,7 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
                         break
                     try:
                         validar_nombre(temp_nombre)
-                        if temp_nombre.lower() != disp_a_modificar.get('NOMBRE','').lower() and \
-                           any(d.get("NOMBRE","").lower() == temp_nombre.lower() for d in dispositivos_lista if d is not disp_a_modificar):
+                        if dispositivos_lista.nombre_existe(temp_nombre, excluir=disp_a_modificar):
                             mostrar_mensaje(f"El nombre '{temp_nombre}' ya existe para otro dispositivo.", "advertencia")
                         else:
                             nuevo_nombre = temp_nombre
@@ -708,20 +3756,20 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
                     except ValueError as e:
                         mostrar_mensaje(str(e), "error")
                 if nuevo_nombre != disp_a_modificar.get('NOMBRE'):
-                    disp_a_modificar["NOMBRE"] = nuevo_nombre
+                    dispositivos_lista.actualizar(disp_a_modificar, NOMBRE=nuevo_nombre)
                     modificado = True
                     nombre_original = nuevo_nombre # Actualizar para el título
 
             elif op_mod == "2": # Modificar IP
                 nueva_ip = ingresar_ip_interactivo(dispositivos_lista, dispositivo_actual=disp_a_modificar)
                 if nueva_ip is not None and nueva_ip != disp_a_modificar.get('IP'):
-                    disp_a_modificar["IP"] = nueva_ip
+                    dispositivos_lista.actualizar(disp_a_modificar, IP=nueva_ip)
                     modificado = True
 
             elif op_mod == "3": # Modificar Tipo
                 nuevo_tipo = seleccionar_opcion_menu(TIPOS_DISPOSITIVO, "Seleccione el nuevo tipo:", "Tipo", permitir_cancelar=True, valor_actual=disp_a_modificar.get('TIPO'))
                 if nuevo_tipo and nuevo_tipo != disp_a_modificar.get('TIPO'):
-                    disp_a_modificar["TIPO"] = nuevo_tipo
+                    dispositivos_lista.actualizar(disp_a_modificar, TIPO=nuevo_tipo)
                     modificado = True
                     # Podría ser necesario re-evaluar campos dependientes del tipo (ej. Servicios, Ubicación)
                     mostrar_mensaje("El tipo ha cambiado. Considere revisar Servicios y Ubicación/Capa.", "info")
@@ -730,10 +3778,10 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
             elif op_mod == "4": # Modificar Ubicación/Capa
                 nueva_ubicacion = seleccionar_opcion_menu(CAPAS_RED, "Seleccione la nueva ubicación/capa:", "Ubicación/Capa", permitir_cancelar=True, valor_actual=disp_a_modificar.get('UBICACION'))
                 if nueva_ubicacion is not None and nueva_ubicacion != disp_a_modificar.get('UBICACION'): # Si es None, usuario canceló
-                     disp_a_modificar["UBICACION"] = nueva_ubicacion if nueva_ubicacion else "N/A" # Si cancela, puede querer N/A o mantener
+                     dispositivos_lista.actualizar(disp_a_modificar, UBICACION=nueva_ubicacion if nueva_ubicacion else "N/A") # Si cancela, puede querer N/A o mantener
                      modificado = True
                 elif nueva_ubicacion is None and input(f"{Color.YELLOW}¿Desea establecer la ubicación como 'N/A'? (s/n, Enter para cancelar cambio): {Color.END}").lower() == 's':
-                    disp_a_modificar["UBICACION"] = "N/A"
+                    dispositivos_lista.actualizar(disp_a_modificar, UBICACION="N/A")
                     modificado = True
 
 
@@ -748,12 +3796,12 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
                 modificado = True # Asumimos que pudo haber modificación
 
             else:
-                mostrar_mensaje("Opción de modificación inválida.", "error"); sleep(1)
+                mostrar_mensaje("Opción de modificación inválida.", "error"); pausa(1)
 
             if modificado: # Guardar después de cada cambio de atributo si se confirma el cambio
                 guardar_dispositivos_en_archivo(dispositivos_lista)
                 mostrar_mensaje(f"Atributo del dispositivo '{disp_a_modificar.get('NOMBRE')}' actualizado.", "exito")
-                sleep(1) # Pequeña pausa para ver el mensaje
+                pausa(1) # Pequeña pausa para ver el mensaje
                 # modificado = False # Resetear para la siguiente iteración del bucle de atributos
 
         if modificado: # Si hubo alguna modificación general al dispositivo.
@@ -762,20 +3810,18 @@ def modificar_dispositivo_interactivo(dispositivos_lista):
             mostrar_mensaje(f"Dispositivo '{disp_a_modificar.get('NOMBRE')}' modificado exitosamente.", "exito")
         else:
             mostrar_mensaje("No se realizaron cambios en el dispositivo.", "info")
-        sleep(1)
+        pausa(1)
 
     except ValueError:
-        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); sleep(2)
+        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); pausa(2)
     except Exception as e:
         mostrar_mensaje(f"Error inesperado durante la modificación: {e}", "error", esperar_enter=True)
-
-    pop_menu_history()();
 # <<< FIN NUEVA FUNCIÓN PARA MODIFICAR DISPOSITIVO >>>
 
 
 def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
     """Función auxiliar para gestionar servicios de un dispositivo específico."""
-    tipo_key = next((k for k,v in TIPOS_DISPOSITIVO.items() if v == disp_mod.get("TIPO")), None)
+    tipo_key = CLAVE_POR_TIPO.get(disp_mod.get("TIPO"))
     if tipo_key not in ['SERVIDOR', 'ROUTER', 'FIREWALL']:
         mostrar_mensaje(f"Los servicios no suelen aplicar directamente al tipo '{disp_mod.get('TIPO')}'.", "advertencia", esperar_enter=True)
         return False # No hubo cambios
@@ -837,7 +3883,7 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
 
             if valido and nuevos_servicios_temp:
                 servicios_actuales.extend(nuevos_servicios_temp)
-                disp_mod["SERVICIOS"] = sorted(list(set(servicios_actuales)))
+                dispositivos_lista_global.actualizar(disp_mod, SERVICIOS=sorted(list(set(servicios_actuales))))
                 hubo_cambios = True
                 mostrar_mensaje(f"Servicios {', '.join(nuevos_servicios_temp)} agregados.", "exito")
 
@@ -871,7 +3917,7 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
                 # Eliminar en orden inverso de índice para no afectar los índices restantes
                 for idx_to_remove in sorted(servicios_a_eliminar_idx, reverse=True):
                     servicios_eliminados_nombres.append(servicios_actuales.pop(idx_to_remove))
-                disp_mod["SERVICIOS"] = sorted(list(set(servicios_actuales))) # Asegurar orden y unicidad
+                dispositivos_lista_global.actualizar(disp_mod, SERVICIOS=sorted(list(set(servicios_actuales)))) # Asegurar orden y unicidad
                 hubo_cambios = True
                 mostrar_mensaje(f"Servicios {', '.join(reversed(servicios_eliminados_nombres))} eliminados.", "exito")
         else:
@@ -879,18 +3925,18 @@ def _modificar_servicios_para_dispositivo(disp_mod, dispositivos_lista_global):
 
         if hubo_cambios:
             guardar_dispositivos_en_archivo(dispositivos_lista_global)
-            sleep(1)
+            pausa(1)
     return hubo_cambios
 
 
 def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
-    """Función auxiliar para gestionar VLANs de un dispositivo específico."""
-    vlans_actuales = disp_mod.get("VLANS", [])
+    """Función auxiliar para gestionar VLANs de un dispositivo específico (con bitsets, ver CONJUNTOS DE VLANS)."""
+    vlans_actuales = mascara_de_vlans(disp_mod.get("VLANS", []))
     hubo_cambios_vlan = False
 
     while True:
         mostrar_titulo(f"MODIFICAR VLANS DE: {disp_mod.get('NOMBRE')}")
-        print(f"{Color.DARKCYAN}VLANs actuales: {', '.join(map(str, vlans_actuales)) or 'Ninguna'}{Color.END}")
+        print(f"{Color.DARKCYAN}VLANs actuales: {formatear_vlans(vlans_de_mascara(vlans_actuales)) or 'Ninguna'}{Color.END}")
         print(f"{Color.YELLOW}1.{Color.END} Agregar VLAN(s)")
         print(f"{Color.YELLOW}2.{Color.END} Eliminar VLAN(s)")
         print(f"{Color.YELLOW}0.{Color.END} Finalizar modificación de VLANs")
@@ -900,20 +3946,20 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
 
         elif op_vlan == "1": # Agregar VLANs
             print(f"\n{Color.BOLD}🔗 Agregar VLANs a '{disp_mod.get('NOMBRE')}':{Color.END}")
-            print(f"{Color.DARKCYAN}Puede ingresar varias VLANs separadas por comas (ej: 10,20,30).{Color.END}")
+            print(f"{Color.DARKCYAN}Puede ingresar varias VLANs separadas por comas y rangos (ej: 10,20,30-40).{Color.END}")
             while True:
                 vlans_input_str = input(f"{Color.GREEN}↳ Ingrese VLANs a agregar (1-4094, sep. por coma, Enter para cancelar): {Color.END}").strip()
                 if not vlans_input_str: break
                 try:
-                    nuevas_vlans_list = validar_vlans_input(vlans_input_str) # Valida y convierte a int
-                    vlans_realmente_nuevas = [v for v in nuevas_vlans_list if v not in vlans_actuales]
+                    nuevas_vlans = mascara_de_vlans(validar_vlans_input(vlans_input_str)) # Valida y convierte a bitset
+                    vlans_realmente_nuevas = nuevas_vlans & ~vlans_actuales
 
                     if vlans_realmente_nuevas:
-                        vlans_actuales.extend(vlans_realmente_nuevas)
-                        disp_mod["VLANS"] = sorted(list(set(vlans_actuales))) # Asegurar orden y unicidad
+                        vlans_actuales |= vlans_realmente_nuevas
+                        dispositivos_lista_global.actualizar(disp_mod, VLANS=vlans_de_mascara(vlans_actuales))
                         hubo_cambios_vlan = True
-                        mostrar_mensaje(f"VLANs {', '.join(map(str, vlans_realmente_nuevas))} agregadas.", "exito")
-                    elif nuevas_vlans_list: # Si ingresó VLANs pero ya existían todas
+                        mostrar_mensaje(f"VLANs {formatear_vlans(vlans_de_mascara(vlans_realmente_nuevas))} agregadas.", "exito")
+                    elif nuevas_vlans: # Si ingresó VLANs pero ya existían todas
                         mostrar_mensaje("Todas las VLANs ingresadas ya están asignadas.", "info")
                     else: # Si no ingresó nada válido
                         mostrar_mensaje("No se ingresaron VLANs válidas para agregar.", "advertencia")
@@ -927,49 +3973,29 @@ def _modificar_vlans_para_dispositivo(disp_mod, dispositivos_lista_global):
                 continue
 
             print(f"\n{Color.BOLD}🗑️  Eliminar VLANs de '{disp_mod.get('NOMBRE')}':{Color.END}")
-            # Mostrar VLANs actuales con un número para facilitar la selección
-            for i, vlan_val in enumerate(vlans_actuales, 1):
-                print(f"{Color.YELLOW}{i}.{Color.END} VLAN {vlan_val}")
-
-            vlans_input_del_str = input(f"{Color.GREEN}↳ Ingrese números de VLANs a eliminar (de la lista de arriba, sep. por coma, Enter para cancelar): {Color.END}").strip()
+            print(f"{Color.DARKCYAN}Asignadas: {formatear_vlans(vlans_de_mascara(vlans_actuales))}{Color.END}")
+            vlans_input_del_str = input(f"{Color.GREEN}↳ Ingrese las VLANs a eliminar (números o rangos, ej: 10,20-30; Enter para cancelar): {Color.END}").strip()
             if not vlans_input_del_str: continue
 
-            indices_a_eliminar = []
-            numeros_vlans_del_str = vlans_input_del_str.split(',')
-            valido_del_vlan = True
-            for num_str_del_vlan in numeros_vlans_del_str:
-                num_str_del_vlan = num_str_del_vlan.strip()
-                if not num_str_del_vlan.isdigit():
-                    mostrar_mensaje(f"'{num_str_del_vlan}' no es un número de opción válido.", "error"); valido_del_vlan = False; break
-                idx_vlan_del_opcion = int(num_str_del_vlan) - 1 # El usuario ingresa base 1
-                if not (0 <= idx_vlan_del_opcion < len(vlans_actuales)):
-                    mostrar_mensaje(f"Número de opción '{num_str_del_vlan}' fuera de rango.", "error"); valido_del_vlan = False; break
-                # Convertir el índice de opción al valor real de la VLAN a eliminar
-                vlan_a_remover = vlans_actuales[idx_vlan_del_opcion]
-                if vlan_a_remover not in indices_a_eliminar: # Almacenar el valor de la VLAN, no el índice de opción
-                    indices_a_eliminar.append(vlan_a_remover)
-
-
-            if valido_del_vlan and indices_a_eliminar:
-                vlans_original_copia = list(vlans_actuales) # Copia para iterar mientras se modifica la original
-                vlans_eliminadas_nombres = []
-                for vlan_val_to_remove in indices_a_eliminar: # Iterar sobre los valores de VLAN a remover
-                    if vlan_val_to_remove in vlans_actuales:
-                        vlans_actuales.remove(vlan_val_to_remove)
-                        vlans_eliminadas_nombres.append(str(vlan_val_to_remove))
-
-                if vlans_eliminadas_nombres:
-                    disp_mod["VLANS"] = sorted(list(set(vlans_actuales))) # Asegurar orden y unicidad
-                    hubo_cambios_vlan = True
-                    mostrar_mensaje(f"VLANs {', '.join(vlans_eliminadas_nombres)} eliminadas.", "exito")
-                else:
-                    mostrar_mensaje("No se eliminaron VLANs (posiblemente ya no existían).", "info")
+            try:
+                vlans_a_eliminar = mascara_de_vlans(validar_vlans_input(vlans_input_del_str, avisar_duplicados=False))
+            except ValueError as e:
+                mostrar_mensaje(str(e), "error"); continue
+
+            vlans_eliminadas = vlans_a_eliminar & vlans_actuales
+            if vlans_eliminadas:
+                vlans_actuales &= ~vlans_eliminadas
+                dispositivos_lista_global.actualizar(disp_mod, VLANS=vlans_de_mascara(vlans_actuales))
+                hubo_cambios_vlan = True
+                mostrar_mensaje(f"VLANs {formatear_vlans(vlans_de_mascara(vlans_eliminadas))} eliminadas.", "exito")
+            else:
+                mostrar_mensaje("No se eliminaron VLANs (ninguna de las indicadas estaba asignada).", "info")
         else:
             mostrar_mensaje("Opción inválida.", "error")
 
         if hubo_cambios_vlan:
             guardar_dispositivos_en_archivo(dispositivos_lista_global)
-            sleep(1)
+            pausa(1)
     return hubo_cambios_vlan
 
 
@@ -978,19 +4004,17 @@ def agregar_servicio_a_dispositivo(dispositivos_lista): # Esta función puede se
     # ya incluye manejo de servicios. Esta función se vuelve un poco redundante.
     # Se podría llamar a _modificar_servicios_para_dispositivo desde aquí o refactorizar.
 
-    current_menu_func = lambda: agregar_servicio_a_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("➕ AGREGAR/MODIFICAR SERVICIOS A DISPOSITIVO") # Título actualizado
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para modificar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return
 
     modificables = []
     print(f"{Color.BOLD}Seleccione un dispositivo para gestionar sus servicios:{Color.END}\n")
     idx_display = 1
     for d in dispositivos_lista:
-        tipo_key = next((k for k,v in TIPOS_DISPOSITIVO.items() if v == d.get("TIPO")), None)
+        tipo_key = CLAVE_POR_TIPO.get(d.get("TIPO"))
         if tipo_key in ['SERVIDOR', 'ROUTER', 'FIREWALL']: # Solo estos son elegibles
             modificables.append(d)
             print(f"{Color.YELLOW}{idx_display}.{Color.END} {d.get('NOMBRE')} ({d.get('TIPO')}) - Servicios: {', '.join(d.get('SERVICIOS',[])) or 'Ninguno'}")
@@ -998,79 +4022,68 @@ def agregar_servicio_a_dispositivo(dispositivos_lista): # Esta función puede se
 
     if not modificables:
         mostrar_mensaje("No hay dispositivos elegibles (Servidor, Router, Firewall) para gestionar servicios.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return
 
     print(f"{Color.YELLOW}0.{Color.END} Cancelar / Volver")
 
     try:
         num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo (0-{len(modificables)}): {Color.END}").strip()
         if num_in == "0":
-            mostrar_mensaje("Operación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+            mostrar_mensaje("Operación cancelada.", "info"); pausa(1)
+            return
 
         idx_sel_mod_lista = int(num_in) - 1
 
         if 0 <= idx_sel_mod_lista < len(modificables):
             disp_mod_original = modificables[idx_sel_mod_lista]
-            # Encontrar el índice original en la lista global para asegurar que se modifica el objeto correcto
-            idx_orig_global = -1
-            for i, original_disp_global in enumerate(dispositivos_lista):
-                if original_disp_global is disp_mod_original: # Comparar por identidad de objeto
-                    idx_orig_global = i
-                    break
-            
-            if idx_orig_global == -1:
+            # Confirmar que el dispositivo sigue en el repositorio para asegurar que se modifica el objeto correcto
+            if not dispositivos_lista.contiene(disp_mod_original):
                 mostrar_mensaje("Error interno: no se encontró el dispositivo original en la lista global.", "error", esperar_enter=True);
-                pop_menu_history()(); return
+                return
 
-            disp_a_gestionar_servicios = dispositivos_lista[idx_orig_global]
+            disp_a_gestionar_servicios = disp_mod_original
 
             if _modificar_servicios_para_dispositivo(disp_a_gestionar_servicios, dispositivos_lista):
                 # _modificar_servicios_para_dispositivo ya guarda el archivo
                 mostrar_mensaje(f"Gestión de servicios para '{disp_a_gestionar_servicios.get('NOMBRE')}' completada.", "exito")
             else:
                 mostrar_mensaje(f"No se realizaron cambios en los servicios de '{disp_a_gestionar_servicios.get('NOMBRE')}'.", "info")
-            sleep(1)
+            pausa(1)
 
         else:
-            mostrar_mensaje("Número de dispositivo inválido.", "error"); sleep(2)
+            mostrar_mensaje("Número de dispositivo inválido.", "error"); pausa(2)
     except ValueError:
-        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); sleep(2)
+        mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error"); pausa(2)
     except Exception as e:
         mostrar_mensaje(f"Error inesperado gestionando servicios: {e}", "error", esperar_enter=True)
 
-    pop_menu_history()();
-
 
 def eliminar_dispositivo(dispositivos_lista):
-    current_menu_func = lambda: eliminar_dispositivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("❌ ELIMINAR DISPOSITIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("No hay dispositivos para eliminar.", "advertencia", esperar_enter=True)
-        pop_menu_history()(); return
+        return
 
     for i, d in enumerate(dispositivos_lista, 1):
         print(f"{Color.YELLOW}{i}.{Color.END} {d.get('NOMBRE')} ({d.get('TIPO')})")
     print(f"{Color.YELLOW}0.{Color.END} Cancelar / Volver")
 
     try:
-        num_in = input(f"\n{Color.GREEN}↳ Seleccione el número del dispositivo a eliminar (0-{len(dispositivos_lista)}): {Color.END}").strip()
-        if num_in == "0":
-            mostrar_mensaje("Eliminación cancelada.", "info"); sleep(1)
-            pop_menu_history()(); return
+        num_in = pedir_nombre_con_autocompletado(dispositivos_lista, f"\n{Color.GREEN}↳ Número (0-{len(dispositivos_lista)}) o nombre del dispositivo a eliminar (Tab autocompleta): {Color.END}")
+        if num_in in ("0", ""):
+            mostrar_mensaje("Eliminación cancelada.", "info"); pausa(1)
+            return
 
-        idx_sel = int(num_in) - 1
-        if 0 <= idx_sel < len(dispositivos_lista):
-            disp_elim = dispositivos_lista[idx_sel]
+        disp_elim = resolver_seleccion_dispositivo(dispositivos_lista, num_in)
+        if disp_elim is not None:
             nombre_elim = disp_elim.get("NOMBRE", "Desconocido")
             print(f"\n{Color.RED}{'⚠' * 30} ¡ADVERTENCIA! {'⚠' * 30}{Color.END}")
             confirmar = input(f"{Color.RED}{Color.BOLD}❓ ¿Está ABSOLUTAMENTE SEGURO de que desea eliminar el dispositivo '{nombre_elim}'? Esta acción es irreversible. (s/n): {Color.END}").lower()
             print(f"{Color.RED}{'⚠' * 70}{Color.END}")
 
             if confirmar == 's':
-                del dispositivos_lista[idx_sel]
+                dispositivos_lista.eliminar(disp_elim)
                 guardar_dispositivos_en_archivo(dispositivos_lista) # <<< GUARDAR DATOS
                 mostrar_mensaje(f"Dispositivo '{nombre_elim}' eliminado exitosamente.", "exito")
                 mostrar_barra_progreso(1, "Eliminando dispositivo y guardando cambios...")
@@ -1078,43 +4091,41 @@ def eliminar_dispositivo(dispositivos_lista):
                 mostrar_mensaje("Eliminación cancelada por el usuario.", "info")
             else:
                 mostrar_mensaje("Opción de confirmación inválida. Eliminación cancelada.", "advertencia")
-        else:
-            mostrar_mensaje(f"Número de dispositivo inválido. Debe ser entre 1 y {len(dispositivos_lista)} o 0.", "error")
     except ValueError:
         mostrar_mensaje("Entrada numérica inválida para seleccionar dispositivo.", "error")
 
-    sleep(1)
-    pop_menu_history()();
+    pausa(1)
 
 
+def calcular_estadisticas(dispositivos_lista):
+    """Conteos por tipo, ubicación/capa, servicio y VLAN.
+
+    Con el repositorio se leen sus contadores incrementales; con una lista suelta se cuenta recorriéndola.
+    """
+    if isinstance(dispositivos_lista, (RepositorioDispositivos, RepositorioDiferido)):
+        return dispositivos_lista.estadisticas.como_dict()
+    return contar_estadisticas(dispositivos_lista)
+
 def generar_reporte_estadistico(dispositivos_lista):
-    current_menu_func = lambda: generar_reporte_estadistico(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📊 REPORTE ESTADÍSTICO DETALLADO")
 
     if not dispositivos_lista:
         mostrar_mensaje("⚠️ No hay dispositivos para generar un reporte.", "advertencia", True)
-        pop_menu_history()(); return
+        return
+
+    estadisticas = calcular_estadisticas(dispositivos_lista)
 
     print(f"\n{Color.BOLD}{Color.PURPLE}📌 RESUMEN GENERAL{Color.END}")
-    print(f"{Color.CYAN}Total dispositivos:{Color.END} {len(dispositivos_lista)}")
+    print(f"{Color.CYAN}Total dispositivos:{Color.END} {estadisticas['TOTAL']}")
     print(f"{Color.CYAN}Reporte generado por:{Color.END} {current_user}")
     print(f"{Color.CYAN}Fecha y Hora:{Color.END} {datetime.now().strftime('%Y-%m-%d %H:%M:%S')}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🔢 DISTRIBUCIÓN POR TIPO DE DISPOSITIVO:{Color.END}")
-    tipos_count = {}
-    for d in dispositivos_lista:
-        tipo = d.get("TIPO","N/A")
-        tipos_count[tipo] = tipos_count.get(tipo,0)+1
-    for tipo, cant in sorted(tipos_count.items(), key=lambda x:x[1], reverse=True):
+    for tipo, cant in sorted(estadisticas["TIPOS"].items(), key=lambda x:x[1], reverse=True):
         print(f"  {Color.YELLOW}{tipo}:{Color.END} {cant}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}📍 DISTRIBUCIÓN POR UBICACIÓN/CAPA DE RED:{Color.END}") # Cambiado
-    ubicacion_count = {}
-    for d in dispositivos_lista:
-        ubicacion = d.get("UBICACION","N/A") # Cambiado
-        if ubicacion != "N/A":
-            ubicacion_count[ubicacion] = ubicacion_count.get(ubicacion,0)+1
+    ubicacion_count = estadisticas["UBICACIONES"]
     if ubicacion_count:
         for ubicacion_val, cant in sorted(ubicacion_count.items(), key=lambda x:x[1], reverse=True):
             print(f"  {Color.YELLOW}{ubicacion_val}:{Color.END} {cant}")
@@ -1123,13 +4134,7 @@ def generar_reporte_estadistico(dispositivos_lista):
 
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🛠️ SERVICIOS MÁS UTILIZADOS EN LA RED:{Color.END}")
-    serv_count = {}
-    for d in dispositivos_lista:
-        servicios_lista_disp = d.get("SERVICIOS",[])
-        if servicios_lista_disp:
-            for s_tag in servicios_lista_disp:
-                serv_count[s_tag] = serv_count.get(s_tag,0)+1
-
+    serv_count = estadisticas["SERVICIOS"]
     if serv_count:
         for serv, cant in sorted(serv_count.items(), key=lambda x:x[1], reverse=True):
             print(f"  {Color.YELLOW}{serv}:{Color.END} {cant} dispositivos")
@@ -1137,88 +4142,656 @@ def generar_reporte_estadistico(dispositivos_lista):
         print(f"  {Color.DARKCYAN}No hay servicios configurados en ningún dispositivo.{Color.END}")
 
     print(f"\n{Color.BOLD}{Color.PURPLE}🔗 USO DE VLANs EN LA RED:{Color.END}")
-    vlan_usage_count = {}
-    dispositivos_con_vlans = 0
-    total_vlans_configuradas = 0
-    for d in dispositivos_lista:
-        vlans_lista_disp = d.get("VLANS", [])
-        if vlans_lista_disp:
-            dispositivos_con_vlans +=1
-            total_vlans_configuradas += len(vlans_lista_disp)
-            for vlan in vlans_lista_disp:
-                vlan_usage_count[vlan] = vlan_usage_count.get(vlan, 0) + 1
-
+    vlan_usage_count = estadisticas["VLANS"]
     if vlan_usage_count:
-        print(f"  {Color.CYAN}Total de dispositivos con VLANs configuradas:{Color.END} {dispositivos_con_vlans}")
-        print(f"  {Color.CYAN}Número total de configuraciones de VLAN (instancias):{Color.END} {total_vlans_configuradas}")
+        print(f"  {Color.CYAN}Total de dispositivos con VLANs configuradas:{Color.END} {estadisticas['DISPOSITIVOS_CON_VLANS']}")
+        print(f"  {Color.CYAN}Número total de configuraciones de VLAN (instancias):{Color.END} {estadisticas['TOTAL_VLANS_CONFIGURADAS']}")
         print(f"  {Color.CYAN}VLANs específicas más utilizadas (veces que aparece cada VLAN):{Color.END}")
         for vlan, cant in sorted(vlan_usage_count.items(), key=lambda x: (x[1], x[0]), reverse=True):
             print(f"    {Color.YELLOW}VLAN {vlan}:{Color.END} {cant} veces")
     else:
         print(f"  {Color.DARKCYAN}No hay VLANs configuradas en ningún dispositivo de la red.{Color.END}")
 
+    if (_monitor is not None and _monitor.estados) or len(CACHE_SONDEOS):
+        estados = [(d, estado_alcanzabilidad(d.get("IP"))) for d in dispositivos_lista if d.get("IP") and d.get("IP") != "N/A"]
+        alcanzables = sum(1 for _, e in estados if e is not None and e.alcanzable is True)
+        caidos = [(d, e) for d, e in estados if e is not None and e.alcanzable is False]
+        origen = "monitor y caché de pings" if _monitor is not None and _monitor.estados else f"pings de los últimos {CACHE_SONDEOS.ttl:.0f} s"
+        print(f"\n{Color.BOLD}{Color.PURPLE}📶 ALCANZABILIDAD (último sondeo conocido: {origen}):{Color.END}")
+        print(f"  {Color.GREEN}Alcanzables:{Color.END} {alcanzables}  {Color.RED}Sin respuesta:{Color.END} {len(caidos)}  {Color.CYAN}Sin datos:{Color.END} {len(estados) - alcanzables - len(caidos)}")
+        for disp, estado in caidos[:10]:
+            print(f"    {Color.RED}{disp.get('NOMBRE')} ({disp.get('IP')}){Color.END}: {estado.descripcion()}")
+        if len(caidos) > 10:
+            print(f"    {Color.DARKCYAN}... y {len(caidos) - 10} más.{Color.END}")
+
     print(f"\n{Color.BLUE}{'═' * 70}{Color.END}")
-    input(f"{Color.GREEN}Presione Enter para volver al menú anterior...{Color.END}")
-    pop_menu_history()();
+    opcion = input(f"{Color.GREEN}Presione Enter para volver al menú anterior ('v' para verificar los contadores)...{Color.END}").strip().lower()
+    if opcion == "v" and isinstance(dispositivos_lista, (RepositorioDispositivos, RepositorioDiferido)):
+        diferencias = dispositivos_lista.verificar_estadisticas(reparar=True)
+        if diferencias:
+            mostrar_mensaje(f"Los contadores no coincidían ({', '.join(diferencias)}); se reconstruyeron desde cero.", "advertencia", esperar_enter=True)
+        else:
+            mostrar_mensaje("Los contadores coinciden con un recuento completo.", "exito", esperar_enter=True)
+
+# ---------------- EXPORTACIÓN (TXT / CSV / JSON LINES / MARKDOWN) ----------------
+FORMATOS_EXPORTACION = {"txt": "Texto (reporte clásico)", "csv": "CSV", "jsonl": "JSON Lines", "md": "Markdown"}
+TAMANO_BLOQUE_EXPORTACION = 2000 # Dispositivos que se formatean juntos antes de cada escritura
+TAMANO_BUFFER_EXPORTACION = 1 << 20 # 1 MiB de buffer para el archivo de salida
+COLUMNAS_EXPORTACION = ("TIPO", "NOMBRE", "IP", "UBICACION", "SERVICIOS", "VLANS")
+
+def _fila_txt(disp, numero):
+    servicios_lista = disp.get('SERVICIOS', [])
+    vlans_lista = disp.get('VLANS', [])
+    return (f"Dispositivo #{numero}\n"
+            f"  Nombre: {disp.get('NOMBRE', 'N/A')}\n"
+            f"  IP: {disp.get('IP', 'N/A')}\n"
+            f"  Tipo: {disp.get('TIPO', 'N/A')}\n"
+            f"  Ubicación/Capa: {disp.get('UBICACION', 'N/A')}\n" # Cambiado 'CAPA' a 'UBICACION'
+            f"  Servicios: {', '.join(servicios_lista) if servicios_lista else 'Ninguno'}\n"
+            f"  VLANs: {', '.join(map(str, vlans_lista)) if vlans_lista else 'Ninguna'}\n"
+            "-------------------------------------------------------------------------------\n\n")
+
+def _encabezado_txt(fecha):
+    return ("═════════════════════════════════════════════════════════════════════════════\n"
+            f"                REPORTE DE DISPOSITIVOS DE RED ({fecha})\n"
+            f"                Generado por: {current_user}\n"
+            "═════════════════════════════════════════════════════════════════════════════\n\n")
+
+def _pie_txt(total):
+    return ("No hay dispositivos para reportar.\n" if not total else "") + \
+           (f"\nTotal de dispositivos en el reporte: {total}\n"
+            "═════════════════════════════ FIN DEL REPORTE ═════════════════════════════\n")
+
+def _celda_md(valor):
+    return str(valor).replace("|", "\\|")
+
+def _fila_md(disp, numero):
+    return (f"| {numero} | {_celda_md(disp.get('NOMBRE', 'N/A'))} | {disp.get('IP', 'N/A')} | {_celda_md(disp.get('TIPO', 'N/A'))} | "
+            f"{_celda_md(disp.get('UBICACION', 'N/A'))} | {_celda_md(', '.join(disp.get('SERVICIOS', [])) or '-')} | "
+            f"{', '.join(map(str, disp.get('VLANS', []))) or '-'} |\n")
+
+def _encabezado_md(fecha):
+    return (f"# Reporte de dispositivos de red\n\nGenerado por: {current_user} · {fecha}\n\n"
+            "| # | Nombre | IP | Tipo | Ubicación/Capa | Servicios | VLANs |\n"
+            "|---:|---|---|---|---|---|---|\n")
+
+def _fila_jsonl(disp, numero):
+    return json.dumps({campo: disp.get(campo, [] if campo in ("SERVICIOS", "VLANS") else "N/A") for campo in COLUMNAS_EXPORTACION},
+                      ensure_ascii=False) + "\n"
+
+def _bloque_csv(bloque):
+    """Formatea un bloque de dispositivos como CSV; los servicios y VLANs van separados por ';' (como en la importación)."""
+    salida = io.StringIO()
+    csv.writer(salida).writerows(
+        (disp.get("TIPO", "N/A"), disp.get("NOMBRE", "N/A"), disp.get("IP", "N/A"), disp.get("UBICACION", "N/A"),
+         ";".join(disp.get("SERVICIOS", [])), ";".join(map(str, disp.get("VLANS", []))))
+        for _, disp in bloque)
+    return salida.getvalue()
+
+def escribir_reporte_dispositivos(dispositivos_lista, directorio_reportes="reportes", formato="txt", comprimir=False):
+    """Escribe el reporte en 'formato' (txt, csv, jsonl o md), opcionalmente con gzip, y devuelve su ruta.
+
+    Los dispositivos se recorren una sola vez y se formatean por bloques de TAMANO_BLOQUE_EXPORTACION, con una
+    escritura grande por bloque: la memoria usada no depende del tamaño del inventario. Se escribe primero en
+    un temporal, así nunca queda un reporte a medias con el nombre final. Lanza OSError si falla.
+    """
+    if formato not in FORMATOS_EXPORTACION:
+        raise ValueError(f"Formato '{formato}' no válido. Opciones: {', '.join(FORMATOS_EXPORTACION)}")
+    os.makedirs(directorio_reportes, exist_ok=True)
+    ahora = datetime.now()
+    nombre_archivo = ahora.strftime(f"reporte_dispositivos_%Y-%m-%d_%H-%M-%S.{formato}") + (".gz" if comprimir else "")
+    ruta_completa_archivo = os.path.join(directorio_reportes, nombre_archivo)
+    ruta_temporal = f"{ruta_completa_archivo}.tmp"
+    fecha = ahora.strftime('%Y-%m-%d %H:%M:%S')
+
+    # Inventario completo en modo 'sqlite': se lee en streaming desde la base en lugar de la memoria
+    completo = isinstance(dispositivos_lista, (RepositorioDispositivos, RepositorioDiferido))
+    origen = obtener_almacen_sqlite().iterar_para_exportar() if completo and MODO_ALMACENAMIENTO == "sqlite" else dispositivos_lista
+    fila = {"txt": _fila_txt, "jsonl": _fila_jsonl, "md": _fila_md}.get(formato)
+
+    if comprimir:
+        archivo = gzip.open(ruta_temporal, 'wt', encoding='utf-8', newline='', compresslevel=6)
+    else:
+        archivo = open(ruta_temporal, 'w', encoding='utf-8', newline='', buffering=TAMANO_BUFFER_EXPORTACION)
+    total = 0
+    try:
+        with archivo as f:
+            if formato == "txt": f.write(_encabezado_txt(fecha))
+            elif formato == "md": f.write(_encabezado_md(fecha))
+            elif formato == "csv": f.write(",".join(COLUMNAS_EXPORTACION) + "\r\n")
+            numerados = enumerate(origen, 1)
+            while True:
+                bloque = list(itertools.islice(numerados, TAMANO_BLOQUE_EXPORTACION))
+                if not bloque:
+                    break
+                total = bloque[-1][0]
+                f.write(_bloque_csv(bloque) if formato == "csv" else "".join(fila(disp, numero) for numero, disp in bloque))
+            if formato == "txt": f.write(_pie_txt(total))
+            elif formato == "md": f.write(f"\nTotal de dispositivos: {total}\n")
+        os.replace(ruta_temporal, ruta_completa_archivo)
+    except BaseException:
+        if os.path.exists(ruta_temporal):
+            os.remove(ruta_temporal)
+        raise
+    return ruta_completa_archivo
 
 def exportar_reporte_a_archivo(dispositivos_lista):
-    current_menu_func = lambda: exportar_reporte_a_archivo(dispositivos_lista)
-    push_menu_history(current_menu_func)
     mostrar_titulo("📁 EXPORTAR REPORTE A ARCHIVO")
 
     if not dispositivos_lista:
         mostrar_mensaje("⚠️ No hay dispositivos para exportar.", "advertencia", True)
-        pop_menu_history()(); return
+        return
+
+    print(f"{Color.BOLD}Formatos disponibles:{Color.END}")
+    for clave, descripcion in FORMATOS_EXPORTACION.items():
+        print(f"  {Color.YELLOW}{clave}{Color.END} - {descripcion}")
+    formato = ""
+    while formato not in FORMATOS_EXPORTACION:
+        formato = input(f"{Color.GREEN}↳ Formato (Enter = txt): {Color.END}").strip().lower().lstrip(".") or "txt"
+        if formato not in FORMATOS_EXPORTACION:
+            mostrar_mensaje(f"Formato '{formato}' no reconocido.", "error")
+    comprimir = input(f"{Color.GREEN}¿Comprimir con gzip? (s/n, Enter = n): {Color.END}").strip().lower() == 's'
+    print(f"{Color.DARKCYAN}Filtro opcional, con la misma sintaxis que la búsqueda (ej: tipo:switch capa:core vlan:10).{Color.END}")
+    consulta = input(f"{Color.GREEN}↳ Filtro (Enter = todos los dispositivos): {Color.END}").strip()
 
-    directorio_reportes = "reportes"
     try:
-        os.makedirs(directorio_reportes, exist_ok=True)
+        objetivos = consultar_dispositivos(dispositivos_lista, consulta) if consulta else dispositivos_lista
+        if not objetivos:
+            mostrar_mensaje("Ningún dispositivo coincide con el filtro.", "advertencia", True)
+            return
+        inicio = perf_counter()
+        ruta_completa_archivo = escribir_reporte_dispositivos(dispositivos_lista if not consulta else objetivos, formato=formato, comprimir=comprimir)
+        mostrar_mensaje(f"Reporte exportado exitosamente como '{ruta_completa_archivo}' ({len(objetivos)} dispositivos en {perf_counter() - inicio:.2f} s)", "exito", True)
+    except ValueError as e:
+        mostrar_mensaje(f"Filtro no válido: {e}", "error", True)
     except OSError as e:
-        mostrar_mensaje(f"Error al crear el directorio '{directorio_reportes}': {e}", "error", True)
-        pop_menu_history()(); return
+        mostrar_mensaje(f"Error al escribir el archivo de reporte: {e}", "error", True)
 
-    nombre_archivo = datetime.now().strftime("reporte_dispositivos_%Y-%m-%d_%H-%M-%S.txt")
-    ruta_completa_archivo = os.path.join(directorio_reportes, nombre_archivo)
 
+# ---------------- IMPORTACIÓN MASIVA (CSV / JSON LINES) ----------------
+TAMANO_LOTE_IMPORTACION = 1000 # Dispositivos válidos que se incorporan al repositorio de una vez
+ALIAS_COLUMNAS_IMPORTACION = {"CAPA": "UBICACION", "UBICACIÓN": "UBICACION", "SERVICIO": "SERVICIOS", "VLAN": "VLANS"}
+
+def _como_lista(valor):
+    """Campos multivalor: listas JSON o texto CSV separado por ';' o ','."""
+    if valor is None or valor == "":
+        return []
+    if isinstance(valor, (list, tuple)):
+        return list(valor)
+    return [parte.strip() for parte in re.split(r"[;,]", str(valor)) if parte.strip()]
+
+def dispositivo_desde_registro(registro):
+    """Valida un registro importado (claves en cualquier mayúscula/minúscula) y devuelve el dispositivo.
+
+    Lanza ValueError con el motivo si el registro no es válido.
+    """
+    if not isinstance(registro, dict):
+        raise ValueError("El registro no es un objeto con campos.")
+    campos = {}
+    for clave, valor in registro.items():
+        clave_normalizada = str(clave).strip().upper()
+        campos[ALIAS_COLUMNAS_IMPORTACION.get(clave_normalizada, clave_normalizada)] = valor.strip() if isinstance(valor, str) else valor
+    for campo in ("TIPO", "NOMBRE", "IP", "UBICACION"):
+        if campos.get(campo) is not None and not isinstance(campos[campo], str):
+            raise ValueError(f"El campo {campo} debe ser texto, no {type(campos[campo]).__name__}.")
+    for campo in ("SERVICIOS", "VLANS"): # Listas en JSON Lines, texto separado por ';' o ',' en CSV
+        if campos.get(campo) is not None and not isinstance(campos[campo], (list, str)):
+            raise ValueError(f"El campo {campo} debe ser una lista, no {type(campos[campo]).__name__}.")
+    if isinstance(campos.get("SERVICIOS"), list) and not all(isinstance(s, str) for s in campos["SERVICIOS"]):
+        raise ValueError("El campo SERVICIOS solo puede contener texto.")
+
+    tipo = normalizar_opcion(campos.get("TIPO"), TIPOS_DISPOSITIVO, "Tipo")
+    if not tipo:
+        raise ValueError("Falta el campo TIPO.")
+    servicios = sorted(set(normalizar_opcion(s, SERVICIOS_VALIDOS, "Servicio") for s in _como_lista(campos.get("SERVICIOS"))))
+    vlans = validar_vlans_input(",".join(map(str, _como_lista(campos.get("VLANS")))), avisar_duplicados=False)
+    return construir_dispositivo(tipo, (campos.get("NOMBRE") or "").strip(), campos.get("IP") or "N/A",
+                                 normalizar_opcion(campos.get("UBICACION"), CAPAS_RED, "Capa"), servicios, vlans)
+
+def _leer_registros_importacion(archivo, formato):
+    """Genera (número de fila, registro) leyendo el archivo de a una línea, sin cargarlo completo."""
+    if formato == "csv":
+        lector = csv.DictReader(archivo)
+        for numero, fila in enumerate(lector, 2): # La fila 1 es la cabecera
+            yield numero, fila
+        return
+    for numero, linea in enumerate(archivo, 1):
+        if not linea.strip():
+            continue
+        try:
+            yield numero, json.loads(linea)
+        except json.JSONDecodeError as e:
+            error = ValueError(f"JSON inválido: {e.msg}")
+            error.linea = linea.rstrip("\n") # Se conserva el texto original para el archivo de rechazos
+            yield numero, error
+
+class _EscritorRechazos:
+    """Escribe las filas rechazadas (con su motivo) a medida que aparecen; el archivo se crea solo si hace falta."""
+    def __init__(self, ruta, formato, columnas=None):
+        self.ruta = ruta
+        self.formato = formato
+        self.columnas = columnas
+        self.archivo = None
+        self.escritor_csv = None
+        self.cantidad = 0
+
+    def escribir(self, numero, registro, motivo):
+        if self.archivo is None:
+            self.archivo = open(self.ruta, 'w', encoding='utf-8', newline='')
+            if self.formato == "csv":
+                self.escritor_csv = csv.writer(self.archivo)
+                self.escritor_csv.writerow(["FILA", "ERROR"] + list(self.columnas or []))
+        if self.formato == "csv":
+            self.escritor_csv.writerow([numero, motivo] + [registro.get(c, "") for c in (self.columnas or [])])
+        else:
+            original = registro if isinstance(registro, dict) else {}
+            self.archivo.write(json.dumps({"_fila": numero, "_error": motivo, **original}, ensure_ascii=False) + "\n")
+        self.cantidad += 1
+
+    def cerrar(self):
+        if self.archivo is not None:
+            self.archivo.close()
+
+def _incorporar_registros(dispositivos_lista, registros, rechazos, tamano_lote=TAMANO_LOTE_IMPORTACION, al_avanzar=None):
+    """Valida e incorpora al repositorio los (número, registro) recibidos. Devuelve (procesados, importados).
+
+    La unicidad de nombre e IP se comprueba contra los índices del repositorio y del lote en curso;
+    los registros inválidos van a 'rechazos' con su motivo. No guarda: eso queda a cargo del llamador.
+    """
+    importados = 0
+    procesadas = 0
+    lote = []
+    nombres_lote = {}
+    ips_lote = {}
+
+    def confirmar_lote():
+        for disp in lote:
+            dispositivos_lista.agregar(disp, validar=False) # La unicidad ya se comprobó fila a fila
+        lote.clear(); nombres_lote.clear(); ips_lote.clear()
+
+    for numero, registro in registros:
+        procesadas += 1
+        if rechazos.columnas is None and isinstance(registro, dict):
+            rechazos.columnas = list(registro.keys())
+        try:
+            if isinstance(registro, Exception):
+                raise registro
+            disp = dispositivo_desde_registro(registro)
+            clave = disp["NOMBRE"].lower()
+            if dispositivos_lista.nombre_existe(clave) or clave in nombres_lote:
+                raise ValueError(f"El nombre '{disp['NOMBRE']}' ya existe.")
+            ip = disp["IP"]
+            if ip != "N/A":
+                entero = ip_a_entero(ip) # Como entero, '10.0.0.01' y '10.0.0.1' son la misma IP
+                propietario = dispositivos_lista.ip_en_uso(ip) or ips_lote.get(entero)
+                if propietario:
+                    raise ValueError(f"La IP '{ip}' ya está asignada al dispositivo '{propietario.get('NOMBRE')}'.")
+                ips_lote[entero] = disp
+            nombres_lote[clave] = disp
+            lote.append(disp)
+            importados += 1
+        except (ValueError, TypeError) as e:
+            rechazos.escribir(numero, registro if isinstance(registro, dict) else {"_linea": getattr(registro, "linea", None)}, str(e))
+        if len(lote) >= tamano_lote:
+            confirmar_lote()
+        if al_avanzar and procesadas % tamano_lote == 0:
+            al_avanzar(procesadas, importados, rechazos.cantidad)
+    confirmar_lote()
+    return procesadas, importados
+
+def importar_dispositivos(dispositivos_lista, ruta, formato=None, ruta_rechazos=None, tamano_lote=TAMANO_LOTE_IMPORTACION, al_avanzar=None):
+    """Importa dispositivos desde CSV o JSON Lines registro a registro.
+
+    Cada fila se valida igual que en el alta interactiva. Las filas inválidas se escriben en
+    'ruta_rechazos' con su motivo; las válidas se agregan en lotes y se guarda una sola vez al final.
+    'al_avanzar(procesadas, importadas, rechazadas)' se llama cada 'tamano_lote' filas.
+    """
+    if formato is None:
+        formato = "csv" if ruta.lower().endswith(".csv") else "jsonl"
+    if ruta_rechazos is None:
+        ruta_rechazos = f"{os.path.splitext(ruta)[0]}.rechazos.{'csv' if formato == 'csv' else 'jsonl'}"
+
+    with open(ruta, 'r', encoding='utf-8-sig', newline='') as archivo:
+        if formato == "jsonl" and archivo.read(1) == "[": # Lista JSON clásica: no se puede leer por líneas
+            archivo.seek(0)
+            registros = enumerate(json.load(archivo), 1)
+        else:
+            archivo.seek(0)
+            registros = _leer_registros_importacion(archivo, formato)
+        rechazos = _EscritorRechazos(ruta_rechazos, formato)
+        try:
+            procesadas, importados = _incorporar_registros(dispositivos_lista, registros, rechazos, tamano_lote, al_avanzar)
+        finally:
+            rechazos.cerrar()
+
+    if importados:
+        guardar_dispositivos_en_archivo(dispositivos_lista) # Un solo guardado para toda la importación
+    return {
+        "procesadas": procesadas,
+        "importados": importados,
+        "rechazados": rechazos.cantidad,
+        "archivo_rechazos": ruta_rechazos if rechazos.cantidad else None
+    }
+
+# --- Inventarios de texto heredados ('zona core.txt', 'campus uno.txt', '🌐_zona_core.txt' y sus .bak) ---
+# Se reconocen tres variantes de bloque, separados por líneas de '-' o '=':
+#   "Switch: sw1 / IP: / Jerarquía: / Servicios:"  (la etiqueta de la primera línea es el tipo)
+#   "TIPO: / NOMBRE: / IP: / CAPA: / VLANS: / SERVICIOS:"
+#   la anterior con un emoji delante de cada etiqueta y de algunos valores ("🔧 TIPO: 💻 PC").
+ETIQUETAS_LEGADO = {
+    "TIPO": "TIPO", "NOMBRE": "NOMBRE", "IP": "IP",
+    "CAPA": "UBICACION", "JERARQUIA": "UBICACION", "UBICACION": "UBICACION", "UBICACION/CAPA": "UBICACION",
+    "VLAN": "VLANS", "VLANS": "VLANS", "SERVICIO": "SERVICIOS", "SERVICIOS": "SERVICIOS"
+}
+TIPOS_LEGADO = {
+    "PC": "PC", "COMPUTADOR": "PC", "SERVIDOR": "SERVIDOR", "SERVER": "SERVIDOR", "ROUTER": "ROUTER",
+    "SWITCH": "SWITCH", "FIREWALL": "FIREWALL", "IMPRESORA": "IMPRESORA", "PRINTER": "IMPRESORA"
+}
+SERVICIOS_LEGADO = {
+    "DNS": "DNS", "DHCP": "DHCP", "WEB": "WEB", "SERVICIO WEB": "WEB", "HTTP": "WEB", "BD": "BD",
+    "BASE DE DATOS": "BD", "CORREO": "CORREO", "SERVICIO DE CORREO": "CORREO", "EMAIL": "CORREO", "VPN": "VPN"
+}
+_PATRON_SEPARADOR_LEGADO = re.compile(r"^\s*(?:-{5,}|={5,})\s*$")
+_PATRON_CAMPO_LEGADO = re.compile(r"^\W*?([^\W\d_][^:]{0,30}?)\s*:\s*(.*)$")
+
+def _texto_sin_adornos(texto):
+    """Quita emojis y tildes y pasa a mayúsculas: '💎 Núcleo (Core)' -> 'NUCLEO (CORE)'."""
+    sin_tildes = "".join(c for c in unicodedata.normalize("NFKD", texto) if not unicodedata.combining(c))
+    return re.sub(r"\s+", " ", re.sub(r"[^\w\s()/.\-]", "", sin_tildes)).strip().upper()
+
+def _normalizar_capa_legado(texto):
+    limpio = _texto_sin_adornos(texto)
+    if not limpio or limpio == "N/A":
+        return None
+    for patron, clave in (("NUCLEO", "NUCLEO"), ("CORE", "NUCLEO"), ("DISTRIBUCION", "DISTRIBUCION"), ("ACCESO", "ACCESO"), ("ACCESS", "ACCESO")):
+        if patron in limpio:
+            return clave
+    return texto # Se deja el original para que la validación explique el rechazo
+
+def _bloques_inventario_legado(archivo, descartados):
+    """Genera (línea de inicio, registro) por cada bloque del archivo, leyendo una línea a la vez.
+
+    Los servicios que no existen en SERVICIOS_VALIDOS se cuentan en 'descartados'.
+    """
+    registro = {}
+    inicio = 0
+    servicios = set()
+    vlans = set()
+
+    def cerrar_bloque():
+        if servicios: registro["SERVICIOS"] = sorted(servicios)
+        if vlans: registro["VLANS"] = sorted(vlans)
+        return inicio, dict(registro)
+
+    for numero, linea in enumerate(archivo, 1):
+        if _PATRON_SEPARADOR_LEGADO.match(linea):
+            if registro:
+                yield cerrar_bloque()
+            registro.clear(); servicios.clear(); vlans.clear()
+            continue
+        coincidencia = _PATRON_CAMPO_LEGADO.match(linea.strip())
+        if not coincidencia:
+            continue
+        etiqueta, valor = _texto_sin_adornos(coincidencia.group(1)), coincidencia.group(2).strip()
+        campo = ETIQUETAS_LEGADO.get(etiqueta)
+        if campo is None: # Variante "Switch: sw1": la etiqueta es el tipo y el valor el nombre
+            campo, valor_tipo = "NOMBRE", etiqueta
+        if campo in ("TIPO", "NOMBRE") and campo in registro: # Bloque nuevo sin separador intermedio
+            yield cerrar_bloque()
+            registro.clear(); servicios.clear(); vlans.clear()
+        if not registro:
+            inicio = numero
+        if campo == "NOMBRE" and ETIQUETAS_LEGADO.get(etiqueta) is None:
+            registro["TIPO"] = TIPOS_LEGADO.get(valor_tipo, valor_tipo.title())
+            registro["NOMBRE"] = valor
+        elif campo == "TIPO":
+            tipo_limpio = _texto_sin_adornos(valor)
+            registro["TIPO"] = TIPOS_LEGADO.get(tipo_limpio, valor)
+        elif campo == "UBICACION":
+            capa = _normalizar_capa_legado(valor)
+            if capa: registro["UBICACION"] = capa
+        elif campo == "SERVICIOS":
+            for servicio in valor.split(","):
+                servicio_limpio = _texto_sin_adornos(servicio)
+                if not servicio_limpio:
+                    continue
+                if servicio_limpio in SERVICIOS_LEGADO:
+                    servicios.add(SERVICIOS_LEGADO[servicio_limpio])
+                else:
+                    descartados[servicio.strip()] = descartados.get(servicio.strip(), 0) + 1
+        elif campo == "VLANS":
+            vlans.update(int(v) for v in re.findall(r"\d+", valor))
+        else:
+            registro[campo] = valor
+    if registro:
+        yield cerrar_bloque()
+
+def importar_inventario_legado(dispositivos_lista, rutas, ruta_rechazos="inventario_legado.rechazos.jsonl", al_avanzar=None):
+    """Importa uno o varios inventarios de texto heredados y guarda una sola vez al final.
+
+    Tipos, capas y servicios se normalizan a TIPOS_DISPOSITIVO, CAPAS_RED y SERVICIOS_VALIDOS; las VLANs
+    y servicios repetidos se unifican. Los bloques que no pasan la validación se escriben en 'ruta_rechazos'.
+    """
+    rechazos = _EscritorRechazos(ruta_rechazos, "jsonl")
+    descartados = {}
+    resumen = {"archivos": {}, "procesadas": 0, "importados": 0}
     try:
-        with open(ruta_completa_archivo, 'w', encoding='utf-8') as f:
-            f.write("═════════════════════════════════════════════════════════════════════════════\n")
-            f.write(f"                REPORTE DE DISPOSITIVOS DE RED ({datetime.now().strftime('%Y-%m-%d %H:%M:%S')})\n")
-            f.write(f"                Generado por: {current_user}\n")
-            f.write("═════════════════════════════════════════════════════════════════════════════\n\n")
-
-            if not dispositivos_lista:
-                f.write("No hay dispositivos para reportar.\n")
-            else:
-                for i, disp in enumerate(dispositivos_lista, 1):
-                    f.write(f"Dispositivo #{i}\n")
-                    f.write(f"  Nombre: {disp.get('NOMBRE', 'N/A')}\n")
-                    f.write(f"  IP: {disp.get('IP', 'N/A')}\n")
-                    f.write(f"  Tipo: {disp.get('TIPO', 'N/A')}\n")
-                    f.write(f"  Ubicación/Capa: {disp.get('UBICACION', 'N/A')}\n") # Cambiado 'CAPA' a 'UBICACION'
-
-                    servicios_lista = disp.get('SERVICIOS', [])
-                    servicios_str = ", ".join(servicios_lista) if servicios_lista else "Ninguno"
-                    f.write(f"  Servicios: {servicios_str}\n")
-
-                    vlans_lista = disp.get('VLANS', [])
-                    vlans_str = ", ".join(map(str, vlans_lista)) if vlans_lista else "Ninguna"
-                    f.write(f"  VLANs: {vlans_str}\n")
-                    f.write("-------------------------------------------------------------------------------\n\n")
-
-            f.write(f"\nTotal de dispositivos en el reporte: {len(dispositivos_lista)}\n")
-            f.write("═════════════════════════════ FIN DEL REPORTE ═════════════════════════════\n")
-
-        mostrar_mensaje(f"Reporte exportado exitosamente como '{ruta_completa_archivo}'", "exito", True)
-    except IOError as e:
-        mostrar_mensaje(f"Error al escribir el archivo de reporte '{ruta_completa_archivo}': {e}", "error", True)
+        for ruta in rutas:
+            with open(ruta, 'r', encoding='utf-8-sig', errors='replace') as archivo:
+                registros = ((numero, dict(registro, _archivo=os.path.basename(ruta))) for numero, registro in _bloques_inventario_legado(archivo, descartados))
+                procesadas, importados = _incorporar_registros(dispositivos_lista, registros, rechazos, al_avanzar=al_avanzar)
+            resumen["archivos"][ruta] = {"bloques": procesadas, "importados": importados}
+            resumen["procesadas"] += procesadas
+            resumen["importados"] += importados
+    finally:
+        rechazos.cerrar()
+    if resumen["importados"]:
+        guardar_dispositivos_en_archivo(dispositivos_lista) # Una sola escritura para todos los archivos
+    resumen["rechazados"] = rechazos.cantidad
+    resumen["archivo_rechazos"] = ruta_rechazos if rechazos.cantidad else None
+    resumen["servicios_descartados"] = descartados
+    return resumen
+
+def importar_dispositivos_interactivo(dispositivos_lista):
+    mostrar_titulo("📥 IMPORTAR DISPOSITIVOS (CSV / JSON LINES)")
+
+    print(f"{Color.DARKCYAN}Columnas: TIPO, NOMBRE, IP, UBICACION (o CAPA), SERVICIOS y VLANS.{Color.END}")
+    print(f"{Color.DARKCYAN}TIPO, UBICACION y SERVICIOS aceptan la clave (SWITCH, NUCLEO, DNS) o el texto mostrado.{Color.END}")
+    print(f"{Color.DARKCYAN}En CSV, varios servicios o VLANs se separan con ';' (ej: DNS;VPN o 10;20).{Color.END}")
+    print(f"{Color.DARKCYAN}También se aceptan los inventarios de texto antiguos (.txt / .bak).{Color.END}\n")
+    ruta = input(f"{Color.GREEN}↳ Ruta del archivo (.csv, .jsonl, .txt) (Enter para cancelar): {Color.END}").strip().strip('"')
+    if not ruta:
+        mostrar_mensaje("Importación cancelada.", "info"); pausa(1)
+        return
+    if not os.path.isfile(ruta):
+        mostrar_mensaje(f"No se encontró el archivo '{ruta}'.", "error", esperar_enter=True)
+        return
+
+    def mostrar_avance(procesadas, importadas, rechazadas):
+        print(f"\r{Color.DARKCYAN}Procesadas: {procesadas}  Importadas: {importadas}  Rechazadas: {rechazadas}{Color.END}", end="", flush=True)
+
+    try:
+        if ruta.lower().endswith((".txt", ".bak")): # Inventario de texto heredado
+            resumen = importar_inventario_legado(dispositivos_lista, [ruta], al_avanzar=mostrar_avance)
+            if resumen["servicios_descartados"]:
+                print()
+                mostrar_mensaje("Servicios no reconocidos (descartados): " + ", ".join(f"{s} ({n})" for s, n in resumen["servicios_descartados"].items()), "advertencia")
+        else:
+            resumen = importar_dispositivos(dispositivos_lista, ruta, al_avanzar=mostrar_avance)
+        print()
+        mostrar_mensaje(f"Filas procesadas: {resumen['procesadas']} | Importadas: {resumen['importados']} | Rechazadas: {resumen['rechazados']}",
+                        "exito" if not resumen["rechazados"] else "advertencia")
+        if resumen["archivo_rechazos"]:
+            mostrar_mensaje(f"Las filas rechazadas y su motivo se guardaron en '{resumen['archivo_rechazos']}'.", "info")
+    except (OSError, ValueError, csv.Error) as e:
+        print()
+        mostrar_mensaje(f"Error al importar '{ruta}': {e}", "error")
+    input(f"{Color.GREEN}Presione Enter para continuar...{Color.END}")
+
+
+# ---------------- INSTRUMENTACIÓN (PERFILADO OPCIONAL) ----------------
+# Con P1_PERFILADO=tabla (o el argumento --perfilar) o P1_PERFILADO=json, activar_perfilado() reemplaza en el
+# espacio global del módulo cada función de FUNCIONES_PERFILADAS por un envoltorio que cuenta llamadas y errores
+# y acumula un histograma de duraciones. Como todas se invocan por su nombre global, el resto del código no cambia;
+# y si el perfilado está desactivado no se envuelve nada, así que no agrega costo. Al salir se imprime la tabla
+# (en stderr, para no mezclarla con la salida JSON del modo batch) o se escribe NOMBRE_ARCHIVO_PERFIL.
+# P1_PERFILADO_CPROFILE=ruta.prof además perfila la sesión con cProfile (solo el hilo principal).
+_MODOS_PERFILADO = {"1": "tabla", "true": "tabla", "si": "tabla", "sí": "tabla", "s": "tabla", "tabla": "tabla", "json": "json"}
+PERFILADO = _MODOS_PERFILADO.get(os.environ.get("P1_PERFILADO", "").strip().lower()) # None = desactivado
+PERFILADO_CPROFILE = os.environ.get("P1_PERFILADO_CPROFILE", "").strip() # Ruta del volcado de cProfile ('' = sin cProfile)
+NOMBRE_ARCHIVO_PERFIL = "dispositivos_red.perfil.json"
+FUNCIONES_PERFILADAS = (
+    # Inicio y persistencia
+    "inicializar_repositorio", "cargar_dispositivos_desde_archivo", "abrir_inventario_ndjson",
+    "guardar_dispositivos_en_archivo", "compactar_almacenamiento",
+    # Validación
+    "validar_nombre", "validar_ip", "validar_vlans_input", "construir_dispositivo",
+    # Sondeos
+    "hacer_ping", "ejecutar_ping",
+    # Presentación, reportes e importación (las pantallas interactivas incluyen la espera del usuario)
+    "formatear_dispositivo_para_mostrar", "calcular_estadisticas", "generar_reporte_estadistico",
+    "escribir_reporte_dispositivos", "exportar_reporte_a_archivo", "importar_dispositivos",
+)
+
+class TiemposFuncion:
+    """Llamadas, errores y duraciones de una función perfilada.
+
+    El histograma usa cubetas en potencias de 2 de microsegundos (la cubeta k cuenta las duraciones de
+    2^(k-1) a 2^k µs), así que registrar es O(1) y los percentiles se estiman con el límite de su cubeta.
+    """
+    __slots__ = ("llamadas", "errores", "total", "maximo", "histograma", "_candado")
+
+    def __init__(self):
+        self.llamadas = self.errores = 0
+        self.total = self.maximo = 0.0
+        self.histograma = [0] * 64
+        self._candado = threading.Lock() # hacer_ping se llama desde los hilos del barrido
+
+    def registrar(self, duracion, fallo=False):
+        with self._candado:
+            self.llamadas += 1
+            self.errores += fallo
+            self.total += duracion
+            if duracion > self.maximo:
+                self.maximo = duracion
+            self.histograma[min(int(duracion * 1e6).bit_length(), 63)] += 1
+
+    def percentil(self, p):
+        """Estimación en segundos: límite superior de la cubeta donde cae el p% (nunca mayor que el máximo)."""
+        objetivo, acumulado = max(1, -(-p * self.llamadas // 100)), 0
+        for cubeta, cuenta in enumerate(self.histograma):
+            acumulado += cuenta
+            if acumulado >= objetivo:
+                return min((1 << cubeta) / 1e6, self.maximo)
+        return self.maximo
+
+    def como_dict(self):
+        datos = {"LLAMADAS": self.llamadas, "ERRORES": self.errores, "TOTAL_S": round(self.total, 6),
+                 "MEDIA_MS": round(1000 * self.total / self.llamadas, 3) if self.llamadas else None,
+                 "MAXIMO_MS": round(1000 * self.maximo, 3)}
+        datos.update({f"P{p}_MS": round(1000 * self.percentil(p), 3) for p in PERCENTILES_LATENCIA})
+        datos["HISTOGRAMA_US"] = {f"<={1 << cubeta}": cuenta for cubeta, cuenta in enumerate(self.histograma) if cuenta}
+        return datos
+
+_tiempos_funciones = {} # nombre -> TiemposFuncion
+_perfilador = None # cProfile.Profile de la sesión, si se pidió
+_inicio_perfilado = None
+
+def _cronometrar(nombre, funcion):
+    tiempos = _tiempos_funciones.setdefault(nombre, TiemposFuncion())
+    @functools.wraps(funcion)
+    def envoltorio(*args, **kwargs):
+        fallo = False
+        inicio = perf_counter()
+        try:
+            return funcion(*args, **kwargs)
+        except Exception:
+            fallo = True
+            raise
+        finally:
+            tiempos.registrar(perf_counter() - inicio, fallo)
+    envoltorio.perfilada = True
+    return envoltorio
+
+def activar_perfilado(modo=None, ruta_cprofile=None):
+    """Envuelve FUNCIONES_PERFILADAS, arranca cProfile si corresponde y programa el volcado al salir.
+
+    Debe llamarse antes de abrir el repositorio (así la carga y la compactación al salir también se miden).
+    """
+    global PERFILADO, PERFILADO_CPROFILE, _perfilador, _inicio_perfilado
+    if _inicio_perfilado is not None:
+        return
+    PERFILADO = modo or PERFILADO or "tabla"
+    PERFILADO_CPROFILE = ruta_cprofile or PERFILADO_CPROFILE
+    modulo = globals()
+    for nombre in FUNCIONES_PERFILADAS:
+        funcion = modulo.get(nombre)
+        if callable(funcion) and not getattr(funcion, "perfilada", False):
+            modulo[nombre] = _cronometrar(nombre, funcion)
+    if PERFILADO_CPROFILE:
+        import cProfile
+        _perfilador = cProfile.Profile()
+        _perfilador.enable()
+    _inicio_perfilado = perf_counter()
+    atexit.register(volcar_perfilado) # Se registra antes que la compactación al salir, así que corre después
+
+def reporte_perfilado():
+    """{"DURACION_SESION_S", "FUNCIONES": {nombre: tiempos}} con las funciones llamadas, de mayor a menor tiempo total."""
+    funciones = sorted(((nombre, t) for nombre, t in _tiempos_funciones.items() if t.llamadas), key=lambda item: -item[1].total)
+    return {"DURACION_SESION_S": round(perf_counter() - _inicio_perfilado, 6) if _inicio_perfilado is not None else None,
+            "FUNCIONES": {nombre: t.como_dict() for nombre, t in funciones}}
+
+def _imprimir_tabla_perfilado(reporte, salida):
+    columnas_percentiles = "".join(f"{f'P{p} ms':>10}" for p in PERCENTILES_LATENCIA)
+    print(f"\n{Color.BOLD}⏱️ PERFILADO DE LA SESIÓN ({reporte['DURACION_SESION_S']:.3f} s){Color.END}", file=salida)
+    print(f"{Color.BOLD}{'FUNCIÓN':<36}{'LLAMADAS':>9}{'ERRORES':>8}{'TOTAL s':>10}{'MEDIA ms':>10}{columnas_percentiles}{'MÁX ms':>10}{Color.END}", file=salida)
+    print(f"{Color.BLUE}{'─' * (83 + 10 * len(PERCENTILES_LATENCIA))}{Color.END}", file=salida)
+    if not reporte["FUNCIONES"]:
+        print(f"{Color.YELLOW}No se llamó a ninguna función perfilada.{Color.END}", file=salida)
+    for nombre, datos in reporte["FUNCIONES"].items():
+        percentiles = "".join(f"{datos[f'P{p}_MS']:>10.3f}" for p in PERCENTILES_LATENCIA)
+        errores = f"{Color.RED}{datos['ERRORES']:>8}{Color.END}" if datos["ERRORES"] else f"{0:>8}"
+        print(f"{nombre[:35]:<36}{datos['LLAMADAS']:>9}{errores}{datos['TOTAL_S']:>10.3f}{datos['MEDIA_MS']:>10.3f}{percentiles}{datos['MAXIMO_MS']:>10.3f}", file=salida)
+
+def volcar_perfilado():
+    """Detiene cProfile (guardando su volcado) y emite el reporte: tabla en stderr o JSON en NOMBRE_ARCHIVO_PERFIL."""
+    global _perfilador
+    if _perfilador is not None:
+        _perfilador.disable()
+        try:
+            _perfilador.dump_stats(PERFILADO_CPROFILE)
+            print(f"{Color.DARKCYAN}Perfil de cProfile guardado en '{PERFILADO_CPROFILE}' (ver con: python -m pstats {PERFILADO_CPROFILE}).{Color.END}", file=sys.stderr)
+        except OSError as e:
+            print(f"{Color.RED}No se pudo guardar el perfil de cProfile en '{PERFILADO_CPROFILE}': {e}{Color.END}", file=sys.stderr)
+        _perfilador = None
+    reporte = reporte_perfilado()
+    if PERFILADO == "json":
+        try:
+            escribir_archivo_atomico(NOMBRE_ARCHIVO_PERFIL, lambda f: json.dump(reporte, f, ensure_ascii=False, indent=2))
+            print(f"{Color.DARKCYAN}Reporte de perfilado guardado en '{NOMBRE_ARCHIVO_PERFIL}'.{Color.END}", file=sys.stderr)
+        except OSError as e:
+            print(f"{Color.RED}No se pudo guardar el reporte de perfilado en '{NOMBRE_ARCHIVO_PERFIL}': {e}{Color.END}", file=sys.stderr)
+    else:
+        _imprimir_tabla_perfilado(reporte, sys.stderr)
 
-    pop_menu_history()();
+
+def inicializar_repositorio():
+    """Carga los dispositivos en un repositorio indexado y prepara la compactación del diario al salir.
+
+    En modo 'ndjson' devuelve un RepositorioDiferido: no se decodifica nada hasta que se necesita, y el diario
+    se compacta al llegar a COMPACTAR_CADA_N_REGISTROS (no al salir, para que cerrar también sea inmediato).
+    """
+    if MODO_ALMACENAMIENTO == "ndjson":
+        return abrir_inventario_ndjson()
+    dispositivos = RepositorioDispositivos(cargar_dispositivos_desde_archivo())
+    if MODO_ALMACENAMIENTO == "diario":
+        atexit.register(compactar_al_salir, dispositivos) # Al salir se consolida el diario en la instantánea
+    return dispositivos
 
 
 # 🎛️ Función principal y bucle de menú
 def mostrar_menu_principal_opciones(dispositivos_lista):
-    current_menu_func = lambda: mostrar_menu_principal_opciones(dispositivos_lista)
+    """Pantalla raíz: devuelve la pantalla elegida (para que main() la abra) o NAV_SALIR."""
     mostrar_titulo("🚀 SISTEMA DE GESTIÓN DE DISPOSITIVOS DE RED 🚀")
     print(f"{Color.BOLD}{Color.YELLOW}1.{Color.END} 📱 Agregar Nuevo Dispositivo")
     print(f"{Color.BOLD}{Color.YELLOW}2.{Color.END} 📜 Mostrar Todos los Dispositivos")
@@ -1229,78 +4802,403 @@ def mostrar_menu_principal_opciones(dispositivos_lista):
     print(f"{Color.BOLD}{Color.YELLOW}7.{Color.END} 📊 Generar Reporte Estadístico Detallado")
     print(f"{Color.BOLD}{Color.YELLOW}8.{Color.END} 🌐 Probar Conectividad (Ping a Dispositivo)")
     print(f"{Color.BOLD}{Color.YELLOW}9.{Color.END} 📁 Exportar Listado de Dispositivos a Archivo") # Cambiado número
+    print(f"{Color.BOLD}{Color.YELLOW}10.{Color.END} 📥 Importar Dispositivos desde Archivo (CSV / JSON Lines)")
+    print(f"{Color.BOLD}{Color.YELLOW}11.{Color.END} 🔗 Consultas de VLAN")
     print(f"{Color.BOLD}{Color.YELLOW}0.{Color.END} 🚪 Salir del Programa")
 
 
-    opcion_elegida = mostrar_opciones_navegacion(current_menu_func, es_menu_principal=True)
-    if opcion_elegida is None: return
-
-
-    if opcion_elegida == "0": salir_del_programa()
-    elif opcion_elegida == "1": mostrar_barra_progreso(0.5,"Cargando Agregar Dispositivo..."); agregar_dispositivo_interactivo(dispositivos_lista)
-    elif opcion_elegida == "2": mostrar_barra_progreso(0.5,"Cargando Vista de Dispositivos..."); mostrar_dispositivos(dispositivos_lista)
-    elif opcion_elegida == "3": mostrar_barra_progreso(0.5,"Iniciando Búsqueda..."); buscar_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "4": mostrar_barra_progreso(0.5,"Cargando Modificación de Dispositivo..."); modificar_dispositivo_interactivo(dispositivos_lista) # <<< LLAMADA A NUEVA FUNCIÓN
-    elif opcion_elegida == "5": mostrar_barra_progreso(0.5,"Cargando Gestión de Servicios..."); agregar_servicio_a_dispositivo(dispositivos_lista) # Mantiene la función original, aunque redundante
-    elif opcion_elegida == "6": mostrar_barra_progreso(0.5,"Cargando Eliminación de Dispositivo..."); eliminar_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "7": mostrar_barra_progreso(1,"Generando Reporte Estadístico..."); generar_reporte_estadistico(dispositivos_lista)
-    elif opcion_elegida == "8": mostrar_barra_progreso(0.5,"Cargando Herramienta de Ping..."); menu_ping_dispositivo(dispositivos_lista)
-    elif opcion_elegida == "9": mostrar_barra_progreso(0.5,"Exportando Reporte..."); exportar_reporte_a_archivo(dispositivos_lista)
+    opcion_elegida = mostrar_opciones_navegacion(es_menu_principal=True)
+
+    if opcion_elegida in ("0", NAV_SALIR): return NAV_SALIR
+    elif opcion_elegida == "1": mostrar_barra_progreso(0.5,"Cargando Agregar Dispositivo..."); return agregar_dispositivo_interactivo
+    elif opcion_elegida == "2": mostrar_barra_progreso(0.5,"Cargando Vista de Dispositivos..."); return mostrar_dispositivos
+    elif opcion_elegida == "3": mostrar_barra_progreso(0.5,"Iniciando Búsqueda..."); return buscar_dispositivo
+    elif opcion_elegida == "4": mostrar_barra_progreso(0.5,"Cargando Modificación de Dispositivo..."); return modificar_dispositivo_interactivo # <<< LLAMADA A NUEVA FUNCIÓN
+    elif opcion_elegida == "5": mostrar_barra_progreso(0.5,"Cargando Gestión de Servicios..."); return agregar_servicio_a_dispositivo # Mantiene la función original, aunque redundante
+    elif opcion_elegida == "6": mostrar_barra_progreso(0.5,"Cargando Eliminación de Dispositivo..."); return eliminar_dispositivo
+    elif opcion_elegida == "7": mostrar_barra_progreso(1,"Generando Reporte Estadístico..."); return generar_reporte_estadistico
+    elif opcion_elegida == "8": mostrar_barra_progreso(0.5,"Cargando Herramienta de Ping..."); return menu_ping_dispositivo
+    elif opcion_elegida == "9": mostrar_barra_progreso(0.5,"Exportando Reporte..."); return exportar_reporte_a_archivo
+    elif opcion_elegida == "10": mostrar_barra_progreso(0.5,"Cargando Importación..."); return importar_dispositivos_interactivo
+    elif opcion_elegida == "11": mostrar_barra_progreso(0.5,"Cargando Consultas de VLAN..."); return menu_consultas_vlan
     else:
-        mostrar_mensaje(f"Opción '{opcion_elegida}' no válida. Seleccione entre 0-9 o una opción de navegación.", "error"); sleep(2)
-        # No es necesario llamar recursivamente aquí, el bucle en main se encargará.
-        # mostrar_menu_principal_opciones(dispositivos_lista) # Evitar recursión directa
+        mostrar_mensaje(f"Opción '{opcion_elegida}' no válida. Seleccione entre 0-11 o una opción de navegación.", "error"); pausa(2)
 
 def main():
     global menu_history
     # dispositivos = [] # <<< MODIFICADO: Cargar desde archivo
-    dispositivos = cargar_dispositivos_desde_archivo() # <<< MODIFICADO
-    sleep(1) # Pausa para ver mensaje de carga de datos
-
     limpiar_pantalla()
     print(f"\n{Color.BLUE}{'═' * 70}{Color.END}")
     print(f"{Color.BOLD}{Color.PURPLE}{'🛡️ BIENVENIDO AL SISTEMA AVANZADO DE GESTIÓN DE REDES 🛡️'.center(70)}{Color.END}")
     print(f"{Color.BLUE}{'═' * 70}{Color.END}")
-    mostrar_barra_progreso(1.5, "Iniciando el sistema de gestión...", sufijo="¡Sistema listo para operar!")
+    dispositivos = inicializar_repositorio() # <<< MODIFICADO: índices por nombre, IP, tipo, capa y VLAN (en modo 'ndjson', carga perezosa)
+    mostrar_barra_progreso(0, "Iniciando el sistema de gestión...", sufijo="¡Sistema listo para operar!") # Sin esperas fijas: dura lo que dura la carga
 
     if not iniciar_sesion():
         return
 
-    menu_principal_lambda = lambda: mostrar_menu_principal_opciones(dispositivos)
-    menu_history = [menu_principal_lambda]
+    menu_history = [mostrar_menu_principal_opciones]
 
-    while True:
-        if menu_history:
-            menu_actual = menu_history[-1]
+    while True: # Único bucle de navegación: cada pantalla retorna antes de abrir la siguiente
+        pantalla = menu_history[-1]
+        try:
+            accion = pantalla(dispositivos)
+        except Exception as e_menu: # Captura errores dentro de una función de menú
+            mostrar_mensaje(f"Error inesperado en la función del menú: {e_menu}", "error", esperar_enter=True)
+            import traceback
+            with open("error_log_menu.txt", "a", encoding='utf-8') as f_error_menu:
+                f_error_menu.write(f"\n--- Error en Menú: {datetime.now()} ---\n")
+                f_error_menu.write(f"Menu function: {getattr(pantalla, '__name__', 'desconocida')}\n")
+                traceback.print_exc(file=f_error_menu)
+            accion = NAV_PRINCIPAL # Volver al menú principal en caso de error grave en un submenú
+
+        if callable(accion):
+            menu_history.append(accion)
+        elif accion == NAV_SALIR:
+            salir_del_programa() # Si se cancela, se vuelve a mostrar la pantalla actual
+        elif accion == NAV_REPETIR:
+            continue
+        elif accion == NAV_PRINCIPAL:
+            if len(menu_history) > 1:
+                del menu_history[1:]
+                mostrar_barra_progreso(0.5, "Volviendo al Menú Principal...")
+        elif len(menu_history) > 1: # None o NAV_VOLVER
+            menu_history.pop()
+            if accion == NAV_VOLVER:
+                mostrar_barra_progreso(0.5, "Volviendo...")
+
+
+# ---------------- INTERFAZ DE LÍNEA DE COMANDOS (MODO BATCH) ----------------
+def _imprimir_json(datos):
+    print(json.dumps(datos, ensure_ascii=False, indent=2, default=serializar_dispositivo))
+
+def _filtrar_para_cli(dispositivos_lista, args):
+    """Aplica los filtros --tipo, --capa, --vlan, --nombre y --consulta (combinados con AND) usando los índices."""
+    candidatos = None
+    if getattr(args, "consulta", None):
+        candidatos = consultar_dispositivos(dispositivos_lista, args.consulta)
+    if getattr(args, "tipo", None):
+        por_tipo = dispositivos_lista.por_tipo(normalizar_opcion(args.tipo, TIPOS_DISPOSITIVO, "Tipo"))
+        ids_tipo = {id(d) for d in por_tipo}
+        candidatos = por_tipo if candidatos is None else [d for d in candidatos if id(d) in ids_tipo]
+    if getattr(args, "capa", None):
+        por_capa = dispositivos_lista.por_ubicacion(normalizar_opcion(args.capa, CAPAS_RED, "Capa"))
+        ids_capa = {id(d) for d in por_capa}
+        candidatos = por_capa if candidatos is None else [d for d in candidatos if id(d) in ids_capa]
+    if getattr(args, "vlan", None):
+        por_vlan = dispositivos_lista.por_vlans(mascara_de_vlans(validar_vlans_input(args.vlan, avisar_duplicados=False)))
+        ids_vlan = {id(d) for d in por_vlan}
+        candidatos = por_vlan if candidatos is None else [d for d in candidatos if id(d) in ids_vlan]
+    if candidatos is None:
+        candidatos = list(dispositivos_lista)
+    if getattr(args, "nombre", None):
+        ids_nombre = {id(d) for d in dispositivos_lista.nombres_que_contienen(args.nombre)}
+        candidatos = [d for d in candidatos if id(d) in ids_nombre]
+    return candidatos
+
+def _cli_add(dispositivos_lista, args):
+    vlans = validar_vlans_input(args.vlans or "")
+    disp = construir_dispositivo(normalizar_opcion(args.tipo, TIPOS_DISPOSITIVO, "Tipo"), args.nombre.strip(), args.ip or "N/A",
+                                 normalizar_opcion(args.capa, CAPAS_RED, "Capa"), normalizar_servicios(args.servicios), vlans)
+    dispositivos_lista.agregar(disp)
+    guardar_dispositivos_en_archivo(dispositivos_lista)
+    return {"ok": True, "dispositivo": disp}
+
+def _cli_bulk_import(dispositivos_lista, args):
+    resumen = importar_dispositivos(dispositivos_lista, args.archivo, args.formato, args.rechazos, args.lote)
+    return dict(resumen, ok=not resumen["rechazados"])
+
+def _cli_import_legacy(dispositivos_lista, args):
+    resumen = importar_inventario_legado(dispositivos_lista, args.archivos, args.rechazos)
+    return dict(resumen, ok=not resumen["rechazados"])
+
+def _cli_subnet(dispositivos_lista, args):
+    resumen = dispositivos_lista.resumen_red(args.red)
+    return dict(resumen, ok=True, siguiente_libre=dispositivos_lista.siguiente_ip_libre(args.red),
+                ips_libres=dispositivos_lista.ips_libres(args.red, args.libres),
+                dispositivos=dispositivos_lista.en_red(args.red))
+
+def _cli_vlans(dispositivos_lista, args):
+    """Sin opciones, VLANs en uso por los dispositivos filtrados; --compartidas A B o --exclusivas para esas consultas."""
+    if args.compartidas:
+        disp_a, disp_b = (_buscar_o_error(dispositivos_lista, nombre) for nombre in args.compartidas)
+        compartidas, solo_primero, solo_segundo = vlans_compartidas(disp_a, disp_b)
+        return {"ok": True, "dispositivos": [disp_a.get("NOMBRE"), disp_b.get("NOMBRE")],
+                "compartidas": compartidas, "rangos": formatear_vlans(compartidas),
+                "solo_primero": solo_primero, "solo_segundo": solo_segundo}
+    candidatos = _filtrar_para_cli(dispositivos_lista, args)
+    if args.exclusivas:
+        exclusivas = dispositivos_lista.vlans_exclusivas(candidatos)
+        return {"ok": True, "revisados": len(candidatos),
+                "exclusivas": [{"NOMBRE": disp.get("NOMBRE"), "VLANS": vlans, "RANGOS": formatear_vlans(vlans)} for disp, vlans in exclusivas]}
+    mascara = 0
+    for disp in candidatos:
+        mascara |= disp.mascara_vlans()
+    vlans = vlans_de_mascara(mascara)
+    return {"ok": True, "revisados": len(candidatos), "total": len(vlans), "vlans": vlans, "rangos": formatear_vlans(vlans)}
+
+def _cli_ip_check(dispositivos_lista, args):
+    """Sin archivo revisa el inventario; con archivo revisa ese lote (CSV/JSONL) contra el inventario, sin importar."""
+    if not args.archivo:
+        conflictos = detectar_conflictos_ip(dispositivos_lista)
+        return {"ok": not conflictos, "revisados": len(dispositivos_lista), "conflictos": conflictos}
+    formato = args.formato or ("csv" if args.archivo.lower().endswith(".csv") else "jsonl")
+    lote, invalidos = [], 0
+    with open(args.archivo, 'r', encoding='utf-8-sig', newline='') as archivo:
+        for _, registro in _leer_registros_importacion(archivo, formato):
             try:
-                menu_actual()
-            except Exception as e_menu: # Captura errores dentro de una función de menú
-                mostrar_mensaje(f"Error inesperado en la función del menú: {e_menu}", "error", esperar_enter=True)
-                import traceback
-                with open("error_log_menu.txt", "a", encoding='utf-8') as f_error_menu:
-                    f_error_menu.write(f"\n--- Error en Menú: {datetime.now()} ---\n")
-                    f_error_menu.write(f"Menu function: {menu_actual.__name__ if hasattr(menu_actual, '__name__') else 'lambda'}\n")
-                    traceback.print_exc(file=f_error_menu)
-                # Volver al menú principal en caso de error grave en un submenú
-                if menu_actual is not menu_principal_lambda: # Evitar bucle si el error es en el principal
-                    ir_a_menu_principal()
-                else: # Si el error es en el propio menú principal, intentar recargarlo
-                     menu_principal_lambda()
-
-
-        else: # Esto no debería ocurrir con la lógica actual
-            mostrar_mensaje("Error crítico de navegación: historial de menú vacío. Reiniciando al menú principal.", "error", True)
-            menu_history = [menu_principal_lambda]
-            menu_principal_lambda()
+                if isinstance(registro, Exception):
+                    raise registro
+                lote.append(dispositivo_desde_registro(registro))
+            except (ValueError, TypeError):
+                invalidos += 1 # Los errores de cada fila los informa bulk-import; aquí solo interesan las IPs
+    conflictos = detectar_conflictos_ip(lote, dispositivos_lista)
+    return {"ok": not conflictos, "revisados": len(lote), "invalidos": invalidos, "conflictos": conflictos}
+
+def _cli_monitor(dispositivos_lista, args):
+    """Monitor en primer plano: una línea JSON por cada cambio de estado hasta --duracion segundos o Ctrl+C."""
+    nombres = {d.get("IP"): d.get("NOMBRE") for d in dispositivos_lista if d.get("IP") and d.get("IP") != "N/A"}
+    def al_cambiar(estado):
+        print(json.dumps(dict(estado.como_dict(), NOMBRE=nombres.get(estado.ip)), ensure_ascii=False), flush=True)
+    monitor = iniciar_monitor(dispositivos_lista, args.intervalo, args.concurrencia, args.motor, al_cambiar)
+    try:
+        threading.Event().wait(args.duracion or None)
+    except KeyboardInterrupt:
+        pass
+    monitor.detener()
+    return dict(monitor.resumen(), ok=True)
+
+def _cli_latency(dispositivos_lista, args):
+    reporte = reporte_latencias(dispositivos_lista, args.horas, args.por)
+    return {"ok": True, "horas": args.horas, "por": args.por, "activo": HISTORIAL_ACTIVO, "grupos": reporte}
+
+def _cli_list(dispositivos_lista, args):
+    encontrados = _filtrar_para_cli(dispositivos_lista, args)
+    return {"ok": True, "total": len(encontrados), "dispositivos": encontrados}
+
+def _cli_search(dispositivos_lista, args):
+    encontrados = buscar_dispositivos_por_nombre(dispositivos_lista, args.texto)
+    return {"ok": True, "total": len(encontrados), "dispositivos": encontrados}
+
+def _buscar_o_error(dispositivos_lista, nombre):
+    disp = dispositivos_lista.buscar_por_nombre(nombre)
+    if disp is None:
+        raise ValueError(f"No existe un dispositivo llamado '{nombre}'.")
+    return disp
+
+def _cli_modify(dispositivos_lista, args):
+    disp = _buscar_o_error(dispositivos_lista, args.nombre_actual)
+    cambios = {}
+    if args.nombre is not None:
+        validar_nombre(args.nombre.strip()); cambios["NOMBRE"] = args.nombre.strip()
+    if args.ip is not None:
+        validar_ip(args.ip); cambios["IP"] = args.ip or "N/A"
+    if args.tipo is not None:
+        cambios["TIPO"] = normalizar_opcion(args.tipo, TIPOS_DISPOSITIVO, "Tipo")
+    if args.capa is not None:
+        cambios["UBICACION"] = normalizar_opcion(args.capa, CAPAS_RED, "Capa") or "N/A"
+    if args.servicios is not None:
+        cambios["SERVICIOS"] = normalizar_servicios(args.servicios)
+    if args.vlans is not None:
+        cambios["VLANS"] = validar_vlans_input(args.vlans)
+    if cambios:
+        dispositivos_lista.actualizar(disp, **cambios)
+        guardar_dispositivos_en_archivo(dispositivos_lista)
+    return {"ok": True, "modificado": bool(cambios), "dispositivo": disp}
+
+def _cli_delete(dispositivos_lista, args):
+    disp = _buscar_o_error(dispositivos_lista, args.nombre)
+    dispositivos_lista.eliminar(disp)
+    guardar_dispositivos_en_archivo(dispositivos_lista)
+    return {"ok": True, "eliminado": disp}
+
+def _cli_stats(dispositivos_lista, args):
+    resultado = {"ok": True, "estadisticas": calcular_estadisticas(dispositivos_lista)}
+    if args.verificar:
+        diferencias = dispositivos_lista.verificar_estadisticas(reparar=True)
+        resultado["verificacion"] = {"diferencias": diferencias, "reconstruidas": bool(diferencias)}
+        if MODO_ALMACENAMIENTO == "sqlite": # También se contrasta con los GROUP BY de la base
+            en_base = obtener_almacen_sqlite().estadisticas()
+            resultado["verificacion"]["diferencias_base_datos"] = [
+                clave for clave, valor in dispositivos_lista.estadisticas.como_dict().items() if en_base[clave] != valor]
+        resultado["estadisticas"] = calcular_estadisticas(dispositivos_lista)
+    return resultado
+
+def _cli_export(dispositivos_lista, args):
+    filtrado = any(getattr(args, campo, None) for campo in ("tipo", "capa", "vlan", "nombre", "consulta"))
+    objetivos = _filtrar_para_cli(dispositivos_lista, args) if filtrado else dispositivos_lista # Sin filtros no se copia la lista
+    archivo = escribir_reporte_dispositivos(objetivos, args.directorio, args.formato, args.gzip)
+    return {"ok": True, "total": len(objetivos), "formato": args.formato, "archivo": archivo}
+
+def _cli_ping_sweep(dispositivos_lista, args):
+    objetivos = _filtrar_para_cli(dispositivos_lista, args)
+    resultados = []
+    for disp, resultado in barrido_ping(objetivos, args.concurrencia, args.conteo, args.timeout, args.motor):
+        resultado = dict(resultado, NOMBRE=disp.get("NOMBRE"))
+        resultados.append(resultado)
+        if args.stream: # Una línea JSON por host a medida que termina
+            print(json.dumps(resultado, ensure_ascii=False), flush=True)
+    alcanzables = sum(1 for r in resultados if r["ALCANZABLE"])
+    resumen = {"ok": True, "total": len(resultados), "alcanzables": alcanzables, "inalcanzables": len(resultados) - alcanzables}
+    if not args.stream:
+        resumen["resultados"] = sorted(resultados, key=lambda r: r["NOMBRE"].lower())
+    return resumen
+
+def _entero_entre(minimo, maximo):
+    """Tipo de argparse: entero dentro de [minimo, maximo]."""
+    def convertir(texto):
+        try:
+            valor = int(texto)
+        except ValueError:
+            raise argparse.ArgumentTypeError(f"'{texto}' no es un número entero.") from None
+        if not minimo <= valor <= maximo:
+            raise argparse.ArgumentTypeError(f"debe estar entre {minimo} y {maximo}.")
+        return valor
+    return convertir
+
+def _crear_parser_cli():
+    parser = argparse.ArgumentParser(prog="P-1.py", description="Gestión de dispositivos de red en modo batch (salida JSON).")
+    parser.add_argument("--almacenamiento", choices=["json", "diario", "sqlite", "ndjson"], help="Modo de almacenamiento (por defecto P1_ALMACENAMIENTO o 'json').")
+    sub = parser.add_subparsers(dest="comando", required=True)
+
+    def agregar_filtros(p):
+        p.add_argument("--tipo", help="Filtrar por tipo (PC, SERVIDOR, ROUTER, SWITCH, FIREWALL, IMPRESORA).")
+        p.add_argument("--capa", help="Filtrar por ubicación/capa (NUCLEO, DISTRIBUCION, ACCESO, N/A).")
+        p.add_argument("--vlan", help="Filtrar por VLAN o rango de VLANs, p. ej. 20, 10-200 o 10,30-40.")
+        p.add_argument("--nombre", help="Filtrar por nombre (o parte del nombre).")
+        p.add_argument("--consulta", "-q", help="Consulta multicampo, p. ej. 'tipo:switch AND (vlan:10 OR ip:10.0.0.0/8)'.")
+
+    p = sub.add_parser("add", help="Agregar un dispositivo.")
+    p.add_argument("--tipo", required=True)
+    p.add_argument("--nombre", required=True)
+    p.add_argument("--ip")
+    p.add_argument("--capa")
+    p.add_argument("--servicios", help="Claves separadas por coma, p. ej. DNS,VPN.")
+    p.add_argument("--vlans", help="VLANs separadas por coma, con rangos, p. ej. 10,20,30-40.")
+    p.set_defaults(funcion=_cli_add)
+
+    p = sub.add_parser("bulk-import", help="Importar dispositivos desde CSV o JSON Lines (validación fila a fila).")
+    p.add_argument("archivo")
+    p.add_argument("--formato", choices=["csv", "jsonl"], help="Por defecto se deduce de la extensión.")
+    p.add_argument("--rechazos", help="Archivo para las filas rechazadas (por defecto <archivo>.rechazos.<ext>).")
+    p.add_argument("--lote", type=int, default=TAMANO_LOTE_IMPORTACION, help="Tamaño de lote al incorporar filas válidas.")
+    p.set_defaults(funcion=_cli_bulk_import)
+
+    p = sub.add_parser("import-legacy", help="Importar inventarios de texto antiguos (zona core.txt, campus uno.txt, ...).")
+    p.add_argument("archivos", nargs="+")
+    p.add_argument("--rechazos", default="inventario_legado.rechazos.jsonl", help="Archivo JSON Lines para los bloques rechazados.")
+    p.set_defaults(funcion=_cli_import_legacy)
+
+    p = sub.add_parser("subnet", help="Dispositivos, uso e IPs libres de una red.")
+    p.add_argument("red", help="Red en notación CIDR, p. ej. 192.172.10.0/24.")
+    p.add_argument("--libres", type=int, default=10, help="Cuántas IPs libres listar (por defecto 10).")
+    p.set_defaults(funcion=_cli_subnet)
+
+    p = sub.add_parser("vlans", help="VLANs en uso, compartidas entre dos dispositivos o configuradas en uno solo.")
+    agregar_filtros(p)
+    p.add_argument("--compartidas", nargs=2, metavar=("DISPOSITIVO1", "DISPOSITIVO2"), help="VLANs presentes en ambos dispositivos.")
+    p.add_argument("--exclusivas", action="store_true", help="VLANs configuradas en un solo dispositivo (de los filtrados).")
+    p.set_defaults(funcion=_cli_vlans)
+
+    p = sub.add_parser("ip-check", help="Buscar IPs duplicadas en el inventario o en un archivo antes de importarlo.")
+    p.add_argument("archivo", nargs="?")
+    p.add_argument("--formato", choices=["csv", "jsonl"])
+    p.set_defaults(funcion=_cli_ip_check)
+
+    p = sub.add_parser("monitor", help="Sondear periódicamente todas las IPs e informar los cambios de estado (JSON Lines).")
+    p.add_argument("--intervalo", type=_entero_entre(MONITOR_INTERVALO_MINIMO, MONITOR_INTERVALO_MAXIMO), default=MONITOR_INTERVALO_PREDETERMINADO,
+                   help=f"Segundos entre sondeos de un host que responde ({MONITOR_INTERVALO_MINIMO}-{MONITOR_INTERVALO_MAXIMO}).")
+    p.add_argument("--duracion", type=float, default=0, help="Segundos que corre el monitor (0 = hasta Ctrl+C).")
+    p.add_argument("--concurrencia", type=int, default=PING_CONCURRENCIA_PREDETERMINADA)
+    p.add_argument("--motor", choices=["auto"] + list(MOTORES_SONDEO), default=None)
+    p.set_defaults(funcion=_cli_monitor)
+
+    p = sub.add_parser("latency", help="Percentiles de RTT (p50/p95/p99) y pérdida según el historial de sondeos.")
+    p.add_argument("--horas", type=float, default=24, help="Ventana hacia atrás, en horas.")
+    p.add_argument("--por", choices=list(AGRUPACIONES_LATENCIA), default="dispositivo")
+    p.set_defaults(funcion=_cli_latency)
+
+    p = sub.add_parser("list", help="Listar dispositivos.")
+    agregar_filtros(p)
+    p.set_defaults(funcion=_cli_list)
+
+    p = sub.add_parser("search", help="Buscar dispositivos por nombre.")
+    p.add_argument("texto")
+    p.set_defaults(funcion=_cli_search)
+
+    p = sub.add_parser("modify", help="Modificar un dispositivo (un valor vacío borra IP, capa, servicios o VLANs).")
+    p.add_argument("nombre_actual")
+    p.add_argument("--nombre")
+    p.add_argument("--ip")
+    p.add_argument("--tipo")
+    p.add_argument("--capa")
+    p.add_argument("--servicios")
+    p.add_argument("--vlans")
+    p.set_defaults(funcion=_cli_modify)
+
+    p = sub.add_parser("delete", help="Eliminar un dispositivo.")
+    p.add_argument("nombre")
+    p.set_defaults(funcion=_cli_delete)
+
+    p = sub.add_parser("stats", help="Estadísticas del inventario.")
+    p.add_argument("--verificar", action="store_true", help="Recontar desde cero y reconstruir los contadores si no coinciden.")
+    p.set_defaults(funcion=_cli_stats)
+
+    p = sub.add_parser("export", help="Exportar el reporte (txt, csv, jsonl o md), opcionalmente comprimido.")
+    p.add_argument("--directorio", default="reportes")
+    p.add_argument("--formato", choices=list(FORMATOS_EXPORTACION), default="txt")
+    p.add_argument("--gzip", action="store_true", help="Comprimir la salida (.gz).")
+    agregar_filtros(p)
+    p.set_defaults(funcion=_cli_export)
+
+    p = sub.add_parser("ping-sweep", help="Ping concurrente a todos los dispositivos (o a los filtrados).")
+    agregar_filtros(p)
+    p.add_argument("--concurrencia", type=int, default=PING_CONCURRENCIA_PREDETERMINADA)
+    p.add_argument("--conteo", type=int, default=PING_CONTEO_PREDETERMINADO)
+    p.add_argument("--timeout", type=int, default=PING_TIMEOUT_PREDETERMINADO)
+    p.add_argument("--motor", choices=["auto"] + list(MOTORES_SONDEO))
+    p.add_argument("--stream", action="store_true", help="Emitir una línea JSON por host a medida que termina.")
+    p.set_defaults(funcion=_cli_ping_sweep)
+    return parser
+
+def main_cli(argumentos):
+    """Punto de entrada sin menús: ejecuta un subcomando y escribe el resultado en JSON. Devuelve el código de salida."""
+    global MODO_CLI, MODO_ALMACENAMIENTO, current_user
+    MODO_CLI = True
+    args = _crear_parser_cli().parse_args(argumentos)
+    if args.almacenamiento:
+        MODO_ALMACENAMIENTO = args.almacenamiento
+    try:
+        current_user = getpass.getuser()
+    except Exception:
+        current_user = "cli"
+
+    dispositivos = inicializar_repositorio()
+    try:
+        resultado = args.funcion(dispositivos, args)
+    except (ValueError, OSError) as e:
+        resultado = {"ok": False, "error": str(e)}
+    _imprimir_json(resultado)
+    return 0 if resultado.get("ok") else 1
 
 
 if __name__ == "__main__":
+    if "--rapido" in sys.argv:
+        sys.argv.remove("--rapido")
+        MODO_RAPIDO = True
+    if "--perfilar" in sys.argv:
+        sys.argv.remove("--perfilar")
+        PERFILADO = PERFILADO or "tabla"
+    if PERFILADO or PERFILADO_CPROFILE:
+        activar_perfilado()
+    if len(sys.argv) > 1:
+        sys.exit(main_cli(sys.argv[1:]))
     try:
         main()
     except KeyboardInterrupt:
         limpiar_pantalla()
         print(f"\n{Color.YELLOW}Interrupción por teclado detectada. Cerrando el programa...{Color.END}")
-        sleep(1)
+        pausa(1)
         mostrar_barra_progreso(0.5, "Finalizando...", sufijo="¡Programa cerrado de forma segura!")
         limpiar_pantalla()
         sys.exit(0)
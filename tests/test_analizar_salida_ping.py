@@ -0,0 +1,79 @@
+"""Pruebas de analizar_salida_ping con salidas reales de ping (iputils, BusyBox y Windows) guardadas en salidas_ping/."""
+import importlib.util
+import os
+
+import pytest
+
+DIRECTORIO = os.path.dirname(os.path.abspath(__file__))
+
+_spec = importlib.util.spec_from_file_location("p1", os.path.join(DIRECTORIO, os.pardir, "P-1.py"))
+p1 = importlib.util.module_from_spec(_spec)
+_spec.loader.exec_module(p1)
+
+
+def analizar(nombre_archivo):
+    with open(os.path.join(DIRECTORIO, "salidas_ping", nombre_archivo), encoding="utf-8") as f:
+        return p1.analizar_salida_ping(f.read())
+
+
+def test_iputils_sin_perdida():
+    m = analizar("iputils_ok.txt")
+    assert (m.formato, m.enviados, m.recibidos, m.perdida) == ("iputils", 3, 3, 0.0)
+    assert m.rtts == (0.412, 0.388, 0.401)
+    assert (m.rtt_min, m.rtt_prom, m.rtt_max, m.rtt_mdev) == (0.388, 0.400, 0.412, 0.009)
+    assert (m.errores, m.duplicados) == (0, 0)
+
+
+def test_iputils_con_perdida():
+    m = analizar("iputils_perdida.txt")
+    assert (m.enviados, m.recibidos, m.perdida) == (4, 2, 50.0)
+    assert m.rtts == (12.3, 14.1)
+
+
+def test_iputils_inalcanzable():
+    m = analizar("iputils_inalcanzable.txt")
+    assert (m.enviados, m.recibidos, m.perdida, m.errores) == (3, 0, 100.0, 3)
+    assert m.rtts == ()
+    assert m.rtt_prom is None
+
+
+def test_iputils_duplicados_no_cuentan_como_recibidos():
+    m = analizar("iputils_duplicados.txt")
+    assert (m.enviados, m.recibidos, m.duplicados, m.perdida) == (2, 2, 1, 0.0)
+    assert m.rtts == (0.501, 0.499) # La respuesta (DUP!) no se suma a las latencias
+
+
+def test_busybox_sin_perdida():
+    m = analizar("busybox_ok.txt")
+    assert (m.formato, m.enviados, m.recibidos, m.perdida) == ("busybox", 3, 3, 0.0)
+    assert (m.rtt_min, m.rtt_prom, m.rtt_max) == (0.100, 0.125, 0.150)
+    assert m.rtt_mdev == pytest.approx(0.02, abs=0.001) # BusyBox no la imprime: se calcula de las respuestas
+
+
+def test_busybox_perdida_total():
+    m = analizar("busybox_perdida.txt")
+    assert (m.formato, m.enviados, m.recibidos, m.perdida) == ("busybox", 3, 0, 100.0)
+    assert m.rtt_min is None
+
+
+def test_windows_ingles():
+    m = analizar("windows_en.txt")
+    assert (m.formato, m.enviados, m.recibidos, m.perdida) == ("windows", 4, 3, 25.0)
+    assert m.rtts == (3.0, 1.0, 5.0) # 'time<1ms' se registra como 1 ms
+    assert (m.rtt_min, m.rtt_prom, m.rtt_max) == (1.0, 3.0, 5.0)
+
+
+def test_windows_espanol_respuestas_de_menos_de_un_milisegundo():
+    m = analizar("windows_es_submilisegundo.txt")
+    assert (m.formato, m.enviados, m.recibidos, m.perdida) == ("windows", 2, 2, 0.0)
+    assert m.rtts == (1.0, 1.0) # 'tiempo<1m'
+
+
+def test_windows_espanol_host_inaccesible_no_cuenta_como_recibido():
+    m = analizar("windows_es_inalcanzable.txt")
+    assert (m.enviados, m.recibidos, m.perdida, m.errores) == (2, 0, 100.0, 2)
+
+
+@pytest.mark.parametrize("nombre_archivo", ["desconocido.txt", "truncado.txt"])
+def test_salida_no_reconocida(nombre_archivo):
+    assert analizar(nombre_archivo) is None